@@ -0,0 +1,335 @@
+import os
+import time
+import logging
+import threading
+
+from stress_stats import STRESS_EWMA_ALPHA, HIGH_STRESS_THRESHOLD
+from shared_state import SHARED_STATE_PATH, open_state_db, transaction
+
+logger = logging.getLogger(__name__)
+
+# A user is alerted when the moving average of their scores reaches the trigger
+# score, and re-armed only once it falls below the clear score (hysteresis)
+ALERT_TRIGGER_SCORE = float(os.environ.get('ALERT_TRIGGER_SCORE', HIGH_STRESS_THRESHOLD))
+ALERT_CLEAR_SCORE = float(os.environ.get('ALERT_CLEAR_SCORE', 70))
+ALERT_EWMA_ALPHA = float(os.environ.get('ALERT_EWMA_ALPHA', STRESS_EWMA_ALPHA))
+# Shortest time between two immediate alerts to the same user (seconds)
+ALERT_COOLDOWN = float(os.environ.get('ALERT_COOLDOWN', 1800))
+# Alerts held back by the cooldown or hysteresis go out in a digest at most this often per user
+ALERT_DIGEST_INTERVAL = float(os.environ.get('ALERT_DIGEST_INTERVAL', 3600))
+# Admins get a summary of high-stress users this often (0 disables it)
+ALERT_ADMIN_DIGEST_INTERVAL = float(os.environ.get('ALERT_ADMIN_DIGEST_INTERVAL', 86400))
+
+
+class UserAlertState:
+    """Alert state of one user: 'clear' (armed) or 'alerting'"""
+
+    __slots__ = ('state', 'ewma', 'last_alert', 'last_digest', 'held', 'peak', 'last_seen')
+
+    def __init__(self):
+        self.state = 'clear'
+        self.ewma = None
+        self.last_alert = None
+        self.last_digest = None
+        # High readings since the last email, not yet reported
+        self.held = 0
+        self.peak = 0.0
+        self.last_seen = 0.0
+
+    @classmethod
+    def from_row(cls, row):
+        state = cls()
+        (state.state, state.ewma, state.last_alert, state.last_digest,
+         state.held, state.peak, state.last_seen) = row
+        return state
+
+    def to_row(self):
+        return (self.state, self.ewma, self.last_alert, self.last_digest, self.held, self.peak, self.last_seen)
+
+
+class AlertManager:
+    """Turns a stream of stress scores into a few alert emails per user
+
+    observe() feeds each new score into the user's moving average. When the
+    average crosses the trigger score the user moves to 'alerting' and gets
+    one immediate alert, unless one went out within the cooldown. Further
+    high readings, and explicit notify() requests, are only counted; a
+    background thread mails each user with held readings a digest at most
+    once per digest interval, and mails admins a periodic summary of
+    high-stress users. The user is re-armed once the average falls below the
+    clear score.
+
+    State is kept in the shared state file and updated in transactions, so
+    every worker process sees the same cooldowns and digests, and a restart
+    forgets none of them. Times are wall-clock seconds.
+    """
+
+    def __init__(self, send_email, get_user, get_high_stress_users, get_admins,
+                 trigger=ALERT_TRIGGER_SCORE, clear=ALERT_CLEAR_SCORE, alpha=ALERT_EWMA_ALPHA,
+                 cooldown=ALERT_COOLDOWN, digest_interval=ALERT_DIGEST_INTERVAL,
+                 admin_digest_interval=ALERT_ADMIN_DIGEST_INTERVAL, path=SHARED_STATE_PATH):
+        self.send_email = send_email
+        self.get_user = get_user
+        self.get_high_stress_users = get_high_stress_users
+        self.get_admins = get_admins
+        self.trigger = trigger
+        self.clear = min(clear, trigger)
+        self.alpha = alpha
+        self.cooldown = cooldown
+        self.digest_interval = digest_interval
+        self.admin_digest_interval = admin_digest_interval
+
+        self._lock = threading.Lock()
+        self._db = open_state_db(path)
+        self._create_tables()
+        self._stop = threading.Event()
+
+        self._observed = 0
+        self._alerts = 0
+        self._held = 0
+        self._cleared = 0
+        self._digests = 0
+        self._admin_digests = 0
+
+        self._thread = threading.Thread(target=self._run, name='alert-digests', daemon=True)
+        self._thread.start()
+
+    def _create_tables(self):
+        with self._lock:
+            self._db.execute("""
+            CREATE TABLE IF NOT EXISTS alert_states (
+                user_id TEXT PRIMARY KEY,
+                state TEXT NOT NULL,
+                ewma REAL,
+                last_alert REAL,
+                last_digest REAL,
+                held INTEGER NOT NULL,
+                peak REAL NOT NULL,
+                last_seen REAL NOT NULL
+            )
+            """)
+            # When the admin digest last went out, and the alerts and held readings since then
+            self._db.execute("CREATE TABLE IF NOT EXISTS alert_meta (name TEXT PRIMARY KEY, value REAL NOT NULL)")
+            self._db.executemany(
+                "INSERT OR IGNORE INTO alert_meta (name, value) VALUES (?, ?)",
+                [('last_admin_digest', time.time()), ('period_alerts', 0), ('period_held', 0)]
+            )
+
+    def observe(self, user_id, score, now=None):
+        """Fold a new stress score into the user's state; returns 'alerted', 'held' or None"""
+        if score is None:
+            return None
+        now = time.time() if now is None else now
+        score = float(score)
+        with self._lock, transaction(self._db):
+            self._observed += 1
+            state = self._state(user_id, now)
+            state.ewma = score if state.ewma is None else state.ewma + self.alpha * (score - state.ewma)
+            outcome = self._advance(state, score, now)
+            self._save(user_id, state)
+            ewma = state.ewma
+
+        if outcome == 'alerted':
+            self._send_alert(user_id, score, ewma)
+        return outcome
+
+    def notify(self, user_id, score=None, now=None):
+        """Explicit request to alert a user; sent only outside the cooldown, otherwise held for the digest"""
+        now = time.time() if now is None else now
+        with self._lock, transaction(self._db):
+            state = self._state(user_id, now)
+            if not self._cooled_down(state, now):
+                outcome = self._hold(state, score if score is not None else state.ewma or 0.0)
+            else:
+                outcome = self._alert(state, now)
+            self._save(user_id, state)
+            ewma = state.ewma
+
+        if outcome == 'alerted':
+            self._send_alert(user_id, score, ewma)
+        return outcome
+
+    def _advance(self, state, score, now):
+        if state.state == 'alerting':
+            if state.ewma < self.clear:
+                state.state = 'clear'
+                self._cleared += 1
+                return None
+            if score >= self.trigger:
+                return self._hold(state, score)
+            return None
+
+        if state.ewma < self.trigger:
+            return None
+        state.state = 'alerting'
+        if not self._cooled_down(state, now):
+            return self._hold(state, score)
+        return self._alert(state, now)
+
+    def _state(self, user_id, now):
+        row = self._db.execute(
+            "SELECT state, ewma, last_alert, last_digest, held, peak, last_seen FROM alert_states WHERE user_id = ?",
+            (user_id,)
+        ).fetchone()
+        state = UserAlertState.from_row(row) if row is not None else UserAlertState()
+        state.last_seen = now
+        return state
+
+    def _save(self, user_id, state):
+        self._db.execute(
+            "INSERT OR REPLACE INTO alert_states (user_id, state, ewma, last_alert, last_digest, held, peak, last_seen) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (user_id,) + state.to_row()
+        )
+
+    def _bump(self, name):
+        self._db.execute("UPDATE alert_meta SET value = value + 1 WHERE name = ?", (name,))
+
+    def _cooled_down(self, state, now):
+        return state.last_alert is None or now - state.last_alert >= self.cooldown
+
+    def _alert(self, state, now):
+        state.last_alert = now
+        self._alerts += 1
+        self._bump('period_alerts')
+        return 'alerted'
+
+    def _hold(self, state, score):
+        state.held += 1
+        state.peak = max(state.peak, score)
+        self._held += 1
+        self._bump('period_held')
+        return 'held'
+
+    def _run(self):
+        tick = max(1.0, min(60.0, self.digest_interval / 10))
+        while not self._stop.wait(tick):
+            try:
+                self.send_digests()
+            except Exception as e:
+                logger.error(f"Sending alert digests failed: {e}")
+
+    def send_digests(self, now=None, force=False, admin=True):
+        """Mail user digests that are due, then the admin digest if due (or all of them when forced)"""
+        now = time.time() if now is None else now
+        admin_due = False
+        with self._lock, transaction(self._db):
+            # Nothing left to report or suppress for users who calmed down a while ago
+            self._db.execute(
+                "DELETE FROM alert_states WHERE state = 'clear' AND held = 0 AND last_seen < ?",
+                (now - max(self.cooldown, self.digest_interval),)
+            )
+            due = self._db.execute(
+                "SELECT user_id, held, peak, ewma FROM alert_states "
+                "WHERE held > 0 AND (? OR MAX(COALESCE(last_alert, 0), COALESCE(last_digest, 0)) <= ?)",
+                (force, now - self.digest_interval)
+            ).fetchall()
+            self._db.executemany(
+                "UPDATE alert_states SET held = 0, peak = 0, last_digest = ? WHERE user_id = ?",
+                [(now, user_id) for user_id, _, _, _ in due]
+            )
+            self._digests += len(due)
+
+            if admin and self.admin_digest_interval > 0:
+                meta = dict(self._db.execute("SELECT name, value FROM alert_meta").fetchall())
+                admin_due = force or now - meta['last_admin_digest'] >= self.admin_digest_interval
+                if admin_due:
+                    # Claimed in the transaction, so only one worker sends each summary
+                    self._db.execute(
+                        "UPDATE alert_meta SET value = CASE name WHEN 'last_admin_digest' THEN ? ELSE 0 END",
+                        (now,)
+                    )
+                    period_alerts, period_held = int(meta['period_alerts']), int(meta['period_held'])
+
+        for user_id, held, peak, ewma in due:
+            self._send_digest(user_id, held, peak, ewma)
+        if admin_due:
+            self._send_admin_digest(period_alerts, period_held)
+
+    def _send_alert(self, user_id, score, ewma):
+        user = self.get_user(user_id)
+        if not user:
+            return
+        score_line = f"<p>Your stress score: {score}%</p>" if score is not None else ""
+        self.send_email(user['email'], "Wellness Alert - High Stress Detected", f"""
+        <html>
+        <body>
+            <h2>High Stress Alert</h2>
+            <p>Dear {user['name']},</p>
+            <p>Our system has detected a high level of stress in your recent analysis.</p>
+            {score_line}
+            <p>We recommend taking a short break, practicing deep breathing, or consulting with our wellness resources.</p>
+            <p>Your wellbeing is important to us.</p>
+            <p>Best regards,<br>The Workplace Wellness Team</p>
+        </body>
+        </html>
+        """)
+
+    def _send_digest(self, user_id, held, peak, ewma):
+        user = self.get_user(user_id)
+        if not user:
+            return
+        average = f"{ewma:.1f}%" if ewma is not None else "n/a"
+        self.send_email(user['email'], "Wellness Update - Stress Summary", f"""
+        <html>
+        <body>
+            <h2>Stress Summary</h2>
+            <p>Dear {user['name']},</p>
+            <p>Since our last message, {held} more of your analyses showed high stress (highest score: {peak:.1f}%).</p>
+            <p>Your recent average stress score is {average}.</p>
+            <p>We recommend taking a short break, practicing deep breathing, or consulting with our wellness resources.</p>
+            <p>Best regards,<br>The Workplace Wellness Team</p>
+        </body>
+        </html>
+        """)
+
+    def _send_admin_digest(self, period_alerts, period_held):
+        users = self.get_high_stress_users()
+        if not users and not period_alerts:
+            return
+        admins = self.get_admins()
+        if not admins:
+            return
+        rows = "".join(f"<tr><td>{user['name']}</td><td>{user['stressLevel']}%</td></tr>" for user in users)
+        body = f"""
+        <html>
+        <body>
+            <h2>High Stress Summary</h2>
+            <p>{period_alerts} alerts were sent and {period_held} further high readings were recorded since the last summary.</p>
+            <p>{len(users)} users currently have an average stress score of {HIGH_STRESS_THRESHOLD}% or more.</p>
+            <table>
+                <tr><th>Name</th><th>Average stress</th></tr>
+                {rows}
+            </table>
+            <p>Best regards,<br>The Workplace Wellness Team</p>
+        </body>
+        </html>
+        """
+        for admin in admins:
+            self.send_email(admin['email'], "Workplace Wellness - High Stress Summary", body)
+        with self._lock:
+            self._admin_digests += 1
+
+    def close(self):
+        """Stop the digest thread; held readings stay in the shared state for the next digest"""
+        self._stop.set()
+        self._thread.join(5)
+        with self._lock:
+            self._db.close()
+
+    def get_metrics(self):
+        """Return how many scores this process saw and how many emails they turned into"""
+        with self._lock:
+            tracked, alerting = self._db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(state = 'alerting'), 0) FROM alert_states"
+            ).fetchone()
+            return {
+                'tracked_users': tracked,
+                'alerting_users': alerting,
+                'observed': self._observed,
+                'alerts_sent': self._alerts,
+                'held_for_digest': self._held,
+                'cleared': self._cleared,
+                'digests_sent': self._digests,
+                'admin_digests_sent': self._admin_digests,
+            }
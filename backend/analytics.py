@@ -0,0 +1,368 @@
+import json
+import bisect
+import logging
+from datetime import datetime
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Rollups are kept per hour and per day, for each user and for the whole organization
+GRANULARITIES = ('hour', 'day')
+ORG_WIDE = '*'
+LEVELS = ('low', 'medium', 'high')
+
+# Fixed score histogram for percentiles: one bin per score point, 100 falls into the last bin
+HISTOGRAM_BINS = 100
+
+# Rows read per round trip while backfilling from stress_results
+BACKFILL_CHUNK_SIZE = 50000
+
+
+def bucket_start(created_at, granularity):
+    """Start of the hour or day a timestamp falls into"""
+    if granularity == 'hour':
+        return created_at.replace(minute=0, second=0, microsecond=0)
+    return created_at.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def score_bin(score):
+    return min(max(int(score), 0), HISTOGRAM_BINS - 1)
+
+
+class Rollup:
+    """Counts, moments and a score histogram for one bucket"""
+
+    __slots__ = ('count', 'low', 'medium', 'high', 'total', 'total_sq', 'histogram')
+
+    def __init__(self):
+        self.count = 0
+        self.low = 0
+        self.medium = 0
+        self.high = 0
+        self.total = 0.0
+        self.total_sq = 0.0
+        self.histogram = np.zeros(HISTOGRAM_BINS, dtype=np.int64)
+
+    @classmethod
+    def from_row(cls, row):
+        rollup = cls()
+        rollup.count = int(row['result_count'])
+        rollup.low = int(row['low_count'])
+        rollup.medium = int(row['medium_count'])
+        rollup.high = int(row['high_count'])
+        rollup.total = float(row['score_sum'])
+        rollup.total_sq = float(row['score_sum_sq'])
+        histogram = row['histogram']
+        if isinstance(histogram, (str, bytes)):
+            histogram = json.loads(histogram)
+        rollup.histogram = np.asarray(histogram, dtype=np.int64)
+        return rollup
+
+    def add(self, level, score):
+        self.count += 1
+        if level in LEVELS:
+            setattr(self, level, getattr(self, level) + 1)
+        self.total += score
+        self.total_sq += score * score
+        self.histogram[score_bin(score)] += 1
+
+    def merge(self, other):
+        self.count += other.count
+        self.low += other.low
+        self.medium += other.medium
+        self.high += other.high
+        self.total += other.total
+        self.total_sq += other.total_sq
+        self.histogram += other.histogram
+        return self
+
+    def percentile(self, q):
+        """Score below which a fraction q of the results fall, interpolated within a bin"""
+        if self.count == 0:
+            return 0.0
+        cumulative = np.cumsum(self.histogram)
+        target = q * self.count
+        index = int(np.searchsorted(cumulative, target))
+        index = min(index, HISTOGRAM_BINS - 1)
+        before = cumulative[index - 1] if index > 0 else 0
+        in_bin = self.histogram[index]
+        fraction = (target - before) / in_bin if in_bin else 0.0
+        return min(100.0, index + fraction)
+
+    def to_dict(self):
+        mean = self.total / self.count if self.count else 0.0
+        variance = max(0.0, self.total_sq / self.count - mean * mean) if self.count else 0.0
+        return {
+            'count': self.count,
+            'low': self.low,
+            'medium': self.medium,
+            'high': self.high,
+            'mean': round(mean, 1),
+            'stddev': round(variance ** 0.5, 1),
+            'p50': round(self.percentile(0.5), 1),
+            'p90': round(self.percentile(0.9), 1),
+            'p95': round(self.percentile(0.95), 1),
+        }
+
+
+def rollup_deltas(results):
+    """Group (user_id, stress_level, stress_score, created_at) tuples into per-bucket rollups
+
+    Every result lands in four rollups: its user's hour and day, and the
+    organization-wide hour and day.
+    """
+    deltas = {}
+    for user_id, stress_level, stress_score, created_at in results:
+        for granularity in GRANULARITIES:
+            start = bucket_start(created_at, granularity)
+            for owner in (user_id, ORG_WIDE):
+                key = (granularity, start, owner)
+                rollup = deltas.get(key)
+                if rollup is None:
+                    rollup = deltas[key] = Rollup()
+                rollup.add(stress_level, stress_score)
+    return deltas
+
+
+def aggregate_arrays(user_ids, levels, scores, created_at):
+    """Vectorized rollup_deltas over column arrays, for backfills
+
+    user_ids and levels are sequences of strings, scores floats and
+    created_at naive datetimes (or a datetime64 array).
+    """
+    user_ids = np.asarray(user_ids, dtype=object)
+    levels = np.asarray(levels, dtype=object)
+    scores = np.asarray(scores, dtype=np.float64)
+    created_at = np.asarray(created_at, dtype='datetime64[us]')
+    bins = np.clip(scores.astype(np.int64), 0, HISTOGRAM_BINS - 1)
+    level_flags = {level: (levels == level) for level in LEVELS}
+
+    users, user_index = np.unique(user_ids.astype(str), return_inverse=True)
+    deltas = {}
+    for granularity, unit in (('hour', 'h'), ('day', 'D')):
+        buckets, bucket_index = np.unique(created_at.astype(f'datetime64[{unit}]'), return_inverse=True)
+        for owners, owner_index in ((users, user_index), (np.array([ORG_WIDE]), np.zeros(len(scores), np.int64))):
+            # One group per (owner, bucket) pair
+            combined = owner_index.astype(np.int64) * len(buckets) + bucket_index
+            groups, group_index = np.unique(combined, return_inverse=True)
+            size = len(groups)
+
+            counts = np.bincount(group_index, minlength=size)
+            totals = np.bincount(group_index, weights=scores, minlength=size)
+            totals_sq = np.bincount(group_index, weights=scores * scores, minlength=size)
+            level_counts = {
+                level: np.bincount(group_index, weights=flags, minlength=size).astype(np.int64)
+                for level, flags in level_flags.items()
+            }
+            histograms = np.bincount(
+                group_index * HISTOGRAM_BINS + bins, minlength=size * HISTOGRAM_BINS
+            ).reshape(size, HISTOGRAM_BINS)
+
+            for i, group in enumerate(groups):
+                owner, bucket = owners[group // len(buckets)], buckets[group % len(buckets)]
+                rollup = Rollup()
+                rollup.count = int(counts[i])
+                rollup.low = int(level_counts['low'][i])
+                rollup.medium = int(level_counts['medium'][i])
+                rollup.high = int(level_counts['high'][i])
+                rollup.total = float(totals[i])
+                rollup.total_sq = float(totals_sq[i])
+                rollup.histogram = histograms[i].astype(np.int64)
+                deltas[(granularity, bucket.astype('datetime64[us]').astype(datetime), str(owner))] = rollup
+    return deltas
+
+
+def merge_deltas(into, deltas):
+    for key, rollup in deltas.items():
+        existing = into.get(key)
+        if existing is None:
+            into[key] = rollup
+        else:
+            existing.merge(rollup)
+    return into
+
+
+# MySQL storage
+def create_rollups_table(cursor):
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS stress_rollups (
+        granularity ENUM('hour', 'day') NOT NULL,
+        user_id VARCHAR(36) NOT NULL,
+        bucket_start DATETIME NOT NULL,
+        result_count INT NOT NULL DEFAULT 0,
+        low_count INT NOT NULL DEFAULT 0,
+        medium_count INT NOT NULL DEFAULT 0,
+        high_count INT NOT NULL DEFAULT 0,
+        score_sum DOUBLE NOT NULL DEFAULT 0,
+        score_sum_sq DOUBLE NOT NULL DEFAULT 0,
+        histogram JSON NOT NULL,
+        PRIMARY KEY (granularity, user_id, bucket_start),
+        INDEX idx_stress_rollups_bucket (granularity, bucket_start)
+    )
+    """)
+
+
+def upsert_rollups(cursor, deltas):
+    """Add rollup deltas to stress_rollups, bumping only the histogram bins that changed"""
+    for (granularity, start, owner), rollup in deltas.items():
+        changed = np.nonzero(rollup.histogram)[0]
+        bin_updates = ", ".join(
+            f"'$[{b}]', JSON_EXTRACT(histogram, '$[{b}]') + {int(rollup.histogram[b])}" for b in changed
+        )
+        cursor.execute(f"""
+        INSERT INTO stress_rollups
+            (granularity, user_id, bucket_start, result_count, low_count, medium_count, high_count,
+             score_sum, score_sum_sq, histogram)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE
+            result_count = result_count + VALUES(result_count),
+            low_count = low_count + VALUES(low_count),
+            medium_count = medium_count + VALUES(medium_count),
+            high_count = high_count + VALUES(high_count),
+            score_sum = score_sum + VALUES(score_sum),
+            score_sum_sq = score_sum_sq + VALUES(score_sum_sq),
+            histogram = JSON_SET(histogram, {bin_updates})
+        """, _rollup_params(granularity, start, owner, rollup))
+
+
+def _rollup_params(granularity, start, owner, rollup):
+    return (granularity, owner, start, rollup.count, rollup.low, rollup.medium, rollup.high,
+            rollup.total, rollup.total_sq, json.dumps(rollup.histogram.tolist()))
+
+
+def rebuild_rollups(cursor):
+    """Recompute stress_rollups from every stored result with NumPy, one chunk at a time"""
+    cursor.execute("SELECT user_id, stress_level, stress_score, created_at FROM stress_results")
+    deltas = {}
+    rows_read = 0
+    while True:
+        rows = cursor.fetchmany(BACKFILL_CHUNK_SIZE)
+        if not rows:
+            break
+        user_ids, levels, scores, created_at = zip(*rows)
+        merge_deltas(deltas, aggregate_arrays(user_ids, levels, scores, created_at))
+        rows_read += len(rows)
+
+    cursor.execute("DELETE FROM stress_rollups")
+    params = [_rollup_params(granularity, start, owner, rollup) for (granularity, start, owner), rollup in deltas.items()]
+    for offset in range(0, len(params), 1000):
+        cursor.executemany("""
+        INSERT INTO stress_rollups
+            (granularity, user_id, bucket_start, result_count, low_count, medium_count, high_count,
+             score_sum, score_sum_sq, histogram)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+        """, params[offset:offset + 1000])
+    logger.info(f"Rebuilt {len(params)} stress rollups from {rows_read} results")
+    return len(params)
+
+
+def query_series(cursor, granularity, owner, start, end):
+    """Rollups of one owner for buckets in [start, end), oldest first"""
+    cursor.execute("""
+    SELECT bucket_start, result_count, low_count, medium_count, high_count, score_sum, score_sum_sq, histogram
+    FROM stress_rollups
+    WHERE granularity = %s AND user_id = %s AND bucket_start >= %s AND bucket_start < %s
+    ORDER BY bucket_start
+    """, (granularity, owner, start, end))
+    return [(row['bucket_start'], Rollup.from_row(row)) for row in cursor.fetchall()]
+
+
+def query_user_totals(cursor, granularity, start, end):
+    """Per-user counts and sums over [start, end), without histograms"""
+    cursor.execute("""
+    SELECT user_id, SUM(result_count) AS result_count, SUM(low_count) AS low_count,
+           SUM(medium_count) AS medium_count, SUM(high_count) AS high_count,
+           SUM(score_sum) AS score_sum, SUM(score_sum_sq) AS score_sum_sq
+    FROM stress_rollups
+    WHERE granularity = %s AND user_id <> %s AND bucket_start >= %s AND bucket_start < %s
+    GROUP BY user_id
+    """, (granularity, ORG_WIDE, start, end))
+    totals = {}
+    for row in cursor.fetchall():
+        row['histogram'] = np.zeros(HISTOGRAM_BINS, dtype=np.int64)
+        totals[row['user_id']] = Rollup.from_row(row)
+    return totals
+
+
+class MemoryRollups:
+    """Rollups for the in-memory storage engine; callers hold the store's lock"""
+
+    def __init__(self):
+        # (granularity, owner) -> {bucket start: Rollup}, plus the sorted bucket starts
+        self._buckets = {}
+        self._starts = {}
+
+    def add(self, deltas):
+        for (granularity, start, owner), rollup in deltas.items():
+            buckets = self._buckets.setdefault((granularity, owner), {})
+            existing = buckets.get(start)
+            if existing is None:
+                buckets[start] = rollup
+                starts = self._starts.setdefault((granularity, owner), [])
+                if not starts or start > starts[-1]:
+                    starts.append(start)
+                else:
+                    bisect.insort(starts, start)
+            else:
+                existing.merge(rollup)
+
+    def replace(self, deltas):
+        self._buckets = {}
+        self._starts = {}
+        self.add(deltas)
+
+    def series(self, granularity, owner, start, end):
+        starts = self._starts.get((granularity, owner), [])
+        buckets = self._buckets.get((granularity, owner), {})
+        low, high = bisect.bisect_left(starts, start), bisect.bisect_left(starts, end)
+        return [(bucket, _copy(buckets[bucket])) for bucket in starts[low:high]]
+
+    def user_totals(self, granularity, start, end):
+        totals = {}
+        for (key_granularity, owner) in self._starts:
+            if key_granularity != granularity or owner == ORG_WIDE:
+                continue
+            series = self.series(granularity, owner, start, end)
+            if series:
+                totals[owner] = _sum(rollup for _, rollup in series)
+        return totals
+
+
+def _copy(rollup):
+    return Rollup().merge(rollup)
+
+
+def _sum(rollups):
+    total = Rollup()
+    for rollup in rollups:
+        total.merge(rollup)
+    return total
+
+
+def summarize(series, user_totals, high_threshold):
+    """Turn rollup query results into the analytics payload"""
+    high_stress_users = []
+    for user_id, rollup in user_totals.items():
+        mean = rollup.total / rollup.count if rollup.count else 0.0
+        if mean >= high_threshold:
+            high_stress_users.append({
+                'user_id': user_id,
+                'avg_score': round(mean, 1),
+                'count': rollup.count,
+                'high': rollup.high,
+            })
+    high_stress_users.sort(key=lambda user: user['avg_score'], reverse=True)
+
+    return {
+        'series': [dict(bucket=bucket.isoformat(), **rollup.to_dict()) for bucket, rollup in series],
+        'summary': _sum(rollup for _, rollup in series).to_dict(),
+        'high_stress_users': high_stress_users,
+        'active_users': len(user_totals),
+    }
+
+
+if __name__ == '__main__':
+    # Batch job: python analytics.py rebuilds every rollup from stress_results
+    from database import Database
+    Database().rebuild_rollups()
@@ -1,11 +1,20 @@
 
 from flask import Flask, request, jsonify
 from flask_cors import CORS
+from flask_sock import Sock
 import os
 import base64
+import cv2
+import numpy as np
 import json
 import logging
+import threading
 from image_processor import StressDetector
+from inference_queue import InferenceBusy
+from write_behind import WriteBufferFull
+from frame_stream import serve_frame_stream, get_stream_metrics
+from image_store import get_image_store, PERSIST_IMAGES
+from results_log import ResultsLog, DatabaseResults
 from datetime import datetime
 import jwt
 from functools import wraps
@@ -17,17 +26,55 @@ logger = logging.getLogger(__name__)
 # Initialize app
 app = Flask(__name__)
 CORS(app)
+sock = Sock(app)
 
 # Secret key for JWT
 SECRET_KEY = os.environ.get('SECRET_KEY', 'development_secret_key')
 
-# Initialize stress detector
-stress_detector = StressDetector()
-
 # Upload directory
 UPLOAD_DIR = 'uploads'
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
+# Result history: per-user append-only logs ('log') or the shared Database ('database')
+RESULTS_BACKEND = os.environ.get('RESULTS_BACKEND', 'log').lower()
+
+# Services are created per process by create_app(); importing this module starts no threads
+stress_detector = None
+image_store = None
+results_store = None
+_services_lock = threading.Lock()
+
+def create_app():
+    """Create the stress detector, image store and result history, and return the app
+
+    Pre-fork servers import this module first and call this once per worker.
+    """
+    global stress_detector, image_store, results_store
+    with _services_lock:
+        if stress_detector is not None:
+            return app
+        
+        # Content-addressed store for uploaded originals
+        image_store = get_image_store()
+        
+        if RESULTS_BACKEND == 'database':
+            from database import Database
+            results_store = DatabaseResults(Database())
+        else:
+            results_store = ResultsLog()
+        
+        stress_detector = StressDetector()
+    return app
+
+@app.before_request
+def start_services():
+    """Start the services on the first request when served as api:app"""
+    if stress_detector is None:
+        create_app()
+
+# Largest page get_user_results returns
+MAX_RESULTS_PAGE = 100
+
 # JWT token verification decorator
 def token_required(f):
     @wraps(f)
@@ -55,6 +102,68 @@ def token_required(f):
     
     return decorated
 
+# Model readiness decorator
+MODEL_RETRY_AFTER = os.environ.get('MODEL_RETRY_AFTER', '5')
+
+def model_required(f):
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        # The model loads in the background; detection waits for it
+        if not stress_detector.registry.is_ready():
+            response = jsonify({'success': False, 'message': 'Stress detection model is still loading, please retry shortly'})
+            return response, 503, {'Retry-After': MODEL_RETRY_AFTER}
+        
+        return f(*args, **kwargs)
+    
+    return decorated
+
+# Retry-After seconds when the inference queue is full or too slow
+INFERENCE_RETRY_AFTER = os.environ.get('INFERENCE_RETRY_AFTER', '1')
+
+def inference_busy():
+    response = jsonify({'success': False, 'message': 'Stress detection is busy, please retry shortly'})
+    return response, 503, {'Retry-After': INFERENCE_RETRY_AFTER}
+
+# Retry-After seconds when results cannot be queued for the database
+STORAGE_RETRY_AFTER = os.environ.get('STORAGE_RETRY_AFTER', '2')
+
+def storage_busy():
+    response = jsonify({'success': False, 'message': 'Results cannot be saved right now, please retry shortly'})
+    return response, 503, {'Retry-After': STORAGE_RETRY_AFTER}
+
+@app.route('/api/health/live', methods=['GET'])
+def health_live():
+    """Liveness probe"""
+    return jsonify({'success': True, 'status': 'live'})
+
+@app.route('/api/health/ready', methods=['GET'])
+def health_ready():
+    """Readiness probe: the model is loaded and warmed"""
+    ready = stress_detector.registry.is_ready()
+    
+    return jsonify({
+        'success': ready,
+        'status': 'ready' if ready else 'starting',
+        'model': {
+            'ready': ready,
+            'error': stress_detector.registry.load_error
+        }
+    }), 200 if ready else 503
+
+# Annotation-only responses skip drawing and JPEG-encoding the result image
+ANNOTATIONS_MEDIA_TYPE = 'application/vnd.stress.annotations+json'
+
+def wants_annotations_only():
+    """Check the mode query parameter or Accept header for annotation-only responses"""
+    if request.args.get('mode') == 'annotations':
+        return True
+    return request.accept_mimetypes.best == ANNOTATIONS_MEDIA_TYPE
+
+def webcam_session_key(user_id):
+    """Key face tracking by user and webcam session"""
+    session_id = request.form.get('session_id') or request.headers.get('X-Session-Id') or 'webcam'
+    return f"{user_id}:{session_id}"
+
 @app.route('/api/test', methods=['GET'])
 def test():
     """Test endpoint"""
@@ -65,6 +174,7 @@ def test():
 
 @app.route('/api/detect/image', methods=['POST'])
 @token_required
+@model_required
 def detect_stress_image(current_user_id):
     """Detect stress from uploaded image"""
     logger.info(f"Processing stress detection request for user {current_user_id}")
@@ -72,37 +182,19 @@ def detect_stress_image(current_user_id):
     try:
         # Process image data
         if 'image' in request.files:
-            # Save uploaded file
-            image_file = request.files['image']
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            filename = f"{current_user_id}_{timestamp}.jpg"
-            filepath = os.path.join(UPLOAD_DIR, filename)
-            image_file.save(filepath)
-            
-            # Process image
-            result = stress_detector.process_image(filepath)
+            image_bytes = request.files['image'].read()
         
         elif 'image_data' in request.form:
             # Process base64 image data
             image_data = request.form['image_data']
             
-            # Save base64 image for record keeping
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            filename = f"{current_user_id}_{timestamp}.jpg"
-            filepath = os.path.join(UPLOAD_DIR, filename)
-            
             # Extract the base64 part if it contains metadata
             if ',' in image_data:
                 image_data_parts = image_data.split(',', 1)
                 if len(image_data_parts) == 2:
                     image_data = image_data_parts[1]
             
-            # Decode and save
-            with open(filepath, 'wb') as f:
-                f.write(base64.b64decode(image_data))
-            
-            # Process image
-            result = stress_detector.process_image(image_data)
+            image_bytes = base64.b64decode(image_data)
         
         else:
             return jsonify({
@@ -110,24 +202,37 @@ def detect_stress_image(current_user_id):
                 'message': 'No image data provided'
             }), 400
         
+        # Process image from memory
+        result = stress_detector.process_image(
+            image_bytes,
+            detection_key=current_user_id,
+            annotate=not wants_annotations_only()
+        )
+        
         # Add user ID and timestamp to result
         if result['success']:
             result['user_id'] = current_user_id
             result['timestamp'] = datetime.now().isoformat()
             
-            # Save result to a file (in a real app, this would go to a database)
-            result_file = f"{current_user_id}_{timestamp}_result.json"
-            result_path = os.path.join(UPLOAD_DIR, result_file)
+            # Keep the original for record keeping (unless disabled); the store writes it in the background
+            result['image_key'] = image_store.put(image_bytes) if PERSIST_IMAGES else None
             
-            # Remove the base64 image from the saved result to save space
+            # Append to the user's result history, without the base64 image to save space
             result_to_save = result.copy()
             result_to_save.pop('result_image', None)
             
-            with open(result_path, 'w') as f:
-                json.dump(result_to_save, f)
+            results_store.append(current_user_id, result_to_save)
         
         return jsonify(result)
     
+    except InferenceBusy as e:
+        logger.warning(f"Rejected stress detection request: {e}")
+        return inference_busy()
+    
+    except WriteBufferFull as e:
+        logger.warning(f"Could not save stress detection result: {e}")
+        return storage_busy()
+    
     except Exception as e:
         logger.error(f"Error processing image: {str(e)}")
         return jsonify({
@@ -137,6 +242,7 @@ def detect_stress_image(current_user_id):
 
 @app.route('/api/detect/webcam', methods=['POST'])
 @token_required
+@model_required
 def detect_stress_webcam(current_user_id):
     """Detect stress from webcam image"""
     # This is essentially the same as the image endpoint but specifically for webcam data
@@ -151,8 +257,13 @@ def detect_stress_webcam(current_user_id):
         
         image_data = request.form['image_data']
         
-        # Process image
-        result = stress_detector.process_image(image_data)
+        # Process image, following the face from the previous frame of this session
+        result = stress_detector.process_image(
+            image_data,
+            detection_key=current_user_id,
+            tracking_key=webcam_session_key(current_user_id),
+            annotate=not wants_annotations_only()
+        )
         
         # Add user ID and timestamp to result
         if result['success']:
@@ -161,6 +272,10 @@ def detect_stress_webcam(current_user_id):
         
         return jsonify(result)
     
+    except InferenceBusy as e:
+        logger.warning(f"Rejected webcam stress detection request: {e}")
+        return inference_busy()
+    
     except Exception as e:
         logger.error(f"Error processing webcam image: {str(e)}")
         return jsonify({
@@ -168,13 +283,65 @@ def detect_stress_webcam(current_user_id):
             'message': f'Error processing webcam image: {str(e)}'
         }), 500
 
+@sock.route('/api/detect/stream')
+def detect_stress_stream(ws):
+    """Stream webcam frames as binary JPEG messages and receive per-frame JSON scores"""
+    # Browsers cannot set headers on a WebSocket, so the token may come as a query parameter
+    token = request.args.get('token')
+    auth_header = request.headers.get('Authorization', '')
+    if not token and auth_header.lower().startswith('bearer '):
+        token = auth_header.split(' ', 1)[1]
+    
+    try:
+        current_user_id = jwt.decode(token, SECRET_KEY, algorithms=["HS256"])['user_id']
+    except:
+        ws.send(json.dumps({'error': 'Invalid token'}))
+        ws.close(reason=1008, message='Invalid token')
+        return
+    
+    if not stress_detector.registry.is_ready():
+        ws.send(json.dumps({'error': 'Stress detection model is still loading, please retry shortly'}))
+        ws.close(reason=1013, message='Model loading')
+        return
+    
+    logger.info(f"Opened webcam stream for user {current_user_id}")
+    tracking_key = f"{current_user_id}:{request.args.get('session_id') or 'stream'}"
+    
+    def process_frame(data):
+        image = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+        if image is None:
+            return {'error': 'Invalid JPEG frame'}
+        try:
+            return {'faces': stress_detector.analyze_frame(image, detection_key=current_user_id, tracking_key=tracking_key)}
+        except InferenceBusy:
+            # Skip this frame; the next one is scored once the queue drains
+            return {'error': 'busy'}
+    
+    try:
+        serve_frame_stream(ws, process_frame)
+    finally:
+        stress_detector.face_tracker.reset(tracking_key)
+
+@app.route('/api/metrics', methods=['GET'])
+@token_required
+def get_metrics(current_user_id):
+    """Inference scheduler metrics"""
+    return jsonify({
+        'success': True,
+        'inference': stress_detector.batcher.get_metrics(),
+        'model': stress_detector.registry.get_status(),
+        'face_detection': stress_detector.face_detector.get_metrics(),
+        'face_tracking': stress_detector.face_tracker.get_metrics(),
+        'streams': get_stream_metrics(),
+        'image_store': image_store.get_metrics(),
+        'result_cache': stress_detector.result_cache.get_metrics(),
+        'results': results_store.get_metrics()
+    })
+
 @app.route('/api/results/<user_id>', methods=['GET'])
 @token_required
 def get_user_results(current_user_id, user_id):
     """Get stress detection results for a user"""
-    # In a real app, this would fetch from a database
-    # For this example, we'll read from saved result files
-    
     # Check if the requesting user is the same as the target user or is an admin
     # (In a real app, would check admin status in the database)
     if current_user_id != user_id:
@@ -183,24 +350,28 @@ def get_user_results(current_user_id, user_id):
             'message': 'Unauthorized access to user results'
         }), 403
     
+    # Newest first; pass next_cursor back as ?before= for the next older page
+    limit = min(max(request.args.get('limit', 20, type=int), 1), MAX_RESULTS_PAGE)
+    before = request.args.get('before')
+    
     try:
-        results = []
-        
-        # Find all result files for the user
-        for filename in os.listdir(UPLOAD_DIR):
-            if filename.startswith(f"{user_id}_") and filename.endswith("_result.json"):
-                filepath = os.path.join(UPLOAD_DIR, filename)
-                
-                with open(filepath, 'r') as f:
-                    result_data = json.load(f)
-                    results.append(result_data)
+        try:
+            results, next_cursor = results_store.newest(user_id, limit=limit, before=before or None)
+        except ValueError:
+            return jsonify({
+                'success': False,
+                'message': 'Invalid cursor'
+            }), 400
         
-        # Sort by timestamp (newest first)
-        results.sort(key=lambda x: x.get('timestamp', ''), reverse=True)
+        # Logged keys are not rewritten by retention; point them at the thumbnail, or drop expired ones
+        for result in results:
+            if result.get('image_key'):
+                result['image_key'] = image_store.current_key(result['image_key'])
         
         return jsonify({
             'success': True,
-            'results': results
+            'results': results,
+            'next_cursor': next_cursor
         })
     
     except Exception as e:
@@ -212,4 +383,4 @@ def get_user_results(current_user_id, user_id):
 
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
-    app.run(debug=True, host='0.0.0.0', port=port)
+    create_app().run(debug=True, host='0.0.0.0', port=port)
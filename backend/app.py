@@ -1,22 +1,32 @@
 
 from flask import Flask, request, jsonify, abort
 from flask_cors import CORS
+from flask_sock import Sock
 import numpy as np
 import cv2
 import base64
 import os
 import json
+import time
+import hashlib
+import atexit
+import threading
 from stress_detection import StressDetectionAPI
-from werkzeug.security import generate_password_hash, check_password_hash
+from inference_queue import InferenceBusy
+from write_behind import WriteBufferFull
+from database import encode_cursor, parse_cursor
+from frame_stream import serve_frame_stream, get_stream_metrics
+from password_hashing import get_password_hasher, get_login_limiter, HashingBusy
 import jwt
 from datetime import datetime, timedelta
 from functools import wraps
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
+from email_outbox import EmailOutbox
+from alerts import AlertManager
+from retention import RetentionCompactor, RETENTION_ENABLED
 
 app = Flask(__name__)
 CORS(app, resources={r"/api/*": {"origins": "*"}})
+sock = Sock(app)
 
 # Secret key for JWT authentication
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'development_secret_key')
@@ -27,8 +37,18 @@ EMAIL_PASSWORD = os.environ.get('EMAIL_PASSWORD', '')  # Set your email password
 EMAIL_SERVER = os.environ.get('EMAIL_SERVER', 'smtp.gmail.com')
 EMAIL_PORT = int(os.environ.get('EMAIL_PORT', 587))
 
-# Initialize the stress detection API
-api = StressDetectionAPI()
+# Services are created per process by create_app(); importing this module starts no threads
+password_hasher = None
+login_limiter = None
+HASHING_RETRY_AFTER = os.environ.get('HASHING_RETRY_AFTER', '1')
+outbox = None
+api = None
+alerts = None
+retention = None
+_services_lock = threading.Lock()
+
+# Live webcam streams record at most one result per interval (seconds)
+STREAM_RECORD_INTERVAL = float(os.environ.get('STREAM_RECORD_INTERVAL', 5))
 
 # Upload directory
 UPLOAD_FOLDER = 'uploads'
@@ -76,32 +96,92 @@ def admin_required(f):
     
     return decorated
 
+# Model readiness middleware
+MODEL_RETRY_AFTER = os.environ.get('MODEL_RETRY_AFTER', '5')
+
+def model_required(f):
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        # The model loads in the background; analysis waits for it, auth does not
+        if not api.registry.is_ready():
+            response = jsonify({'success': False, 'message': 'Stress detection model is still loading, please retry shortly.'})
+            return response, 503, {'Retry-After': MODEL_RETRY_AFTER}
+        
+        return f(*args, **kwargs)
+    
+    return decorated
+
+# Retry-After seconds when the inference queue is full or too slow
+INFERENCE_RETRY_AFTER = os.environ.get('INFERENCE_RETRY_AFTER', '1')
+
+def inference_busy():
+    response = jsonify({'success': False, 'message': 'Stress detection is busy, please retry shortly.'})
+    return response, 503, {'Retry-After': INFERENCE_RETRY_AFTER}
+
+# Retry-After seconds when results cannot be queued for the database
+STORAGE_RETRY_AFTER = os.environ.get('STORAGE_RETRY_AFTER', '2')
+
+def storage_busy():
+    response = jsonify({'success': False, 'message': 'Results cannot be saved right now, please retry shortly.'})
+    return response, 503, {'Retry-After': STORAGE_RETRY_AFTER}
+
+# Annotation-only responses skip drawing and JPEG-encoding the result image
+ANNOTATIONS_MEDIA_TYPE = 'application/vnd.stress.annotations+json'
+
+def wants_annotations_only():
+    if request.args.get('mode') == 'annotations':
+        return True
+    return request.accept_mimetypes.best == ANNOTATIONS_MEDIA_TYPE
+
+def webcam_session_key(user_id):
+    # Face tracking is keyed by user and webcam session
+    session_id = request.form.get('session_id') or request.headers.get('X-Session-Id') or 'webcam'
+    return f"{user_id}:{session_id}"
+
 # Email sending function
 def send_email(to_email, subject, body_html):
-    if not EMAIL_USER or not EMAIL_PASSWORD:
+    # Only queues the message; the outbox senders deliver it in the background
+    if outbox is None:
         print("Email credentials not configured. Skipping email.")
         return False
     
     try:
-        msg = MIMEMultipart()
-        msg['From'] = EMAIL_USER
-        msg['To'] = to_email
-        msg['Subject'] = subject
-        
-        msg.attach(MIMEText(body_html, 'html'))
-        
-        server = smtplib.SMTP(EMAIL_SERVER, EMAIL_PORT)
-        server.starttls()
-        server.login(EMAIL_USER, EMAIL_PASSWORD)
-        server.send_message(msg)
-        server.quit()
-        
+        outbox.enqueue(to_email, subject, body_html)
         return True
     except Exception as e:
-        print(f"Failed to send email: {str(e)}")
+        print(f"Failed to queue email: {str(e)}")
         return False
 
+# Health routes
+@app.route('/api/health/live', methods=['GET'])
+def health_live():
+    # The process is up and serving requests
+    return jsonify({'success': True, 'status': 'live'})
+
+@app.route('/api/health/ready', methods=['GET'])
+def health_ready():
+    model_ready = api.registry.is_ready()
+    db_ready = api.db.is_healthy()
+    ready = model_ready and db_ready
+    
+    return jsonify({
+        'success': ready,
+        'status': 'ready' if ready else 'starting',
+        'model': {
+            'ready': model_ready,
+            'error': api.registry.load_error
+        },
+        'database': {
+            'ready': db_ready,
+            'backend': 'memory' if hasattr(api.db, 'in_memory') else 'mysql'
+        }
+    }), 200 if ready else 503
+
 # User routes
+def _hashing_busy():
+    response = jsonify({'success': False, 'message': 'Server is busy, please retry shortly.'})
+    return response, 503, {'Retry-After': HASHING_RETRY_AFTER}
+
 @app.route('/api/auth/register', methods=['POST'])
 def register():
     data = request.get_json()
@@ -115,7 +195,10 @@ def register():
     role = 'admin' if is_admin else 'user'
     
     # Hash the password
-    hashed_password = generate_password_hash(data['password'], method='pbkdf2:sha256')
+    try:
+        hashed_password = password_hasher.hash(data['password'])
+    except HashingBusy:
+        return _hashing_busy()
     
     # Add user to database
     success, message = api.db.add_user(
@@ -156,14 +239,25 @@ def login():
     if not data or not data.get('email') or not data.get('password'):
         return jsonify({'success': False, 'message': 'Please provide email and password!'}), 400
     
+    # Refuse clients with too many recent failures before doing any hashing
+    client_ip = request.remote_addr
+    retry_after = login_limiter.retry_after(client_ip, data['email'])
+    if retry_after > 0:
+        response = jsonify({'success': False, 'message': 'Too many failed login attempts, please try again later.'})
+        return response, 429, {'Retry-After': str(int(retry_after) + 1)}
+    
     # Get user from database
-    cursor = api.db.connection.cursor(dictionary=True)
-    cursor.execute("SELECT * FROM users WHERE email = %s", (data['email'],))
-    user = cursor.fetchone()
-    cursor.close()
+    user = api.db.get_user_by_email(data['email'])
+    
+    try:
+        valid = user is not None and password_hasher.verify(user['password'], data['password'])
+    except HashingBusy:
+        return _hashing_busy()
     
-    if not user or not check_password_hash(user['password'], data['password']):
+    if not valid:
+        login_limiter.record_failure(client_ip, data['email'])
         return jsonify({'success': False, 'message': 'Invalid email or password!'}), 401
+    login_limiter.reset(data['email'])
     
     # Check if user is approved
     if user['role'] != 'admin' and not user['is_approved']:
@@ -184,7 +278,45 @@ def login():
         'user': user
     })
 
-# ... keep existing code (get_profile, analyze_image, get_stress_results functions)
+# ... keep existing code (get_profile function)
+
+# Largest page the results endpoint returns
+MAX_RESULTS_PAGE = 100
+
+@app.route('/api/stress/results', methods=['GET'])
+@token_required
+def get_stress_results(current_user_id):
+    # Keyset pagination: pass next_cursor back as ?before= to get the next older page
+    limit = min(max(request.args.get('limit', 20, type=int), 1), MAX_RESULTS_PAGE)
+    before = request.args.get('before')
+    if before:
+        try:
+            before = parse_cursor(before)
+        except ValueError:
+            return jsonify({'success': False, 'message': 'Invalid cursor!'}), 400
+    
+    results = api.db.get_stress_results(current_user_id, limit=limit, before=before or None)
+    
+    next_cursor = None
+    if len(results) == limit:
+        next_cursor = encode_cursor(results[-1]['created_at'], results[-1]['id'])
+    
+    return jsonify({
+        'success': True,
+        'results': [
+            {
+                'id': result['id'],
+                'userId': result['user_id'],
+                'stressLevel': result['stress_level'],
+                'score': result['stress_score'],
+                'imageUrl': f"/api/stress/results/{result['id']}/image" if result.get('image_path') else None,
+                'createdAt': result['created_at'] if isinstance(result['created_at'], str) else result['created_at'].isoformat(),
+                'notes': result.get('notes')
+            }
+            for result in results
+        ],
+        'next_cursor': next_cursor
+    })
 
 # Notification endpoint for high stress
 @app.route('/api/stress/notify', methods=['POST'])
@@ -196,27 +328,15 @@ def notify_high_stress(current_user_id):
     if not user:
         return jsonify({'success': False, 'message': 'User not found!'}), 404
     
-    # Send email notification for high stress
-    email_subject = "Wellness Alert - High Stress Detected"
-    email_body = f"""
-    <html>
-    <body>
-        <h2>High Stress Alert</h2>
-        <p>Dear {user['name']},</p>
-        <p>Our system has detected a high level of stress in your recent analysis.</p>
-        <p>We recommend taking a short break, practicing deep breathing, or consulting with our wellness resources.</p>
-        <p>Your wellbeing is important to us.</p>
-        <p>Best regards,<br>The Workplace Wellness Team</p>
-    </body>
-    </html>
-    """
-    
-    email_sent = send_email(user['email'], email_subject, email_body)
+    # Coalesced with the alerts analysis already raised; repeats within the cooldown go into a digest
+    data = request.get_json(silent=True) or {}
+    score = data.get('score')
+    outcome = alerts.notify(current_user_id, score=score if isinstance(score, (int, float)) else None)
     
     return jsonify({
         'success': True,
-        'message': 'Notification sent' if email_sent else 'Notification queued',
-        'email_sent': email_sent
+        'message': 'Notification queued' if outcome == 'alerted' else 'Notification included in the next summary',
+        'email_sent': outcome == 'alerted'
     })
 
 # Admin routes
@@ -266,11 +386,126 @@ def approve_user(current_user_id):
         'message': message
     })
 
-# ... keep existing code (get_high_stress_users, get_analytics functions)
+@app.route('/api/admin/metrics', methods=['GET'])
+@token_required
+@admin_required
+def get_metrics(current_user_id):
+    return jsonify({
+        'success': True,
+        'inference': api.batcher.get_metrics(),
+        'model': api.registry.get_status(),
+        'face_detection': api.face_detector.get_metrics(),
+        'face_tracking': api.face_tracker.get_metrics(),
+        'streams': get_stream_metrics(),
+        'image_store': api.images.get_metrics(),
+        'result_cache': api.result_cache.get_metrics(),
+        'database': api.db.get_metrics(),
+        'password_hashing': password_hasher.get_metrics(),
+        'login_limiter': login_limiter.get_metrics(),
+        'email_outbox': outbox.get_metrics() if outbox is not None else None,
+        'alerts': alerts.get_metrics(),
+        'retention': retention.get_metrics()
+    })
+
+@app.route('/api/admin/model/reload', methods=['POST'])
+@token_required
+@admin_required
+def reload_model(current_user_id):
+    # Swaps in new weights without dropping in-flight requests
+    reloaded = api.registry.reload()
+    
+    return jsonify({
+        'success': True,
+        'reloaded': reloaded,
+        'model': api.registry.get_status()
+    })
+
+@app.route('/api/admin/users/high-stress', methods=['GET'])
+@token_required
+@admin_required
+def get_high_stress_users(current_user_id):
+    # Both read the per-user stress summary rather than every stored result
+    users = api.db.get_high_stress_users()
+    overview = api.db.get_stress_overview()
+    
+    return jsonify({
+        'success': True,
+        'users': users,
+        **overview
+    })
+
+# Longest range the analytics endpoint serves
+MAX_ANALYTICS_DAYS = 366
+
+@app.route('/api/admin/analytics', methods=['GET'])
+@token_required
+@admin_required
+def get_analytics(current_user_id):
+    # Served from the hourly/daily rollups, never from raw results
+    try:
+        if request.args.get('start'):
+            start = datetime.fromisoformat(request.args['start'])
+            end = datetime.fromisoformat(request.args['end']) if request.args.get('end') else datetime.now()
+        else:
+            days = min(max(request.args.get('days', 30, type=int), 1), MAX_ANALYTICS_DAYS)
+            end = datetime.now()
+            start = (end - timedelta(days=days - 1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Invalid date range!'}), 400
+    
+    if end <= start or end - start > timedelta(days=MAX_ANALYTICS_DAYS):
+        return jsonify({'success': False, 'message': 'Invalid date range!'}), 400
+    
+    # Hourly buckets for short ranges, daily otherwise
+    granularity = request.args.get('granularity') or ('hour' if end - start <= timedelta(days=2) else 'day')
+    if granularity not in ('hour', 'day'):
+        return jsonify({'success': False, 'message': 'Granularity must be hour or day!'}), 400
+    
+    report = api.db.get_analytics(granularity, start, end)
+    overview = api.db.get_stress_overview()
+    
+    employees = []
+    for entry in report['high_stress_users']:
+        user = api.db.get_user_by_id(entry['user_id'])
+        if user:
+            employees.append({
+                'id': entry['user_id'],
+                'name': user['name'],
+                'email': user['email'],
+                'avgStress': entry['avg_score'],
+                'highStressRecords': entry['high']
+            })
+    
+    label = '%H:00' if granularity == 'hour' else '%b %d'
+    return jsonify({
+        'success': True,
+        'stats': {
+            'totalEmployees': overview['totalUsers'],
+            'avgStressLevel': report['summary']['mean'],
+            'highStressCases': report['summary']['high']
+        },
+        # One stacked bar per bucket; the schema has no departments to group by
+        'departmentData': [
+            {
+                'name': datetime.fromisoformat(bucket['bucket']).strftime(label),
+                'lowStress': bucket['low'],
+                'mediumStress': bucket['medium'],
+                'highStress': bucket['high']
+            }
+            for bucket in report['series']
+        ],
+        'employeeData': employees,
+        'granularity': granularity,
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'summary': report['summary'],
+        'series': report['series']
+    })
 
 # Modify the stress_results endpoint to also send notification for high stress
 @app.route('/api/stress/analyze', methods=['POST'])
 @token_required
+@model_required
 def analyze_image(current_user_id):
     # Check if user is approved
     user = api.db.get_user_by_id(current_user_id)
@@ -281,13 +516,11 @@ def analyze_image(current_user_id):
     if not user['is_approved']:
         return jsonify({'success': False, 'message': 'User account not approved!'}), 403
     
-    # Process the image
+    # Decode the image straight from the request; nothing touches the disk first
+    tracking_key = None
     if 'image' in request.files:
         # Process uploaded file
-        image_file = request.files['image']
-        filename = f"{current_user_id}_{datetime.now().strftime('%Y%m%d%H%M%S')}.jpg"
-        image_path = os.path.join(UPLOAD_FOLDER, filename)
-        image_file.save(image_path)
+        image_bytes = request.files['image'].read()
     
     elif 'image_data' in request.form:
         # Process base64 image data (from webcam)
@@ -298,13 +531,9 @@ def analyze_image(current_user_id):
                 image_data = image_data.split(',')[1]
             
             image_bytes = base64.b64decode(image_data)
-            nparr = np.frombuffer(image_bytes, np.uint8)
-            image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
             
-            # Save the image
-            filename = f"{current_user_id}_{datetime.now().strftime('%Y%m%d%H%M%S')}.jpg"
-            image_path = os.path.join(UPLOAD_FOLDER, filename)
-            cv2.imwrite(image_path, image)
+            # Webcam frames follow the face found in the previous frame of the session
+            tracking_key = webcam_session_key(current_user_id)
         
         except Exception as e:
             return jsonify({'success': False, 'message': f'Error processing image data: {str(e)}'}), 400
@@ -312,37 +541,212 @@ def analyze_image(current_user_id):
     else:
         return jsonify({'success': False, 'message': 'No image provided!'}), 400
     
-    # Process the image with the stress detection model
-    result = api.process_image(image_path, current_user_id)
+    image = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        return jsonify({'success': False, 'message': 'Could not decode image!'}), 400
     
-    # Send notification for high stress
-    if result.get('stress_level') == 'high':
-        email_subject = "Wellness Alert - High Stress Detected"
-        email_body = f"""
-        <html>
-        <body>
-            <h2>High Stress Alert</h2>
-            <p>Dear {user['name']},</p>
-            <p>Our system has detected a high level of stress in your recent analysis.</p>
-            <p>Your stress score: {result.get('stress_score')}%</p>
-            <p>We recommend taking a short break, practicing deep breathing, or consulting with our wellness resources.</p>
-            <p>Your wellbeing is important to us.</p>
-            <p>Best regards,<br>The Workplace Wellness Team</p>
-        </body>
-        </html>
-        """
-        send_email(user['email'], email_subject, email_body)
+    # Process the image with the stress detection model
+    annotations_only = wants_annotations_only()
+    try:
+        result = api.process_image(
+            image,
+            current_user_id,
+            tracking_key=tracking_key,
+            original_bytes=image_bytes,
+            annotate=not annotations_only
+        )
+    except InferenceBusy:
+        return inference_busy()
+    except WriteBufferFull:
+        return storage_busy()
+    
+    # The client draws the overlay itself; the image stays available on demand
+    if annotations_only and result.get('result_id'):
+        result['result_image_url'] = f"/api/stress/results/{result['result_id']}/image"
+    
+    # Alert on a sustained high average rather than on every high scan
+    if result.get('success') and result.get('stress_score') is not None:
+        alerts.observe(current_user_id, result['stress_score'])
     
     return jsonify(result)
 
+# Annotated result images are rendered on demand and cached by the client
+RESULT_IMAGE_VERSION = '1'
+
+def result_image_etag(result):
+    """ETag of a rendered result image
+
+    A result's scores never change, but retention later swaps its original
+    for a thumbnail, so the stored image key is part of the tag.
+    """
+    image_tag = hashlib.blake2b((result.get('image_path') or '').encode('utf-8'), digest_size=6).hexdigest()
+    return f"{result['id']}-{image_tag}-v{RESULT_IMAGE_VERSION}"
+
+@app.route('/api/stress/results/<result_id>/image', methods=['GET'])
+@token_required
+def get_result_image(current_user_id, result_id):
+    result = api.db.get_stress_result(result_id)
+    
+    if not result:
+        return jsonify({'success': False, 'message': 'Result not found!'}), 404
+    
+    # Users see their own results; admins see everyone's
+    if result['user_id'] != current_user_id:
+        user = api.db.get_user_by_id(current_user_id)
+        if not user or user['role'] != 'admin':
+            return jsonify({'success': False, 'message': 'Unauthorized access to result!'}), 403
+    
+    etag = result_image_etag(result)
+    if etag in request.if_none_match:
+        response = app.response_class(status=304)
+        response.set_etag(etag)
+        return response
+    
+    image_bytes = api.render_result_image(result)
+    if image_bytes is None:
+        return jsonify({'success': False, 'message': 'Result image not available!'}), 404
+    
+    response = app.response_class(image_bytes, mimetype='image/jpeg')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, max-age=86400'
+    return response
+
+# Live webcam stream: binary JPEG frames in, one compact JSON score per processed frame out
+@sock.route('/api/stress/stream')
+def stress_stream(ws):
+    # Browsers cannot set headers on a WebSocket, so the token may come as a query parameter
+    token = request.args.get('token')
+    auth_header = request.headers.get('Authorization', '')
+    if not token and auth_header.lower().startswith('bearer '):
+        token = auth_header.split(' ', 1)[1]
+    
+    try:
+        current_user_id = jwt.decode(token, app.config['SECRET_KEY'], algorithms=["HS256"])['user_id']
+    except:
+        ws.send(json.dumps({'error': 'Token is invalid!'}))
+        ws.close(reason=1008, message='Token is invalid!')
+        return
+    
+    user = api.db.get_user_by_id(current_user_id)
+    if not user or not user['is_approved']:
+        ws.send(json.dumps({'error': 'User account not approved!'}))
+        ws.close(reason=1008, message='User account not approved!')
+        return
+    
+    if not api.registry.is_ready():
+        ws.send(json.dumps({'error': 'Stress detection model is still loading, please retry shortly.'}))
+        ws.close(reason=1013, message='Model loading')
+        return
+    
+    tracking_key = f"{current_user_id}:{request.args.get('session_id') or 'stream'}"
+    last_recorded = [0.0]
+    
+    def process_frame(data):
+        image = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+        if image is None:
+            return {'error': 'Invalid JPEG frame'}
+        
+        try:
+            analysis = api.analyze_frame(image, current_user_id, tracking_key=tracking_key)
+        except InferenceBusy:
+            # Skip this frame; the next one is scored once the queue drains
+            return {'error': 'busy'}
+        if analysis is None:
+            return {'face': None}
+        
+        score = round(analysis['stress_score'], 1)
+        
+        # Keep the history at a sane rate instead of one row per frame
+        now = time.monotonic()
+        if now - last_recorded[0] >= STREAM_RECORD_INTERVAL:
+            try:
+                recorded = api.db.add_stress_result(
+                    user_id=current_user_id,
+                    stress_level=analysis['stress_level'],
+                    stress_score=score
+                )
+            except WriteBufferFull:
+                recorded = False
+            if recorded:
+                last_recorded[0] = now
+                alerts.observe(current_user_id, score)
+            else:
+                # Try again with the next frame rather than waiting a whole interval
+                print(f"Could not record a stream result for user {current_user_id}")
+        
+        return {
+            'face': list(analysis['face']),
+            'score': score,
+            'level': analysis['stress_level']
+        }
+    
+    try:
+        serve_frame_stream(ws, process_frame)
+    finally:
+        api.face_tracker.reset(tracking_key)
+
+def create_app():
+    """Start this process's services and return the app
+
+    Pre-fork servers (serve.py, or gunicorn with 'app:create_app()') import
+    this module before forking and call create_app() in each worker, so no
+    pool, thread or connection is shared across a fork. Later calls return
+    the same app.
+    """
+    global password_hasher, login_limiter, outbox, api, alerts, retention
+    with _services_lock:
+        if api is not None:
+            return app
+        
+        # Start the password hashing workers now rather than on the first login
+        password_hasher = get_password_hasher()
+        password_hasher.start()
+        
+        # Failed-login windows live in the shared state file, so all workers enforce one limit
+        login_limiter = get_login_limiter()
+        
+        # Durable queue of outgoing emails, sent by background threads over reused SMTP connections.
+        # A local SMTP stand-in without auth only needs EMAIL_USER, EMAIL_SERVER, EMAIL_PORT and EMAIL_USE_TLS=false.
+        outbox = EmailOutbox(EMAIL_SERVER, EMAIL_PORT, EMAIL_USER, EMAIL_PASSWORD) if EMAIL_USER else None
+        
+        # Initialize the stress detection API
+        stress_api = StressDetectionAPI()
+        
+        # High-stress alerts: one email when a user's average crosses the threshold, the rest in digests.
+        # Cooldowns and digests are kept in the shared state file, so workers never alert twice.
+        alerts = AlertManager(
+            send_email,
+            stress_api.db.get_user_by_id,
+            stress_api.db.get_high_stress_users,
+            stress_api.db.get_admins
+        )
+        
+        # Old uploads are downsized to thumbnails and eventually deleted in the background
+        retention = RetentionCompactor(stress_api.images, stress_api.db.update_image_paths)
+        if RETENTION_ENABLED:
+            retention.start()
+        
+        # Published last: requests arriving meanwhile wait on the lock in _start_services
+        api = stress_api
+        atexit.register(cleanup)
+    return app
+
+@app.before_request
+def _start_services():
+    # Servers pointed at app:app rather than create_app() start the services on the first request
+    if api is None:
+        create_app()
+
 # Cleanup function for when the application exits
 def cleanup():
+    retention.close()
+    alerts.close()
     api.close()
-
-# Register cleanup function
-import atexit
-atexit.register(cleanup)
+    password_hasher.close()
+    login_limiter.close()
+    if outbox is not None:
+        outbox.close()
 
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
-    app.run(debug=True, host='0.0.0.0', port=port)
+    create_app().run(debug=True, host='0.0.0.0', port=port)
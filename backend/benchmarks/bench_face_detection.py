@@ -0,0 +1,65 @@
+"""Face detection time on frames without a face: legacy sweep against FaceDetector
+
+The legacy path ran detectMultiScale up to six times at full resolution
+(3 scale factors x 2 minNeighbors values) before giving up.
+
+Run from the backend directory:
+    python benchmarks/bench_face_detection.py [--image path/to/frame.jpg] [--repeats 10]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from face_detection import FaceDetector
+
+
+def legacy_sweep(cascade, gray):
+    for scale in [1.05, 1.1, 1.2]:
+        for min_neighbors in [3, 5]:
+            detected = cascade.detectMultiScale(gray, scaleFactor=scale, minNeighbors=min_neighbors, minSize=(30, 30))
+            if len(detected) > 0:
+                return detected
+    return []
+
+
+def median_ms(fn, repeats):
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--image', help="optional frame to time in addition to the synthetic no-face frames")
+    parser.add_argument('--repeats', type=int, default=10)
+    args = parser.parse_args()
+
+    detector = FaceDetector()
+    rng = np.random.default_rng(0)
+    frames = {
+        '640x480 noise': rng.integers(0, 255, (480, 640), dtype=np.uint8),
+        '1280x720 noise': rng.integers(0, 255, (720, 1280), dtype=np.uint8),
+        '1920x1080 gradient': np.tile(np.linspace(0, 255, 1920, dtype=np.uint8), (1080, 1)),
+    }
+    if args.image:
+        frames[os.path.basename(args.image)] = cv2.cvtColor(cv2.imread(args.image), cv2.COLOR_BGR2GRAY)
+
+    print(f"{'frame':<22} {'legacy ms':>10} {'single pass ms':>15} {'speedup':>8}")
+    for name, gray in frames.items():
+        legacy = median_ms(lambda: legacy_sweep(detector.cascade, gray), args.repeats)
+        single = median_ms(lambda: detector.detect(gray), args.repeats)
+        print(f"{name:<22} {legacy:>10.1f} {single:>15.1f} {legacy / single:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
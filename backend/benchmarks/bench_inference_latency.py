@@ -0,0 +1,52 @@
+"""Single-image scoring latency: model.predict against the traced fast path
+
+Run from the backend directory:
+    python benchmarks/bench_inference_latency.py [--repeats 200]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from image_processor import StressDetector
+
+
+def percentiles(fn, repeats):
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return samples[len(samples) // 2], samples[int(len(samples) * 0.99) - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeats', type=int, default=200)
+    args = parser.parse_args()
+
+    detector = StressDetector()
+    face = np.random.rand(1, 48, 48, 1).astype(np.float32)
+
+    paths = [
+        ('model.predict', lambda: detector.model.predict(face, verbose=0)),
+        ('fast path', lambda: detector.registry.get().predictor(face)),
+        ('fast path via batcher', lambda: detector.batcher.predict(face)),
+    ]
+
+    print(f"{'path':<24} {'p50 ms':>8} {'p99 ms':>8}")
+    for name, fn in paths:
+        fn()
+        p50, p99 = percentiles(fn, args.repeats)
+        print(f"{name:<24} {p50:>8.2f} {p99:>8.2f}")
+
+    detector.batcher.stop()
+
+
+if __name__ == '__main__':
+    main()
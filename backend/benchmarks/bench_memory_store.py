@@ -0,0 +1,108 @@
+"""In-memory storage: the old list scans against the indexed MemoryStore
+
+The defaults (100k users, 10M results) need several GB of RAM for the
+results alone; pass smaller sizes for a quick run.
+
+Run from the backend directory:
+    python benchmarks/bench_memory_store.py [--users 100000] [--results 10000000] [--lookups 200]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from memory_store import MemoryStore
+
+
+class LegacyLists:
+    """The list-based fallback Database used before MemoryStore"""
+
+    def __init__(self):
+        self.users = []
+        self.stress_results = []
+
+    def get_user_by_id(self, user_id):
+        for user in self.users:
+            if user.get('id') == user_id:
+                user_copy = user.copy()
+                user_copy.pop('password', None)
+                return user_copy
+        return None
+
+    def get_user_by_email(self, email):
+        for user in self.users:
+            if user.get('email') == email:
+                return user.copy()
+        return None
+
+    def get_stress_results(self, user_id, limit=10):
+        user_results = [r for r in self.stress_results if r.get('user_id') == user_id]
+        user_results.sort(key=lambda x: x.get('created_at'), reverse=True)
+        if limit > 0:
+            user_results = user_results[:limit]
+        # Copies here; the original also overwrote created_at in place
+        return [dict(r, created_at=r['created_at'].isoformat()) for r in user_results]
+
+
+def median_ms(fn, args_list):
+    samples = []
+    for args in args_list:
+        start = time.perf_counter()
+        fn(*args)
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=100000)
+    parser.add_argument('--results', type=int, default=10000000)
+    parser.add_argument('--lookups', type=int, default=200)
+    parser.add_argument('--legacy-lookups', type=int, default=5,
+                        help="lookups timed on the list scans, which take seconds each at full size")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    store = MemoryStore()
+    legacy = LegacyLists()
+    user_ids = [f"user-{i}" for i in range(args.users)]
+
+    start = time.perf_counter()
+    for i, user_id in enumerate(user_ids):
+        store.add_user(user_id, f"User {i}", f"user{i}@example.com", 'hash')
+        legacy.users.append(store.get_user_by_email(f"user{i}@example.com"))
+    base = datetime(2024, 1, 1)
+    for i in range(args.results):
+        user_id = user_ids[rng.randrange(args.users)]
+        score = rng.uniform(0, 100)
+        created_at = base + timedelta(seconds=i)
+        store.add_stress_result(f"result-{i}", user_id, 'high' if score >= 80 else 'low', score, created_at=created_at)
+        legacy.stress_results.append(store._results[f"result-{i}"])
+    print(f"loaded {args.users} users and {args.results} results in {time.perf_counter() - start:.1f}s")
+
+    ids = [(rng.choice(user_ids),) for _ in range(args.lookups)]
+    emails = [(f"user{rng.randrange(args.users)}@example.com",) for _ in range(args.lookups)]
+    legacy_ids, legacy_emails = ids[:args.legacy_lookups], emails[:args.legacy_lookups]
+
+    print(f"{'operation':<24} {'lists ms':>10} {'indexed ms':>11} {'speedup':>9}")
+    for name, legacy_fn, store_fn, indexed_args, list_args in [
+        ('get_user_by_id', legacy.get_user_by_id, store.get_user_by_id, ids, legacy_ids),
+        ('get_user_by_email', legacy.get_user_by_email, store.get_user_by_email, emails, legacy_emails),
+        ('get_stress_results(10)', legacy.get_stress_results, store.get_stress_results, ids, legacy_ids),
+    ]:
+        old = median_ms(legacy_fn, list_args)
+        new = median_ms(store_fn, indexed_args)
+        print(f"{name:<24} {old:>10.3f} {new:>11.4f} {old / new:>8.0f}x")
+
+    start = time.perf_counter()
+    store.get_high_stress_users()
+    print(f"get_high_stress_users: {(time.perf_counter() - start) * 1000:.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""Latency of StressDetector.process_image against the number of detected faces
+
+Compares the old per-face loop (one model.predict call per face) with the
+vectorized path that scores every face in one forward pass.
+
+Run from the backend directory:
+    python benchmarks/bench_multi_face.py [--repeats 20] [--max-faces 16]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from image_processor import StressDetector
+
+
+def synthetic_frame(face_count, face_size=96):
+    """Build a frame with face_count tiles and matching face boxes"""
+    columns = int(np.ceil(np.sqrt(face_count)))
+    rows = int(np.ceil(face_count / columns))
+    image = np.random.randint(0, 255, (rows * face_size, columns * face_size, 3), dtype=np.uint8)
+    faces = np.array([
+        ((i % columns) * face_size, (i // columns) * face_size, face_size, face_size)
+        for i in range(face_count)
+    ], dtype=np.int32)
+    return image, faces
+
+
+def per_face_loop(detector, gray, faces):
+    """The pre-vectorization scoring path"""
+    scores = []
+    for (x, y, w, h) in faces:
+        face = detector.preprocess_face(gray[y:y+h, x:x+w])
+        scores.append(float(detector.model.predict(face, verbose=0)[0][0]))
+    return scores
+
+
+def vectorized(detector, gray, faces):
+    """One preallocated batch and a single forward pass"""
+    return detector.batcher.predict(detector.preprocess_faces(gray, faces))
+
+
+def measure(fn, repeats):
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeats', type=int, default=20)
+    parser.add_argument('--max-faces', type=int, default=16)
+    args = parser.parse_args()
+
+    detector = StressDetector()
+    face_counts = [n for n in (1, 2, 4, 8, 12, 16, 32, 64) if n <= args.max_faces]
+
+    # Warm both paths so one-time graph construction is not measured
+    image, faces = synthetic_frame(max(face_counts))
+    gray = image[:, :, 0].copy()
+    per_face_loop(detector, gray, faces[:1])
+    vectorized(detector, gray, faces)
+
+    print(f"{'faces':>5} {'per-face ms':>12} {'vectorized ms':>14} {'speedup':>8}")
+    for count in face_counts:
+        image, faces = synthetic_frame(count)
+        gray = image[:, :, 0].copy()
+        loop_ms = measure(lambda: per_face_loop(detector, gray, faces), args.repeats)
+        batch_ms = measure(lambda: vectorized(detector, gray, faces), args.repeats)
+        print(f"{count:>5} {loop_ms:>12.1f} {batch_ms:>14.1f} {loop_ms / batch_ms:>7.1f}x")
+
+    detector.batcher.stop()
+
+
+if __name__ == '__main__':
+    main()
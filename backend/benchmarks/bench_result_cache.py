@@ -0,0 +1,80 @@
+"""Steady-state webcam session with and without the perceptual result cache
+
+Frames are one still scene plus per-frame sensor noise and a slow brightness
+drift, sent at the given frame rate, which is what a user sitting still in
+front of the camera looks like.
+
+Run from the backend directory:
+    python benchmarks/bench_result_cache.py [--image path/to/frame.jpg] [--frames 300] [--fps 15]
+"""
+import argparse
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from image_processor import StressDetector
+from result_cache import PerceptualCache
+
+
+def webcam_frames(base, count, rng):
+    for i in range(count):
+        noise = rng.normal(0, 3, base.shape)
+        drift = 4 * np.sin(i / 30.0)
+        yield np.clip(base.astype(np.float32) + noise + drift, 0, 255).astype(np.uint8)
+
+
+def run_session(detector, frames, fps):
+    # The clock is simulated so the TTL sees the session's frame rate
+    clock = [0.0]
+    real_monotonic = time.monotonic
+    time.monotonic = lambda: clock[0]
+    try:
+        start = time.perf_counter()
+        for i, frame in enumerate(frames):
+            clock[0] = i / float(fps)
+            detector.analyze_frame(frame, detection_key='bench', tracking_key='bench:webcam')
+        return (time.perf_counter() - start) * 1000 / len(frames)
+    finally:
+        time.monotonic = real_monotonic
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--image', help="frame to use as the still scene (a face makes the CNN run)")
+    parser.add_argument('--frames', type=int, default=300)
+    parser.add_argument('--fps', type=float, default=15)
+    args = parser.parse_args()
+
+    if args.image:
+        base = cv2.imread(args.image)
+    else:
+        base = np.tile(np.linspace(40, 220, 640, dtype=np.uint8), (480, 1))
+        base = cv2.cvtColor(base, cv2.COLOR_GRAY2BGR)
+        cv2.circle(base, (320, 220), 90, (180, 170, 160), -1)
+
+    detector = StressDetector()
+    detector.registry.wait_until_ready()
+    rng = np.random.default_rng(0)
+    frames = list(webcam_frames(base, args.frames, rng))
+
+    detector.result_cache = PerceptualCache(max_entries=0)
+    uncached = run_session(detector, frames, args.fps)
+
+    detector.result_cache = PerceptualCache()
+    detector.face_tracker.reset('bench:webcam')
+    cached = run_session(detector, frames, args.fps)
+    metrics = detector.result_cache.get_metrics()
+
+    print(f"frames: {args.frames} at {args.fps:g} fps, ttl {metrics['ttl']:g}s, max distance {metrics['max_distance']}")
+    print(f"without cache: {uncached:.2f} ms/frame")
+    print(f"with cache:    {cached:.2f} ms/frame ({uncached / cached:.1f}x)")
+    print(f"hit rate:      {metrics['hit_rate']:.1%} ({metrics['hits']} hits, {metrics['misses']} misses)")
+
+
+if __name__ == '__main__':
+    main()
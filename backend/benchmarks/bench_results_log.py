@@ -0,0 +1,95 @@
+"""Result history reads: listdir + json.load per file against the per-user ResultsLog
+
+Writes --results result files for --users users into a temporary directory
+the way api.py used to, and the same results into a ResultsLog, then times
+reading one user's newest results both ways.
+
+Run from the backend directory:
+    python benchmarks/bench_results_log.py [--users 1000] [--results 200000] [--limit 20]
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from results_log import ResultsLog
+
+
+def legacy_results(upload_dir, user_id):
+    """get_user_results before ResultsLog"""
+    results = []
+    for filename in os.listdir(upload_dir):
+        if filename.startswith(f"{user_id}_") and filename.endswith("_result.json"):
+            with open(os.path.join(upload_dir, filename), 'r') as f:
+                results.append(json.load(f))
+    results.sort(key=lambda x: x.get('timestamp', ''), reverse=True)
+    return results
+
+
+def median_ms(fn, runs):
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--results', type=int, default=200000)
+    parser.add_argument('--limit', type=int, default=20)
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    workdir = tempfile.mkdtemp(prefix='bench_results_log_')
+    upload_dir = os.path.join(workdir, 'uploads')
+    os.makedirs(upload_dir)
+    log = ResultsLog(root=os.path.join(workdir, 'results_log'))
+    user_ids = [f"user-{i}" for i in range(args.users)]
+
+    try:
+        start = time.perf_counter()
+        base = datetime(2024, 1, 1)
+        for i in range(args.results):
+            user_id = user_ids[rng.randrange(args.users)]
+            created_at = base + timedelta(seconds=i)
+            record = {
+                'success': True,
+                'user_id': user_id,
+                'stress_level': 'low',
+                'stress_score': round(rng.uniform(0, 100), 1),
+                'faces': [{'box': [10, 20, 100, 100], 'score': 42.0, 'level': 'low'}],
+                'timestamp': created_at.isoformat(),
+            }
+            # The old file names only had second resolution; the index keeps names unique here
+            with open(os.path.join(upload_dir, f"{user_id}_{created_at:%Y%m%d_%H%M%S}_{i}_result.json"), 'w') as f:
+                json.dump(record, f)
+            log.append(user_id, record)
+        print(f"wrote {args.results} results for {args.users} users in {time.perf_counter() - start:.1f}s")
+
+        user_id = user_ids[0]
+        newest = [record['timestamp'] for record in log.newest(user_id, args.limit)[0]]
+        expected = [record['timestamp'] for record in legacy_results(upload_dir, user_id)[:args.limit]]
+        assert newest == expected, "ResultsLog returned different results"
+
+        old = median_ms(lambda: legacy_results(upload_dir, user_id)[:args.limit], args.runs)
+        new = median_ms(lambda: log.newest(user_id, args.limit), args.runs * 20)
+        print(f"{'newest ' + str(args.limit):<16} {'listdir ms':>11} {'log ms':>9} {'speedup':>9}")
+        print(f"{'':<16} {old:>11.2f} {new:>9.3f} {old / new:>8.0f}x")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+"""Requests per second: the threaded Flask dev server against serve.py's pre-fork workers
+
+Starts app.py both ways in a temporary directory (in-memory database, no
+email), waits until it reports ready, then has --clients client processes
+send keep-alive GET requests to --path for --seconds each time.
+
+Run from the backend directory:
+    python benchmarks/bench_serving.py [--workers 4] [--threads 8] [--clients 16] [--seconds 10]
+"""
+import argparse
+import http.client
+import multiprocessing
+import os
+import shutil
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+DEV_SERVER = "import sys, app; app.create_app().run(host='127.0.0.1', port=int(sys.argv[1]), threaded=True)"
+
+
+def start_server(command, workdir):
+    env = dict(os.environ, DB_BACKEND='memory', EMAIL_USER='', PYTHONPATH=BACKEND_DIR, TF_CPP_MIN_LOG_LEVEL='3')
+    return subprocess.Popen(command, cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def wait_ready(port, timeout=180):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=2)
+            conn.request('GET', '/api/health/ready')
+            if conn.getresponse().status == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f"Server on port {port} not ready after {timeout}s")
+
+
+def client(port, path, seconds, results):
+    latencies = []
+    errors = 0
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        start = time.perf_counter()
+        try:
+            conn.request('GET', path)
+            response = conn.getresponse()
+            response.read()
+            if response.status != 200:
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+        except (OSError, http.client.HTTPException):
+            errors += 1
+            conn.close()
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+    results.put((latencies, errors))
+
+
+def load(port, path, clients, seconds):
+    results = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=client, args=(port, path, seconds, results)) for _ in range(clients)]
+    for process in processes:
+        process.start()
+    latencies, errors = [], 0
+    for _ in processes:
+        client_latencies, client_errors = results.get()
+        latencies.extend(client_latencies)
+        errors += client_errors
+    for process in processes:
+        process.join()
+    latencies.sort()
+    return {
+        'rps': len(latencies) / seconds,
+        'p50_ms': statistics.median(latencies) * 1000 if latencies else 0.0,
+        'p99_ms': latencies[int(len(latencies) * 0.99)] * 1000 if latencies else 0.0,
+        'errors': errors,
+    }
+
+
+def run(command, port, args):
+    workdir = tempfile.mkdtemp(prefix='bench_serving_')
+    server = start_server(command, workdir)
+    try:
+        wait_ready(port)
+        load(port, args.path, args.clients, 1)  # warm up
+        return load(port, args.path, args.clients, args.seconds)
+    finally:
+        server.send_signal(signal.SIGTERM)
+        try:
+            server.wait(60)
+        except subprocess.TimeoutExpired:
+            server.kill()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--path', default='/api/health/ready')
+    parser.add_argument('--port', type=int, default=5099)
+    args = parser.parse_args()
+
+    dev = run([sys.executable, '-c', DEV_SERVER, str(args.port)], args.port, args)
+    serve = run([
+        sys.executable, os.path.join(BACKEND_DIR, 'serve.py'),
+        '--workers', str(args.workers), '--threads', str(args.threads), '--bind', f'127.0.0.1:{args.port}'
+    ], args.port, args)
+
+    print(f"GET {args.path}, {args.clients} keep-alive clients, {args.seconds:.0f}s")
+    print(f"{'server':<28} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    for name, result in (('flask dev server (threaded)', dev), (f'serve.py {args.workers}x{args.threads}', serve)):
+        print(f"{name:<28} {result['rps']:>9.0f} {result['p50_ms']:>8.2f} {result['p99_ms']:>8.2f} {result['errors']:>7}")
+    print(f"speedup {serve['rps'] / dev['rps']:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
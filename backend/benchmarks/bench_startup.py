@@ -0,0 +1,59 @@
+"""Worker startup time: import to first served request, and to model readiness
+
+Each run happens in a fresh interpreter so import costs are measured cold.
+
+Run from the backend directory:
+    python benchmarks/bench_startup.py [--app app] [--runs 3]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = r"""
+import json, sys, time
+start = time.perf_counter()
+module = __import__(sys.argv[1])
+imported = time.perf_counter()
+client = module.app.test_client()
+live = client.get('/api/health/live')
+served = time.perf_counter()
+while client.get('/api/health/ready').status_code != 200:
+    time.sleep(0.05)
+    if time.perf_counter() - start > 300:
+        break
+ready = time.perf_counter()
+print(json.dumps({
+    'import_s': imported - start,
+    'first_request_s': served - start,
+    'ready_s': ready - start,
+    'live_status': live.status_code,
+}))
+"""
+
+
+def run_once(app_module):
+    output = subprocess.run(
+        [sys.executable, '-c', CHILD, app_module],
+        cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--app', default='app', help="backend module to start (app or api)")
+    parser.add_argument('--runs', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'run':>3} {'import s':>9} {'first request s':>16} {'model ready s':>14}")
+    for run in range(1, args.runs + 1):
+        timings = run_once(args.app)
+        print(f"{run:>3} {timings['import_s']:>9.2f} {timings['first_request_s']:>16.2f} {timings['ready_s']:>14.2f}")
+
+
+if __name__ == '__main__':
+    main()
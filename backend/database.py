@@ -1,14 +1,39 @@
 
 import mysql.connector
-from mysql.connector import Error
+from mysql.connector import Error, IntegrityError, DataError
 import os
+import json
 from datetime import datetime
+from contextlib import contextmanager
 import logging
+from db_pool import ConnectionPool
+from memory_store import MemoryStore
+from stress_stats import HIGH_STRESS_THRESHOLD, MEDIUM_STRESS_THRESHOLD, stats_dict, ewma_step
+from write_behind import WriteBehindBuffer
+from migrations import apply_migrations, schema_lock
+from user_cache import UserCache
+import analytics
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Column order of the rows written by _insert_stress_results
+STRESS_RESULT_COLUMNS = ('id', 'user_id', 'stress_level', 'stress_score', 'image_path', 'faces', 'notes', 'created_at')
+
+def encode_cursor(created_at, result_id):
+    """Pagination cursor pointing just past a result: '<created_at ISO>,<id>'"""
+    if isinstance(created_at, str):
+        created_at = datetime.fromisoformat(created_at)
+    return f"{created_at.isoformat()},{result_id}"
+
+def parse_cursor(cursor):
+    """Parse a pagination cursor into (created_at, id); raises ValueError if malformed"""
+    created_at, separator, result_id = cursor.partition(',')
+    if not separator or not result_id:
+        raise ValueError("Cursor must be '<created_at>,<id>'")
+    return datetime.fromisoformat(created_at), result_id
+
 class Database:
     def __init__(self):
         # Get database configuration from environment variables
@@ -16,87 +41,201 @@ class Database:
         self.database = os.environ.get('DB_NAME', 'stress_detection')
         self.user = os.environ.get('DB_USER', 'root')
         self.password = os.environ.get('DB_PASSWORD', '')
+        self.connect_timeout = int(os.environ.get('DB_CONNECT_TIMEOUT', 5))
+        # 'mysql' (falling back to memory when unreachable) or 'memory' for tests and development
+        self.backend = os.environ.get('DB_BACKEND', 'mysql').lower()
+        # Buffer stress results and group-commit them in the background (MySQL only)
+        self.write_behind = os.environ.get('DB_WRITE_BEHIND', 'false').lower() in ('1', 'true', 'yes')
         
-        self.connection = None
-        self.connect()
+        self.pool = None
+        self.results_buffer = None
+        # Identity lookups happen on every authenticated request; MySQL reads go through this
+        self.user_cache = UserCache()
+        if self.backend == 'memory':
+            self._use_memory()
+        else:
+            self.connect()
         self.create_tables()
+        
+        if self.write_behind and not hasattr(self, 'in_memory'):
+            # Only rows MySQL refuses are split out and dropped; outages are retried
+            self.results_buffer = WriteBehindBuffer(self._flush_stress_results,
+                                                    data_errors=(IntegrityError, DataError))
+            logger.info("Stress results are written behind in batches")
+    
+    def _open_connection(self):
+        """Open one new MySQL connection for the pool"""
+        return mysql.connector.connect(
+            host=self.host,
+            database=self.database,
+            user=self.user,
+            password=self.password,
+            connection_timeout=self.connect_timeout
+        )
     
     def connect(self):
-        """Connect to the MySQL database"""
+        """Create the connection pool and check that MySQL is reachable"""
         try:
-            self.connection = mysql.connector.connect(
-                host=self.host,
-                database=self.database,
-                user=self.user,
-                password=self.password
-            )
-            
-            if self.connection.is_connected():
-                logger.info(f"Connected to MySQL database: {self.database}")
+            self.pool = ConnectionPool(self._open_connection)
+            with self.pool.connection() as connection:
+                if connection.is_connected():
+                    logger.info(f"Connected to MySQL database: {self.database} (pool size {self.pool.size})")
         except Error as e:
             logger.error(f"Error connecting to MySQL database: {e}")
             
             # Fall back to in-memory storage if database connection fails
-            self.users = []
-            self.stress_results = []
-            self.in_memory = True
-            logger.info("Using in-memory storage instead of database")
+            self._use_memory()
+    
+    def _use_memory(self):
+        """Switch to the in-memory storage engine"""
+        if self.pool is not None:
+            self.pool.close()
+        self.memory = MemoryStore()
+        self.in_memory = True
+        logger.info("Using in-memory storage instead of database")
+    
+    @contextmanager
+    def _cursor(self, dictionary=False, commit=False):
+        """Check out a pooled connection and a cursor on it for one operation"""
+        with self.pool.connection() as connection:
+            cursor = connection.cursor(dictionary=dictionary)
+            try:
+                yield cursor
+                if commit:
+                    connection.commit()
+            finally:
+                cursor.close()
     
     def create_tables(self):
-        """Create necessary tables if they don't exist"""
+        """Create necessary tables if they don't exist
+
+        A reachable MySQL whose schema cannot be created or migrated fails
+        startup: falling back to memory would quietly keep data in this
+        process only.
+        """
         if not hasattr(self, 'in_memory'):
             try:
-                cursor = self.connection.cursor()
-                
-                # Create users table
-                cursor.execute("""
-                CREATE TABLE IF NOT EXISTS users (
-                    id VARCHAR(36) PRIMARY KEY,
-                    name VARCHAR(100) NOT NULL,
-                    email VARCHAR(100) UNIQUE NOT NULL,
-                    password VARCHAR(255) NOT NULL,
-                    role ENUM('admin', 'user') DEFAULT 'user',
-                    is_approved BOOLEAN DEFAULT FALSE,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-                """)
-                
-                # Create stress_results table
-                cursor.execute("""
-                CREATE TABLE IF NOT EXISTS stress_results (
-                    id VARCHAR(36) PRIMARY KEY,
-                    user_id VARCHAR(36) NOT NULL,
-                    stress_level ENUM('low', 'medium', 'high') NOT NULL,
-                    stress_score FLOAT NOT NULL,
-                    image_path VARCHAR(255),
-                    notes TEXT,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (user_id) REFERENCES users(id)
-                )
-                """)
-                
-                self.connection.commit()
+                with self._cursor(commit=True) as cursor:
+                    # Workers of a pre-fork server start together; one at a time changes the schema
+                    with schema_lock(cursor, self.database):
+                        self._create_tables(cursor)
                 logger.info("Database tables created successfully")
-                cursor.close()
             except Error as e:
                 logger.error(f"Error creating tables: {e}")
-                
-                # If we can't create tables, initialize in-memory storage
-                self.users = []
-                self.stress_results = []
-                self.in_memory = True
-                logger.info("Using in-memory storage instead of database")
-        else:
-            # Initialize in-memory data structures
-            self.users = []
-            self.stress_results = []
+                self.pool.close()
+                raise
+    
+    def _create_tables(self, cursor):
+        """Create the tables on a fresh database and upgrade older ones"""
+        # Create users table
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS users (
+            id VARCHAR(36) PRIMARY KEY,
+            name VARCHAR(100) NOT NULL,
+            email VARCHAR(100) UNIQUE NOT NULL,
+            password VARCHAR(255) NOT NULL,
+            role ENUM('admin', 'user') DEFAULT 'user',
+            is_approved BOOLEAN DEFAULT FALSE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """)
+        
+        # Create stress_results table
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS stress_results (
+            id VARCHAR(36) PRIMARY KEY,
+            user_id VARCHAR(36) NOT NULL,
+            stress_level ENUM('low', 'medium', 'high') NOT NULL,
+            stress_score FLOAT NOT NULL,
+            image_path VARCHAR(255),
+            faces TEXT,
+            notes TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        )
+        """)
+        
+        # Tables created by older versions lack the face annotations column
+        self._ensure_column(cursor, 'stress_results', 'faces', 'TEXT AFTER image_path')
+        
+        # Per-user running summary, kept up to date by add_stress_result
+        stats_existed = self._table_exists(cursor, 'user_stress_stats')
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS user_stress_stats (
+            user_id VARCHAR(36) PRIMARY KEY,
+            result_count INT NOT NULL DEFAULT 0,
+            score_sum DOUBLE NOT NULL DEFAULT 0,
+            score_sum_sq DOUBLE NOT NULL DEFAULT 0,
+            avg_score DOUBLE NOT NULL DEFAULT 0,
+            last_score FLOAT,
+            last_level ENUM('low', 'medium', 'high'),
+            ewma DOUBLE,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+            INDEX idx_user_stress_stats_avg (avg_score),
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        )
+        """)
+        if not stats_existed:
+            self._backfill_stress_stats(cursor)
+        
+        apply_migrations(cursor)
+    
+    def _table_exists(self, cursor, table):
+        cursor.execute(
+            "SELECT COUNT(*) FROM information_schema.TABLES WHERE TABLE_SCHEMA = %s AND TABLE_NAME = %s",
+            (self.database, table)
+        )
+        return cursor.fetchone()[0] > 0
+    
+    def _backfill_stress_stats(self, cursor):
+        """Build user_stress_stats from existing results; the EWMA starts at each user's average"""
+        cursor.execute("""
+        INSERT IGNORE INTO user_stress_stats
+            (user_id, result_count, score_sum, score_sum_sq, avg_score, last_score, last_level, ewma)
+        SELECT agg.user_id, agg.result_count, agg.score_sum, agg.score_sum_sq, agg.avg_score,
+               sr.stress_score, sr.stress_level, agg.avg_score
+        FROM (
+            SELECT user_id, COUNT(*) AS result_count, SUM(stress_score) AS score_sum,
+                   SUM(stress_score * stress_score) AS score_sum_sq, AVG(stress_score) AS avg_score,
+                   MAX(created_at) AS newest
+            FROM stress_results
+            GROUP BY user_id
+        ) agg
+        JOIN stress_results sr ON sr.user_id = agg.user_id AND sr.created_at = agg.newest
+        """)
+        if cursor.rowcount:
+            logger.info(f"Backfilled stress stats for {cursor.rowcount} users")
+    
+    def _ensure_column(self, cursor, table, column, definition):
+        """Add a column to an existing table if it is missing"""
+        cursor.execute(
+            "SELECT COUNT(*) FROM information_schema.COLUMNS WHERE TABLE_SCHEMA = %s AND TABLE_NAME = %s AND COLUMN_NAME = %s",
+            (self.database, table, column)
+        )
+        if cursor.fetchone()[0] == 0:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+            logger.info(f"Added column {table}.{column}")
     
     def close(self):
-        """Close the database connection"""
-        if hasattr(self, 'connection') and self.connection and not hasattr(self, 'in_memory'):
-            if self.connection.is_connected():
-                self.connection.close()
-                logger.info("MySQL connection closed")
+        """Flush buffered results and close the pooled database connections"""
+        if self.results_buffer is not None:
+            self.results_buffer.close()
+        if self.pool is not None and not hasattr(self, 'in_memory'):
+            self.pool.close()
+            logger.info("MySQL connections closed")
+    
+    def is_healthy(self):
+        """Check that the storage backend can serve queries"""
+        if hasattr(self, 'in_memory'):
+            return True
+        
+        try:
+            with self.pool.connection() as connection:
+                connection.ping(reconnect=False)
+            return True
+        except Error as e:
+            logger.error(f"Database health check failed: {e}")
+            return False
     
     # User management methods
     def add_user(self, name, email, password, role='user'):
@@ -104,41 +243,22 @@ class Database:
         user_id = self._generate_id()
         
         if hasattr(self, 'in_memory'):
-            # Check if email already exists
-            if any(u.get('email') == email for u in self.users):
-                return False, "Email already exists"
-            
-            # Add user to in-memory storage
-            self.users.append({
-                'id': user_id,
-                'name': name,
-                'email': email,
-                'password': password,
-                'role': role,
-                'is_approved': role == 'admin',  # Auto-approve admins
-                'created_at': datetime.now()
-            })
-            
-            return True, "User registered successfully"
+            return self.memory.add_user(user_id, name, email, password, role)
         else:
             try:
-                cursor = self.connection.cursor()
-                
-                # Check if email already exists
-                cursor.execute("SELECT id FROM users WHERE email = %s", (email,))
-                if cursor.fetchone():
-                    cursor.close()
-                    return False, "Email already exists"
-                
-                # Insert new user
-                is_approved = 1 if role == 'admin' else 0  # Auto-approve admins
-                cursor.execute(
-                    "INSERT INTO users (id, name, email, password, role, is_approved) VALUES (%s, %s, %s, %s, %s, %s)",
-                    (user_id, name, email, password, role, is_approved)
-                )
-                
-                self.connection.commit()
-                cursor.close()
+                with self._cursor(commit=True) as cursor:
+                    # Check if email already exists
+                    cursor.execute("SELECT id FROM users WHERE email = %s", (email,))
+                    if cursor.fetchone():
+                        return False, "Email already exists"
+                    
+                    # Insert new user
+                    is_approved = 1 if role == 'admin' else 0  # Auto-approve admins
+                    cursor.execute(
+                        "INSERT INTO users (id, name, email, password, role, is_approved) VALUES (%s, %s, %s, %s, %s, %s)",
+                        (user_id, name, email, password, role, is_approved)
+                    )
+                self.user_cache.invalidate(user_id=user_id, email=email)
                 return True, "User registered successfully"
             except Error as e:
                 logger.error(f"Error adding user: {e}")
@@ -147,19 +267,17 @@ class Database:
     def get_user_by_id(self, user_id):
         """Get user by ID"""
         if hasattr(self, 'in_memory'):
-            for user in self.users:
-                if user.get('id') == user_id:
-                    # Return a copy without password
-                    user_copy = user.copy()
-                    user_copy.pop('password', None)
-                    return user_copy
-            return None
+            return self.memory.get_user_by_id(user_id)
         else:
+            user = self.user_cache.get('id', user_id)
+            if user is not None:
+                return user
+            generation = self.user_cache.generation
             try:
-                cursor = self.connection.cursor(dictionary=True)
-                cursor.execute("SELECT id, name, email, role, is_approved, created_at FROM users WHERE id = %s", (user_id,))
-                user = cursor.fetchone()
-                cursor.close()
+                with self._cursor(dictionary=True) as cursor:
+                    cursor.execute("SELECT id, name, email, role, is_approved, created_at FROM users WHERE id = %s", (user_id,))
+                    user = cursor.fetchone()
+                self.user_cache.put('id', user_id, user, generation)
                 return user
             except Error as e:
                 logger.error(f"Error getting user: {e}")
@@ -168,16 +286,17 @@ class Database:
     def get_user_by_email(self, email):
         """Get user by email (including password for authentication)"""
         if hasattr(self, 'in_memory'):
-            for user in self.users:
-                if user.get('email') == email:
-                    return user.copy()
-            return None
+            return self.memory.get_user_by_email(email)
         else:
+            user = self.user_cache.get('email', email)
+            if user is not None:
+                return user
+            generation = self.user_cache.generation
             try:
-                cursor = self.connection.cursor(dictionary=True)
-                cursor.execute("SELECT * FROM users WHERE email = %s", (email,))
-                user = cursor.fetchone()
-                cursor.close()
+                with self._cursor(dictionary=True) as cursor:
+                    cursor.execute("SELECT * FROM users WHERE email = %s", (email,))
+                    user = cursor.fetchone()
+                self.user_cache.put('email', email, user, generation)
                 return user
             except Error as e:
                 logger.error(f"Error getting user by email: {e}")
@@ -186,22 +305,17 @@ class Database:
     def approve_user(self, user_id):
         """Approve a user"""
         if hasattr(self, 'in_memory'):
-            for user in self.users:
-                if user.get('id') == user_id:
-                    user['is_approved'] = True
-                    return True, "User approved successfully"
-            return False, "User not found"
+            return self.memory.approve_user(user_id)
         else:
             try:
-                cursor = self.connection.cursor()
-                cursor.execute("UPDATE users SET is_approved = TRUE WHERE id = %s", (user_id,))
-                self.connection.commit()
+                with self._cursor(commit=True) as cursor:
+                    cursor.execute("UPDATE users SET is_approved = TRUE WHERE id = %s", (user_id,))
+                    updated = cursor.rowcount
+                self.user_cache.invalidate(user_id=user_id)
                 
-                if cursor.rowcount == 0:
-                    cursor.close()
+                if updated == 0:
                     return False, "User not found"
                 
-                cursor.close()
                 return True, "User approved successfully"
             except Error as e:
                 logger.error(f"Error approving user: {e}")
@@ -210,92 +324,167 @@ class Database:
     def get_pending_users(self):
         """Get users pending approval"""
         if hasattr(self, 'in_memory'):
-            result = []
-            for user in self.users:
-                if not user.get('is_approved') and user.get('role') == 'user':
-                    user_copy = {
-                        'id': user.get('id'),
-                        'name': user.get('name'),
-                        'email': user.get('email'),
-                        'registeredAt': user.get('created_at').isoformat()
-                    }
-                    result.append(user_copy)
-            return result
+            return self.memory.get_pending_users()
         else:
             try:
-                cursor = self.connection.cursor(dictionary=True)
-                cursor.execute(
-                    "SELECT id, name, email, created_at as registeredAt FROM users WHERE is_approved = FALSE AND role = 'user'"
-                )
-                users = cursor.fetchall()
-                cursor.close()
+                with self._cursor(dictionary=True) as cursor:
+                    cursor.execute(
+                        "SELECT id, name, email, created_at as registeredAt FROM users WHERE is_approved = FALSE AND role = 'user'"
+                    )
+                    users = cursor.fetchall()
                 return users
             except Error as e:
                 logger.error(f"Error getting pending users: {e}")
                 return []
     
+    def get_admins(self):
+        """Get the id, name and email of every admin"""
+        if hasattr(self, 'in_memory'):
+            return self.memory.get_admins()
+        else:
+            try:
+                with self._cursor(dictionary=True) as cursor:
+                    cursor.execute("SELECT id, name, email FROM users WHERE role = 'admin'")
+                    admins = cursor.fetchall()
+                return admins
+            except Error as e:
+                logger.error(f"Error getting admins: {e}")
+                return []
+    
     # Stress results methods
-    def add_stress_result(self, user_id, stress_level, stress_score, image_path=None, notes=None):
-        """Add a new stress result"""
+    def add_stress_result(self, user_id, stress_level, stress_score, image_path=None, notes=None, faces=None):
+        """Add a new stress result and return its ID (False on failure)
+
+        Raises WriteBufferFull when write-behind is on and its queue stayed
+        full, so callers can ask the client to retry instead of losing it.
+        """
         result_id = self._generate_id()
         
         if hasattr(self, 'in_memory'):
-            self.stress_results.append({
-                'id': result_id,
-                'user_id': user_id,
-                'stress_level': stress_level,
-                'stress_score': stress_score,
-                'image_path': image_path,
-                'notes': notes,
-                'created_at': datetime.now()
-            })
-            return True
+            return self.memory.add_stress_result(
+                result_id, user_id, stress_level, stress_score,
+                image_path=image_path, notes=notes, faces=faces
+            )
         else:
+            row = (result_id, user_id, stress_level, stress_score, image_path,
+                   json.dumps(faces) if faces is not None else None, notes, datetime.now())
             try:
-                cursor = self.connection.cursor()
-                cursor.execute(
-                    "INSERT INTO stress_results (id, user_id, stress_level, stress_score, image_path, notes) VALUES (%s, %s, %s, %s, %s, %s)",
-                    (result_id, user_id, stress_level, stress_score, image_path, notes)
-                )
-                self.connection.commit()
-                cursor.close()
-                return True
+                if self.results_buffer is not None:
+                    # Returns once queued; blocks while the queue is full
+                    self.results_buffer.put(result_id, row)
+                else:
+                    self._flush_stress_results([row])
+                return result_id
             except Error as e:
                 logger.error(f"Error adding stress result: {e}")
                 return False
     
-    def get_stress_results(self, user_id, limit=10):
-        """Get stress results for a user"""
+    def _flush_stress_results(self, rows):
+        """Insert result rows and update their users' stats in one transaction"""
+        with self._cursor(commit=True) as cursor:
+            cursor.executemany(
+                "INSERT INTO stress_results (id, user_id, stress_level, stress_score, image_path, faces, notes, created_at) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)",
+                rows
+            )
+            # Same transaction, so the summary and rollups never disagree with the results
+            self._update_stress_stats(cursor, [(row[1], row[2], row[3]) for row in rows])
+            analytics.upsert_rollups(cursor, analytics.rollup_deltas([(row[1], row[2], row[3], row[7]) for row in rows]))
+    
+    def _update_stress_stats(self, cursor, results):
+        """Fold (user_id, stress_level, stress_score) tuples, oldest first, into user_stress_stats"""
+        per_user = {}
+        for user_id, stress_level, stress_score in results:
+            per_user.setdefault(user_id, []).append((stress_level, stress_score))
+        
+        for user_id, entries in per_user.items():
+            scores = [score for _, score in entries]
+            total = sum(scores)
+            decay, contribution, fresh = ewma_step(scores)
+            last_level, last_score = entries[-1]
+            # One statement per user: executemany would rewrite this into a multi-row
+            # INSERT, which cannot carry the extra placeholders of the EWMA update
+            # Assignments run left to right, so avg_score sees the updated sum and count
+            cursor.execute("""
+            INSERT INTO user_stress_stats
+                (user_id, result_count, score_sum, score_sum_sq, avg_score, last_score, last_level, ewma)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE
+                result_count = result_count + VALUES(result_count),
+                score_sum = score_sum + VALUES(score_sum),
+                score_sum_sq = score_sum_sq + VALUES(score_sum_sq),
+                avg_score = score_sum / result_count,
+                ewma = COALESCE(ewma * %s + %s, VALUES(ewma)),
+                last_score = VALUES(last_score),
+                last_level = VALUES(last_level)
+            """, (user_id, len(scores), total, sum(score * score for score in scores), total / len(scores),
+                  last_score, last_level, fresh, decay, contribution))
+    
+    def get_stress_result(self, result_id):
+        """Get a single stress result by ID"""
         if hasattr(self, 'in_memory'):
-            # Filter and sort results for the user
-            user_results = [r for r in self.stress_results if r.get('user_id') == user_id]
-            
-            # Sort by created_at (newest first)
-            user_results.sort(key=lambda x: x.get('created_at'), reverse=True)
-            
-            # Apply limit
-            if limit > 0:
-                user_results = user_results[:limit]
-            
-            # Format datetime to string
-            for result in user_results:
-                result['created_at'] = result['created_at'].isoformat()
+            return self.memory.get_stress_result(result_id)
+        else:
+            if self.results_buffer is not None:
+                # A result that is still buffered is served from memory
+                row = self.results_buffer.get(result_id)
+                if row is not None:
+                    result = dict(zip(STRESS_RESULT_COLUMNS, row))
+                    if result.get('faces'):
+                        result['faces'] = json.loads(result['faces'])
+                    return result
             
-            return user_results
+            try:
+                with self._cursor(dictionary=True) as cursor:
+                    cursor.execute("SELECT * FROM stress_results WHERE id = %s", (result_id,))
+                    result = cursor.fetchone()
+                if result and result.get('faces'):
+                    result['faces'] = json.loads(result['faces'])
+                return result
+            except Error as e:
+                logger.error(f"Error getting stress result: {e}")
+                return None
+    
+    def update_image_paths(self, paths):
+        """Point results at new image paths ({old: new}, None clears it); raises Error on failure"""
+        if hasattr(self, 'in_memory'):
+            return self.memory.update_image_paths(paths)
+        with self._cursor(commit=True) as cursor:
+            cursor.executemany(
+                "UPDATE stress_results SET image_path = %s WHERE image_path = %s",
+                [(new, old) for old, new in paths.items()]
+            )
+            return cursor.rowcount
+    
+    def get_stress_results(self, user_id, limit=10, before=None):
+        """Get stress results for a user, newest first
+        
+        before is a (created_at, id) pair from parse_cursor; only results older
+        than it are returned, so each page is an index range scan on
+        (user_id, created_at, id) no matter how deep it is.
+        """
+        if hasattr(self, 'in_memory'):
+            return self.memory.get_stress_results(user_id, limit, before)
         else:
             try:
-                cursor = self.connection.cursor(dictionary=True)
+                query = "SELECT * FROM stress_results WHERE user_id = %s"
+                params = [user_id]
                 
-                query = "SELECT * FROM stress_results WHERE user_id = %s ORDER BY created_at DESC"
-                params = (user_id,)
+                if before is not None:
+                    query += " AND (created_at < %s OR (created_at = %s AND id < %s))"
+                    params += [before[0], before[0], before[1]]
+                
+                query += " ORDER BY created_at DESC, id DESC"
                 
                 if limit > 0:
                     query += " LIMIT %s"
-                    params = (user_id, limit)
+                    params.append(limit)
                 
-                cursor.execute(query, params)
-                results = cursor.fetchall()
-                cursor.close()
+                with self._cursor(dictionary=True) as cursor:
+                    cursor.execute(query, tuple(params))
+                    results = cursor.fetchall()
+                for result in results:
+                    if result.get('faces'):
+                        result['faces'] = json.loads(result['faces'])
                 return results
             except Error as e:
                 logger.error(f"Error getting stress results: {e}")
@@ -304,60 +493,108 @@ class Database:
     def get_high_stress_users(self):
         """Get users with high stress levels"""
         if hasattr(self, 'in_memory'):
-            # Group results by user
-            user_stress = {}
-            
-            for result in self.stress_results:
-                user_id = result.get('user_id')
-                stress_score = result.get('stress_score')
-                
-                if user_id not in user_stress:
-                    user_stress[user_id] = []
-                
-                user_stress[user_id].append(stress_score)
-            
-            # Calculate average stress score for each user
-            high_stress_users = []
-            
-            for user_id, scores in user_stress.items():
-                avg_score = sum(scores) / len(scores)
-                
-                if avg_score >= 80:  # High stress threshold
-                    user = self.get_user_by_id(user_id)
-                    if user:
-                        high_stress_users.append({
-                            'id': user.get('id'),
-                            'name': user.get('name'),
-                            'stressLevel': round(avg_score, 1)
-                        })
-            
-            return high_stress_users
+            return self.memory.get_high_stress_users()
         else:
             try:
-                cursor = self.connection.cursor(dictionary=True)
-                
-                # Get users with average stress score >= 80
-                cursor.execute("""
-                SELECT u.id, u.name, AVG(sr.stress_score) as stressLevel
-                FROM users u
-                JOIN stress_results sr ON u.id = sr.user_id
-                GROUP BY u.id, u.name
-                HAVING AVG(sr.stress_score) >= 80
-                ORDER BY stressLevel DESC
-                """)
-                
-                high_stress_users = cursor.fetchall()
+                with self._cursor(dictionary=True) as cursor:
+                    # Range scan on the average index instead of aggregating every result
+                    cursor.execute("""
+                    SELECT u.id, u.name, s.avg_score as stressLevel
+                    FROM user_stress_stats s
+                    JOIN users u ON u.id = s.user_id
+                    WHERE s.avg_score >= %s
+                    ORDER BY s.avg_score DESC
+                    """, (HIGH_STRESS_THRESHOLD,))
+                    
+                    high_stress_users = cursor.fetchall()
                 
                 # Round the stress level to 1 decimal place
                 for user in high_stress_users:
                     user['stressLevel'] = round(user['stressLevel'], 1)
                 
-                cursor.close()
                 return high_stress_users
             except Error as e:
                 logger.error(f"Error getting high stress users: {e}")
                 return []
     
+    def get_user_stress_stats(self, user_id):
+        """Get a user's stress summary, or None if they have no results"""
+        if hasattr(self, 'in_memory'):
+            return self.memory.get_user_stress_stats(user_id)
+        else:
+            try:
+                with self._cursor(dictionary=True) as cursor:
+                    cursor.execute(
+                        "SELECT result_count, score_sum, score_sum_sq, last_score, last_level, ewma FROM user_stress_stats WHERE user_id = %s",
+                        (user_id,)
+                    )
+                    row = cursor.fetchone()
+                if not row:
+                    return None
+                return stats_dict(row['result_count'], row['score_sum'], row['score_sum_sq'],
+                                  row['last_score'], row['last_level'], row['ewma'])
+            except Error as e:
+                logger.error(f"Error getting stress stats: {e}")
+                return None
+    
+    def get_stress_overview(self):
+        """Get organization-wide counts for the admin dashboard"""
+        if hasattr(self, 'in_memory'):
+            return self.memory.get_stress_overview()
+        else:
+            try:
+                with self._cursor(dictionary=True) as cursor:
+                    cursor.execute("SELECT COUNT(*) AS totalUsers FROM users")
+                    overview = cursor.fetchone()
+                    cursor.execute("""
+                    SELECT SUM(result_count) AS result_count, SUM(score_sum) AS score_sum,
+                           SUM(avg_score >= %s AND avg_score < %s) AS mediumStressUsers
+                    FROM user_stress_stats
+                    """, (MEDIUM_STRESS_THRESHOLD, HIGH_STRESS_THRESHOLD))
+                    totals = cursor.fetchone()
+                count = totals['result_count'] or 0
+                overview['mediumStressUsers'] = int(totals['mediumStressUsers'] or 0)
+                overview['averageStressLevel'] = round(float(totals['score_sum']) / float(count), 1) if count else 0
+                return overview
+            except Error as e:
+                logger.error(f"Error getting stress overview: {e}")
+                return {'totalUsers': 0, 'mediumStressUsers': 0, 'averageStressLevel': 0}
+    
+    def get_analytics(self, granularity, start, end):
+        """Organization-wide series, summary and high-stress users for [start, end) from the rollups"""
+        if hasattr(self, 'in_memory'):
+            return self.memory.get_analytics(granularity, start, end)
+        else:
+            try:
+                with self._cursor(dictionary=True) as cursor:
+                    series = analytics.query_series(cursor, granularity, analytics.ORG_WIDE, start, end)
+                    # Same buckets as the series, so the high-stress table matches the chart
+                    user_totals = analytics.query_user_totals(cursor, granularity, start, end)
+                return analytics.summarize(series, user_totals, HIGH_STRESS_THRESHOLD)
+            except Error as e:
+                logger.error(f"Error getting analytics: {e}")
+                return analytics.summarize([], {}, HIGH_STRESS_THRESHOLD)
+    
+    def rebuild_rollups(self):
+        """Recompute the analytics rollups from every stored result"""
+        if hasattr(self, 'in_memory'):
+            return self.memory.rebuild_rollups()
+        with self._cursor(commit=True) as cursor:
+            return analytics.rebuild_rollups(cursor)
+    
+    def get_metrics(self):
+        """Return connection pool or in-memory engine statistics"""
+        if hasattr(self, 'in_memory'):
+            metrics = self.memory.get_metrics()
+            metrics['backend'] = 'memory'
+            return metrics
+        metrics = self.pool.get_metrics()
+        metrics['backend'] = 'mysql'
+        if self.results_buffer is not None:
+            metrics['write_behind'] = self.results_buffer.get_metrics()
+        metrics['user_cache'] = self.user_cache.get_metrics()
+        return metrics
+    
     def _generate_id(self):
         """Generate a unique ID"""
         import uuid
@@ -0,0 +1,221 @@
+import os
+import time
+import logging
+import weakref
+import threading
+from contextlib import contextmanager
+
+from mysql.connector import Error, InterfaceError, OperationalError
+
+logger = logging.getLogger(__name__)
+
+# Connections kept per process, how long a request may wait for one, and how long
+# a connection may sit idle before it is pinged on checkout
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 10))
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 5))
+DB_POOL_PING_AFTER = float(os.environ.get('DB_POOL_PING_AFTER', 30))
+
+
+# Every pool of this process, so a forked child can let go of the parent's connections
+_pools = weakref.WeakSet()
+
+
+class PoolTimeout(Error):
+    """Raised when no connection became free within the pool timeout"""
+
+
+class _PooledConnection:
+    __slots__ = ('raw', 'last_used')
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.last_used = time.monotonic()
+
+
+class ConnectionPool:
+    """Fixed-size pool of MySQL connections shared by the request threads
+
+    Connections are opened lazily up to size and handed out one per
+    operation. A connection that sat idle for longer than ping_after is
+    pinged before use and replaced if the server dropped it; one that fails
+    with a connection error while in use is discarded instead of returned.
+    """
+
+    def __init__(self, connect, size=DB_POOL_SIZE, timeout=DB_POOL_TIMEOUT, ping_after=DB_POOL_PING_AFTER):
+        # connect() opens one new raw connection
+        self._connect = connect
+        self.size = max(1, size)
+        self.timeout = timeout
+        self.ping_after = ping_after
+
+        # Most recently used last (popped first), so idle connections beyond the working set age out
+        self._idle = []
+        self._lock = threading.Lock()
+        # Signalled whenever a connection is returned or capacity to open one is freed
+        self._available = threading.Condition(self._lock)
+        self._opened = 0
+        self._closed = False
+
+        self._checkouts = 0
+        self._waits = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+        self._timeouts = 0
+        self._reconnects = 0
+        self._discarded = 0
+        self._inherited = []
+        _pools.add(self)
+
+    def _after_fork(self):
+        """Start empty in a forked child; the parent's connections must not be used or closed here"""
+        # The old list is left untouched (another thread may have held the lock at fork time) and
+        # kept referenced, so that garbage collection never quits its connections on the parent's behalf
+        self._inherited.append(self._idle)
+        self._idle = []
+        self._lock = threading.Lock()
+        self._available = threading.Condition(self._lock)
+        self._opened = 0
+
+    def _acquire(self):
+        start = time.perf_counter()
+        deadline = time.monotonic() + self.timeout
+        conn = None
+        with self._available:
+            while True:
+                if self._idle:
+                    conn = self._idle.pop()
+                    break
+                if self._opened < self.size:
+                    self._opened += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._timeouts += 1
+                    raise PoolTimeout(f"No database connection free after {self.timeout}s")
+                self._available.wait(remaining)
+
+        if conn is None:
+            try:
+                conn = _PooledConnection(self._connect())
+            except Exception:
+                self._free_slot()
+                raise
+
+        waited = time.perf_counter() - start
+        with self._lock:
+            self._checkouts += 1
+            self._total_wait += waited
+            if waited > self._max_wait:
+                self._max_wait = waited
+            if waited > 0.001:
+                self._waits += 1
+
+        if time.monotonic() - conn.last_used > self.ping_after:
+            conn = self._revive(conn)
+        return conn
+
+    def _revive(self, conn):
+        """Ping a connection that has been idle, reopening it if the server dropped it"""
+        try:
+            conn.raw.ping(reconnect=False)
+            return conn
+        except Error:
+            pass
+
+        self._close_raw(conn.raw)
+        try:
+            conn.raw = self._connect()
+        except Exception:
+            self._free_slot(discarded=True)
+            raise
+        with self._lock:
+            self._reconnects += 1
+        logger.info("Reconnected stale database connection")
+        return conn
+
+    def _release(self, conn, broken=False):
+        if not broken:
+            try:
+                # A finished read must not leave a snapshot open for the next user
+                if conn.raw.in_transaction:
+                    conn.raw.rollback()
+            except Error:
+                broken = True
+
+        if broken or self._closed:
+            self._close_raw(conn.raw)
+            self._free_slot(discarded=broken)
+            return
+
+        conn.last_used = time.monotonic()
+        with self._available:
+            self._idle.append(conn)
+            self._available.notify()
+
+    def _free_slot(self, discarded=False):
+        """Give up one opened connection and wake a waiter, which may now open a new one"""
+        with self._available:
+            self._opened -= 1
+            if discarded:
+                self._discarded += 1
+            self._available.notify()
+
+    @contextmanager
+    def connection(self):
+        """Check out one connection for the duration of the block"""
+        conn = self._acquire()
+        try:
+            yield conn.raw
+        except (OperationalError, InterfaceError):
+            self._release(conn, broken=True)
+            raise
+        except BaseException:
+            self._release(conn)
+            raise
+        else:
+            self._release(conn)
+
+    @staticmethod
+    def _close_raw(raw):
+        try:
+            raw.close()
+        except Exception:
+            pass
+
+    def close(self):
+        """Close every idle connection; checked-out ones are closed when returned"""
+        self._closed = True
+        with self._available:
+            idle, self._idle = self._idle, []
+            self._opened -= len(idle)
+            self._available.notify_all()
+        for conn in idle:
+            self._close_raw(conn.raw)
+
+    def get_metrics(self):
+        """Return pool size, usage and checkout wait statistics"""
+        with self._lock:
+            checkouts = self._checkouts
+            idle = len(self._idle)
+            return {
+                'size': self.size,
+                'open': self._opened,
+                'idle': idle,
+                'in_use': self._opened - idle,
+                'checkouts': checkouts,
+                'waited_checkouts': self._waits,
+                'avg_wait_ms': round(self._total_wait / checkouts * 1000, 3) if checkouts else 0.0,
+                'max_wait_ms': round(self._max_wait * 1000, 3),
+                'timeouts': self._timeouts,
+                'reconnects': self._reconnects,
+                'discarded': self._discarded,
+            }
+
+
+def _after_fork_in_child():
+    for pool in list(_pools):
+        pool._after_fork()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
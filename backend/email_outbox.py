@@ -0,0 +1,363 @@
+import os
+import time
+import uuid
+import sqlite3
+import smtplib
+import logging
+import threading
+from email.mime.text import MIMEText
+from email.mime.multipart import MIMEMultipart
+
+logger = logging.getLogger(__name__)
+
+# Queued emails live in this SQLite file until they are sent, so a restart loses none
+EMAIL_OUTBOX_PATH = os.environ.get('EMAIL_OUTBOX_PATH', 'email_outbox.db')
+# Sender threads, each keeping one authenticated SMTP connection open between messages
+EMAIL_SMTP_CONNECTIONS = int(os.environ.get('EMAIL_SMTP_CONNECTIONS', 2))
+# Connections idle for longer than this are closed; ones idle a while are checked with NOOP first
+EMAIL_SMTP_IDLE_TIMEOUT = float(os.environ.get('EMAIL_SMTP_IDLE_TIMEOUT', 60))
+EMAIL_SMTP_TIMEOUT = float(os.environ.get('EMAIL_SMTP_TIMEOUT', 10))
+# STARTTLS after connecting; turn off for a local plain-text SMTP stand-in
+EMAIL_USE_TLS = os.environ.get('EMAIL_USE_TLS', 'true').lower() in ('1', 'true', 'yes')
+# Messages per second across all senders, to stay under the provider's limits
+EMAIL_SEND_RATE = float(os.environ.get('EMAIL_SEND_RATE', 2))
+# Attempts per message, the first retry delay (doubled each time) and the longest delay
+EMAIL_MAX_ATTEMPTS = int(os.environ.get('EMAIL_MAX_ATTEMPTS', 6))
+EMAIL_RETRY_DELAY = float(os.environ.get('EMAIL_RETRY_DELAY', 30))
+EMAIL_MAX_RETRY_DELAY = float(os.environ.get('EMAIL_MAX_RETRY_DELAY', 3600))
+# A message claimed for longer than this is taken to belong to a dead sender and is sent again;
+# connecting, STARTTLS, login and the send itself may each take up to the SMTP timeout
+EMAIL_CLAIM_LEASE = float(os.environ.get('EMAIL_CLAIM_LEASE', EMAIL_SMTP_TIMEOUT * 6))
+
+# Seconds a connection may sit unused before it is checked with NOOP
+NOOP_AFTER = 5
+
+
+class PermanentEmailError(Exception):
+    """The server rejected a message for a reason retrying will not fix"""
+
+
+class RateLimiter:
+    """Token bucket shared by the sender threads"""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1.0, rate)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, stop_event):
+        """Wait for a token; returns False if stop_event was set while waiting"""
+        if self.rate <= 0:
+            return True
+        while not stop_event.is_set():
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait = (1 - self._tokens) / self.rate
+            stop_event.wait(wait)
+        return False
+
+
+class SMTPConnection:
+    """One reusable SMTP connection, opened on demand and reopened when dropped"""
+
+    def __init__(self, server, port, user, password, use_tls=EMAIL_USE_TLS, timeout=EMAIL_SMTP_TIMEOUT):
+        self.server = server
+        self.port = port
+        self.user = user
+        self.password = password
+        self.use_tls = use_tls
+        self.timeout = timeout
+        self._smtp = None
+        self._last_used = 0.0
+        self.opened = 0
+
+    def send(self, msg):
+        if self._smtp is not None and time.monotonic() - self._last_used > NOOP_AFTER and not self._alive():
+            self.close()
+        if self._smtp is None:
+            self._open()
+        try:
+            self._smtp.send_message(msg)
+        except smtplib.SMTPServerDisconnected:
+            # The server closed the connection since the last check; retry once on a new one
+            self.close()
+            self._open()
+            self._smtp.send_message(msg)
+        self._last_used = time.monotonic()
+
+    def close_if_idle(self, idle_timeout):
+        if self._smtp is not None and time.monotonic() - self._last_used > idle_timeout:
+            self.close()
+
+    def close(self):
+        if self._smtp is None:
+            return
+        try:
+            self._smtp.quit()
+        except Exception:
+            pass
+        self._smtp = None
+
+    def _open(self):
+        smtp = smtplib.SMTP(self.server, self.port, timeout=self.timeout)
+        try:
+            if self.use_tls:
+                smtp.starttls()
+            if self.password:
+                smtp.login(self.user, self.password)
+        except Exception:
+            smtp.close()
+            raise
+        self._smtp = smtp
+        self._last_used = time.monotonic()
+        self.opened += 1
+
+    def _alive(self):
+        try:
+            return self._smtp.noop()[0] == 250
+        except Exception:
+            return False
+
+
+class EmailOutbox:
+    """Durable email queue drained by background SMTP senders
+
+    enqueue() writes the message to SQLite and returns; sender threads
+    claim due messages, send them over their own long-lived SMTP connection
+    and delete them once the server accepts them. Failed sends are retried
+    with exponential backoff; messages rejected permanently (5xx) or out of
+    attempts are kept with status 'failed' for inspection. Each claim
+    records its owner and time; a message whose claim is older than the
+    lease (its sender died mid-send) is claimed again by any process
+    sharing the file, so delivery is at least once.
+    """
+
+    def __init__(self, server, port, user, password, path=EMAIL_OUTBOX_PATH, connections=EMAIL_SMTP_CONNECTIONS,
+                 use_tls=EMAIL_USE_TLS, send_rate=EMAIL_SEND_RATE, max_attempts=EMAIL_MAX_ATTEMPTS,
+                 retry_delay=EMAIL_RETRY_DELAY, max_retry_delay=EMAIL_MAX_RETRY_DELAY,
+                 idle_timeout=EMAIL_SMTP_IDLE_TIMEOUT, claim_lease=EMAIL_CLAIM_LEASE):
+        self.sender = user
+        self.path = path
+        self.max_attempts = max(1, max_attempts)
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.idle_timeout = idle_timeout
+        self.claim_lease = claim_lease
+        self.rate_limiter = RateLimiter(send_rate)
+        # Identifies this outbox's claims among the processes sharing the file
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._next_reclaim = 0.0
+
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db_lock = threading.Lock()
+        self._create_table()
+
+        self._wakeup = threading.Condition()
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._sent = 0
+        self._retried = 0
+        self._failed = 0
+        self._total_delay = 0.0
+
+        self._connections = [
+            SMTPConnection(server, port, user, password, use_tls=use_tls)
+            for _ in range(max(1, connections))
+        ]
+        self._threads = [
+            threading.Thread(target=self._run, args=(connection,), name=f'email-sender-{i}', daemon=True)
+            for i, connection in enumerate(self._connections)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def _create_table(self):
+        with self._db_lock:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("""
+            CREATE TABLE IF NOT EXISTS outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                to_email TEXT NOT NULL,
+                subject TEXT NOT NULL,
+                body_html TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt_at REAL NOT NULL,
+                created_at REAL NOT NULL,
+                last_error TEXT,
+                claimed_by TEXT,
+                claimed_at REAL
+            )
+            """)
+            # Outbox files created by older versions lack the claim columns
+            columns = {row[1] for row in self._db.execute("PRAGMA table_info(outbox)")}
+            for column, definition in (('claimed_by', 'TEXT'), ('claimed_at', 'REAL')):
+                if column not in columns:
+                    self._db.execute(f"ALTER TABLE outbox ADD COLUMN {column} {definition}")
+            self._db.execute("CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox (status, next_attempt_at)")
+
+    def _reclaim_expired(self, now):
+        """Make messages claimed more than a lease ago due again"""
+        # Callers hold _db_lock; claims from before the claim columns existed count as expired
+        reclaimed = self._db.execute(
+            "UPDATE outbox SET status = 'pending', claimed_by = NULL, claimed_at = NULL "
+            "WHERE status = 'sending' AND (claimed_at IS NULL OR claimed_at < ?)",
+            (now - self.claim_lease,)
+        ).rowcount
+        if reclaimed:
+            logger.warning(f"Reclaimed {reclaimed} emails whose sender stopped mid-send")
+        self._next_reclaim = now + self.claim_lease / 4
+
+    def enqueue(self, to_email, subject, body_html):
+        """Queue an email for delivery and return its outbox id"""
+        now = time.time()
+        with self._db_lock:
+            cursor = self._db.execute(
+                "INSERT INTO outbox (to_email, subject, body_html, next_attempt_at, created_at) VALUES (?, ?, ?, ?, ?)",
+                (to_email, subject, body_html, now, now)
+            )
+            message_id = cursor.lastrowid
+        with self._wakeup:
+            self._wakeup.notify()
+        return message_id
+
+    def _claim(self):
+        """Mark the next due message as being sent; returns (row, seconds until the next one is due)"""
+        now = time.time()
+        with self._db_lock:
+            if now >= self._next_reclaim:
+                self._reclaim_expired(now)
+            row = self._db.execute(
+                "SELECT id, to_email, subject, body_html, attempts, created_at, next_attempt_at FROM outbox "
+                "WHERE status = 'pending' ORDER BY next_attempt_at LIMIT 1"
+            ).fetchone()
+            if row is None:
+                return None, None
+            if row[-1] > now:
+                return None, row[-1] - now
+            # Another process sharing the outbox file may have claimed it first
+            claimed = self._db.execute(
+                "UPDATE outbox SET status = 'sending', claimed_by = ?, claimed_at = ? WHERE id = ? AND status = 'pending'",
+                (self.owner, now, row[0])
+            ).rowcount
+        if not claimed:
+            return None, 0
+        return row[:-1], None
+
+    def _run(self, connection):
+        while not self._stop.is_set():
+            try:
+                row, wait = self._claim()
+                if row is None:
+                    connection.close_if_idle(self.idle_timeout)
+                    with self._wakeup:
+                        if not self._stop.is_set():
+                            if wait != 0:
+                                self._wakeup.wait(min(wait, 1.0) if wait is not None else 1.0)
+                    continue
+                if not self.rate_limiter.acquire(self._stop):
+                    self._release(row[0])
+                    break
+                self._deliver(connection, row)
+            except Exception as e:
+                # e.g. "database is locked" from another process; a message left
+                # claimed is picked up again once its lease expires
+                logger.error(f"Email sender loop failed: {e}")
+                self._stop.wait(1.0)
+        connection.close()
+
+    def _deliver(self, connection, row):
+        message_id, to_email, subject, body_html, attempts, created_at = row
+        msg = MIMEMultipart()
+        msg['From'] = self.sender
+        msg['To'] = to_email
+        msg['Subject'] = subject
+        msg.attach(MIMEText(body_html, 'html'))
+
+        try:
+            try:
+                connection.send(msg)
+            except (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused) as e:
+                raise PermanentEmailError(str(e))
+            except smtplib.SMTPResponseException as e:
+                if 500 <= e.smtp_code < 600:
+                    raise PermanentEmailError(f"{e.smtp_code} {e.smtp_error!r}")
+                raise
+        except PermanentEmailError as e:
+            connection.close()
+            self._fail(message_id, attempts + 1, str(e), permanent=True)
+            return
+        except Exception as e:
+            connection.close()
+            self._fail(message_id, attempts + 1, str(e))
+            return
+
+        with self._db_lock:
+            self._db.execute("DELETE FROM outbox WHERE id = ?", (message_id,))
+        with self._lock:
+            self._sent += 1
+            self._total_delay += time.time() - created_at
+
+    def _fail(self, message_id, attempts, error, permanent=False):
+        if permanent or attempts >= self.max_attempts:
+            logger.error(f"Giving up on email {message_id} after {attempts} attempts: {error}")
+            with self._db_lock:
+                self._db.execute(
+                    "UPDATE outbox SET status = 'failed', attempts = ?, last_error = ?, claimed_by = NULL, claimed_at = NULL "
+                    "WHERE id = ? AND claimed_by = ?",
+                    (attempts, error, message_id, self.owner)
+                )
+            with self._lock:
+                self._failed += 1
+            return
+
+        delay = min(self.max_retry_delay, self.retry_delay * 2 ** (attempts - 1))
+        logger.warning(f"Email {message_id} failed (attempt {attempts}), retrying in {delay:.0f}s: {error}")
+        with self._db_lock:
+            self._db.execute(
+                "UPDATE outbox SET status = 'pending', attempts = ?, last_error = ?, next_attempt_at = ?, "
+                "claimed_by = NULL, claimed_at = NULL WHERE id = ? AND claimed_by = ?",
+                (attempts, error, time.time() + delay, message_id, self.owner)
+            )
+        with self._lock:
+            self._retried += 1
+
+    def _release(self, message_id):
+        with self._db_lock:
+            self._db.execute(
+                "UPDATE outbox SET status = 'pending', claimed_by = NULL, claimed_at = NULL WHERE id = ? AND claimed_by = ?",
+                (message_id, self.owner)
+            )
+
+    def close(self, timeout=10):
+        """Stop the senders; unsent messages stay queued for the next start"""
+        self._stop.set()
+        with self._wakeup:
+            self._wakeup.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+        with self._db_lock:
+            self._db.close()
+
+    def get_metrics(self):
+        """Return queue depth and delivery counters"""
+        with self._db_lock:
+            counts = dict(self._db.execute("SELECT status, COUNT(*) FROM outbox GROUP BY status").fetchall())
+        with self._lock:
+            sent = self._sent
+            return {
+                'pending': counts.get('pending', 0) + counts.get('sending', 0),
+                'failed_total': counts.get('failed', 0),
+                'sent': sent,
+                'retried': self._retried,
+                'failed': self._failed,
+                'avg_delivery_ms': round(self._total_delay / sent * 1000, 3) if sent else 0.0,
+                'connections_opened': sum(connection.opened for connection in self._connections),
+            }
@@ -0,0 +1,295 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+# Frames are downscaled so their longest side is at most this many pixels before detection
+DETECTION_MAX_SIDE = int(os.environ.get('FACE_DETECTION_MAX_SIDE', 640))
+
+# Per-user / per-camera hints remembered between frames
+DETECTION_HINTS_SIZE = int(os.environ.get('FACE_DETECTION_HINTS_SIZE', 4096))
+
+# Tracking: full re-detection every N frames, ROI padding as a fraction of the face box,
+# and how long an idle session keeps its track
+TRACKING_REDETECT_EVERY = int(os.environ.get('FACE_TRACKING_REDETECT_EVERY', 10))
+TRACKING_PADDING = float(os.environ.get('FACE_TRACKING_PADDING', 0.5))
+TRACKING_TTL = float(os.environ.get('FACE_TRACKING_TTL', 30))
+TRACKING_MAX_SESSIONS = int(os.environ.get('FACE_TRACKING_MAX_SESSIONS', 4096))
+
+# Smallest window the frontal face cascade was trained on
+CASCADE_WINDOW = 24
+
+
+class FaceDetector:
+    """Single-pass Haar cascade face detection
+
+    The cascade runs once on a downscaled copy of the frame with the loosest
+    minNeighbors threshold. detectMultiScale2 returns the neighbor count of
+    every grouped detection, so the stricter thresholds are applied
+    afterwards instead of re-running the cascade for each one.
+    """
+
+    def __init__(self, scale_factor=1.05, min_neighbors=(5, 3), min_size=(30, 30),
+                 max_side=DETECTION_MAX_SIDE, hints_size=DETECTION_HINTS_SIZE):
+        self.cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+        self.scale_factor = scale_factor
+        # Strictest threshold first; the cascade itself runs with the loosest
+        self.min_neighbors = tuple(sorted(min_neighbors, reverse=True))
+        self.min_size = min_size
+        self.max_side = max_side
+
+        # key -> face width (in original pixels) that was found last time
+        self._hints = OrderedDict()
+        self._hints_size = hints_size
+        self._lock = threading.Lock()
+
+        self._frames = 0
+        self._frames_with_faces = 0
+        self._hint_hits = 0
+        self._cascade_runs = 0
+        self._total_time = 0.0
+
+    def detect(self, gray, key=None):
+        """Detect faces in a grayscale frame
+
+        Returns an (N, 4) int array of (x, y, w, h) boxes in frame coordinates,
+        most confident first, and the minNeighbors threshold they passed.
+        """
+        start = time.perf_counter()
+        small, scale = self._downscale(gray)
+
+        faces, threshold = None, None
+        hint = self._get_hint(key)
+        if hint is not None:
+            # Search only around the face size that worked for this key last time
+            low = max(CASCADE_WINDOW, int(hint * scale * 0.7))
+            high = max(low + 1, int(hint * scale * 1.4))
+            faces, threshold = self._run(small, (low, low), (high, high))
+            if len(faces) > 0:
+                with self._lock:
+                    self._hint_hits += 1
+
+        if faces is None or len(faces) == 0:
+            min_side = max(CASCADE_WINDOW, int(round(self.min_size[0] * scale)))
+            faces, threshold = self._run(small, (min_side, min_side), None)
+
+        if len(faces) > 0 and scale != 1.0:
+            faces = np.round(faces / scale).astype(np.int32)
+
+        if len(faces) > 0:
+            self._set_hint(key, int(faces[0][2]))
+
+        with self._lock:
+            self._frames += 1
+            self._frames_with_faces += 1 if len(faces) > 0 else 0
+            self._total_time += time.perf_counter() - start
+
+        return faces, threshold
+
+    def search(self, gray, min_size, max_size=None):
+        """Run the cascade over an already cropped region for a known face size range"""
+        return self._run(gray, min_size, max_size)
+
+    def _downscale(self, gray):
+        longest = max(gray.shape[:2])
+        if self.max_side <= 0 or longest <= self.max_side:
+            return gray, 1.0
+        scale = self.max_side / float(longest)
+        return cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA), scale
+
+    def _run(self, image, min_size, max_size):
+        """One cascade pass, filtered by the strictest threshold that keeps a face"""
+        kwargs = {'maxSize': max_size} if max_size else {}
+        rects, neighbors = self.cascade.detectMultiScale2(
+            image,
+            scaleFactor=self.scale_factor,
+            minNeighbors=self.min_neighbors[-1],
+            minSize=min_size,
+            **kwargs
+        )
+        with self._lock:
+            self._cascade_runs += 1
+
+        if len(rects) == 0:
+            return np.empty((0, 4), dtype=np.int32), None
+
+        rects = np.asarray(rects, dtype=np.int32)
+        neighbors = np.asarray(neighbors).reshape(-1)
+        for threshold in self.min_neighbors:
+            keep = neighbors >= threshold
+            if keep.any():
+                rects, neighbors = rects[keep], neighbors[keep]
+                # Most neighbors first, larger faces breaking ties
+                order = np.lexsort((-(rects[:, 2] * rects[:, 3]), -neighbors))
+                return rects[order], threshold
+
+        return np.empty((0, 4), dtype=np.int32), None
+
+    def _get_hint(self, key):
+        if key is None:
+            return None
+        with self._lock:
+            hint = self._hints.get(key)
+            if hint is not None:
+                self._hints.move_to_end(key)
+            return hint
+
+    def _set_hint(self, key, face_width):
+        if key is None:
+            return
+        with self._lock:
+            self._hints[key] = face_width
+            self._hints.move_to_end(key)
+            while len(self._hints) > self._hints_size:
+                self._hints.popitem(last=False)
+
+    def get_metrics(self):
+        """Return detection counts and timing"""
+        with self._lock:
+            frames = self._frames
+            return {
+                'frames': frames,
+                'frames_with_faces': self._frames_with_faces,
+                'cascade_runs': self._cascade_runs,
+                'hint_hits': self._hint_hits,
+                'avg_detection_ms': round(self._total_time / frames * 1000, 3) if frames else 0.0,
+                'hints': len(self._hints),
+            }
+
+
+class _Track:
+    __slots__ = ('boxes', 'threshold', 'frames_since_detect', 'last_seen')
+
+    def __init__(self, boxes, threshold):
+        self.boxes = boxes
+        self.threshold = threshold
+        self.frames_since_detect = 0
+        self.last_seen = time.monotonic()
+
+
+def _iou(a, b):
+    ax1, ay1, aw, ah = a
+    bx1, by1, bw, bh = b
+    ix = max(0, min(ax1 + aw, bx1 + bw) - max(ax1, bx1))
+    iy = max(0, min(ay1 + ah, by1 + bh) - max(ay1, by1))
+    inter = ix * iy
+    union = aw * ah + bw * bh - inter
+    return inter / union if union else 0.0
+
+
+class FaceTracker:
+    """Follows faces across consecutive frames of one webcam session
+
+    After a full detection, later frames only search a padded region around
+    each known face box at a narrow size range. A full-frame detection runs
+    again when a face is lost or every redetect_every frames.
+    """
+
+    def __init__(self, detector, redetect_every=TRACKING_REDETECT_EVERY, padding=TRACKING_PADDING,
+                 ttl=TRACKING_TTL, max_sessions=TRACKING_MAX_SESSIONS, smoothing=0.6):
+        self.detector = detector
+        self.redetect_every = max(1, redetect_every)
+        self.padding = padding
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        # Weight of the new box when blending with the previous one
+        self.smoothing = smoothing
+
+        self._tracks = OrderedDict()
+        self._lock = threading.Lock()
+
+        self._tracked_frames = 0
+        self._full_detections = 0
+        self._lost = 0
+
+    def detect(self, gray, key):
+        """Detect faces for a session, reusing its previous face boxes when possible"""
+        track, previous, frames_since_detect = self._get_track(key)
+
+        if track is not None and frames_since_detect < self.redetect_every:
+            boxes = self._follow(gray, previous)
+            if boxes is not None:
+                with self._lock:
+                    # Skip the update if the session was reset or redetected meanwhile
+                    if self._tracks.get(key) is track:
+                        track.boxes = boxes
+                        track.frames_since_detect += 1
+                        track.last_seen = time.monotonic()
+                    self._tracked_frames += 1
+                return boxes.copy(), track.threshold
+
+            with self._lock:
+                self._lost += 1
+
+        faces, threshold = self.detector.detect(gray, key=key)
+        with self._lock:
+            self._full_detections += 1
+            if len(faces) > 0:
+                self._tracks[key] = _Track(faces.copy(), threshold)
+                self._tracks.move_to_end(key)
+                while len(self._tracks) > self.max_sessions:
+                    self._tracks.popitem(last=False)
+            else:
+                self._tracks.pop(key, None)
+
+        return faces, threshold
+
+    def _follow(self, gray, previous):
+        """Find every tracked face inside its padded ROI, or None if any is lost"""
+        height, width = gray.shape[:2]
+        boxes = []
+        for box in previous:
+            x, y, w, h = (int(v) for v in box)
+            pad_x, pad_y = int(w * self.padding), int(h * self.padding)
+            x0, y0 = max(0, x - pad_x), max(0, y - pad_y)
+            x1, y1 = min(width, x + w + pad_x), min(height, y + h + pad_y)
+
+            low = max(CASCADE_WINDOW, int(w * 0.7))
+            high = max(low + 1, int(w * 1.4))
+            if x1 - x0 < low or y1 - y0 < low:
+                # The box left the frame (or the stream changed resolution): fall back to full detection
+                return None
+            found, _ = self.detector.search(gray[y0:y1, x0:x1], (low, low), (high, high))
+            if len(found) == 0:
+                return None
+
+            new_box = found[0] + np.array([x0, y0, 0, 0], dtype=np.int32)
+            if _iou(new_box, box) > 0.5:
+                # Blend with the previous box so the overlay does not jitter
+                new_box = np.round(self.smoothing * new_box + (1 - self.smoothing) * box).astype(np.int32)
+            boxes.append(new_box)
+
+        return np.array(boxes, dtype=np.int32)
+
+    def _get_track(self, key):
+        """Return a session's track with a snapshot of its boxes and frame count"""
+        now = time.monotonic()
+        with self._lock:
+            track = self._tracks.get(key)
+            if track is None:
+                return None, None, 0
+            if now - track.last_seen > self.ttl:
+                del self._tracks[key]
+                return None, None, 0
+            self._tracks.move_to_end(key)
+            return track, track.boxes, track.frames_since_detect
+
+    def reset(self, key):
+        """Forget a session's track, e.g. when its camera stops"""
+        with self._lock:
+            self._tracks.pop(key, None)
+
+    def get_metrics(self):
+        """Return how many frames were served by tracking versus full detection"""
+        with self._lock:
+            total = self._tracked_frames + self._full_detections
+            return {
+                'tracked_frames': self._tracked_frames,
+                'full_detections': self._full_detections,
+                'lost': self._lost,
+                'tracked_ratio': round(self._tracked_frames / total, 3) if total else 0.0,
+                'active_sessions': len(self._tracks),
+            }
@@ -0,0 +1,142 @@
+import os
+import json
+import time
+import logging
+import threading
+
+from simple_websocket import ConnectionClosed
+
+logger = logging.getLogger(__name__)
+
+# Largest binary frame accepted on a stream
+STREAM_MAX_FRAME_BYTES = int(os.environ.get('STREAM_MAX_FRAME_BYTES', 2 * 1024 * 1024))
+
+# Process-wide stream counters
+_metrics_lock = threading.Lock()
+_metrics = {
+    'active_streams': 0,
+    'streams': 0,
+    'frames_received': 0,
+    'frames_processed': 0,
+    'frames_dropped': 0,
+    'frames_rejected': 0,
+}
+
+
+def _count(name, amount=1):
+    with _metrics_lock:
+        _metrics[name] += amount
+
+
+def get_stream_metrics():
+    """Return stream and frame counters for this process"""
+    with _metrics_lock:
+        return dict(_metrics)
+
+
+class LatestFrameSlot:
+    """Single-frame mailbox between the socket reader and the inference worker
+
+    A frame that arrives before the previous one was picked up replaces it,
+    so a client sending faster than inference keeps up only ever waits for
+    its newest frame.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._frame = None
+        self._closed = False
+        self.dropped = 0
+
+    def put(self, frame):
+        with self._cond:
+            if self._frame is not None:
+                self.dropped += 1
+                _count('frames_dropped')
+            self._frame = frame
+            self._cond.notify()
+
+    def take(self):
+        """Wait for the next frame; None once the slot is closed"""
+        with self._cond:
+            self._cond.wait_for(lambda: self._frame is not None or self._closed)
+            frame, self._frame = self._frame, None
+            return frame
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._frame = None
+            self._cond.notify_all()
+
+
+def _encode(message):
+    return json.dumps(message, separators=(',', ':'))
+
+
+def serve_frame_stream(ws, process_frame, max_frame_bytes=STREAM_MAX_FRAME_BYTES):
+    """Read binary JPEG frames from a WebSocket and send back one compact JSON result per processed frame
+
+    process_frame takes the raw JPEG bytes and returns a JSON-serializable dict.
+    Frames that arrive while the previous one is still being scored are dropped
+    in favour of the newest one.
+    """
+    slot = LatestFrameSlot()
+    _count('streams')
+    _count('active_streams')
+
+    def worker():
+        while True:
+            frame = slot.take()
+            if frame is None:
+                return
+            seq, data = frame
+
+            start = time.perf_counter()
+            if data is None:
+                result = {'error': 'Frame too large'}
+            else:
+                try:
+                    result = process_frame(data)
+                except Exception as e:
+                    logger.error(f"Error processing stream frame: {e}")
+                    result = {'error': 'Error processing frame'}
+                _count('frames_processed')
+
+            result['seq'] = seq
+            result['dropped'] = slot.dropped
+            result['ms'] = round((time.perf_counter() - start) * 1000, 1)
+            try:
+                ws.send(_encode(result))
+            except ConnectionClosed:
+                slot.close()
+                return
+
+    thread = threading.Thread(target=worker, name='frame-stream', daemon=True)
+    thread.start()
+
+    seq = 0
+    try:
+        while True:
+            message = ws.receive()
+            if message is None:
+                continue
+            if isinstance(message, str):
+                # Text messages are control messages; only "close" is understood
+                if message.strip() == 'close':
+                    break
+                continue
+
+            seq += 1
+            _count('frames_received')
+            if len(message) > max_frame_bytes:
+                # Only the worker writes to the socket; it reports the rejection
+                _count('frames_rejected')
+                message = None
+            slot.put((seq, message))
+    except ConnectionClosed:
+        pass
+    finally:
+        slot.close()
+        thread.join(timeout=5)
+        _count('active_streams', -1)
@@ -1,76 +1,46 @@
 
 import cv2
 import numpy as np
-import tensorflow as tf
-from tensorflow.keras.models import Sequential, load_model
-from tensorflow.keras.layers import Conv2D, MaxPooling2D, Dense, Dropout, Flatten
-from tensorflow.keras.optimizers import Adam
 import os
 import base64
 from io import BytesIO
 from PIL import Image
 import time
+import logging
+from model_registry import get_registry, MODEL_PATH
+from face_detection import FaceDetector, FaceTracker
+from result_cache import PerceptualCache, dhash, MISS
 
-# Path to pre-trained model weights (would be provided in production)
-MODEL_PATH = 'models/stress_detection_model.h5'
+logger = logging.getLogger(__name__)
 
 class StressDetector:
     def __init__(self):
-        # Ensure models directory exists
-        os.makedirs('models', exist_ok=True)
-        
-        self.model = self._build_model()
-        self.face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
-        
-        # Load pre-trained model if exists
-        if os.path.exists(MODEL_PATH):
-            try:
-                self.model.load_weights(MODEL_PATH)
-                print("Loaded pre-trained model weights")
-            except Exception as e:
-                print(f"Error loading model: {e}")
-                print("Using untrained model")
+        # The model and its batcher are shared by everything in this process
+        self.registry = get_registry()
+        self.batcher = self.registry.batcher
+        self.registry.start_background_load()
+        
+        self.face_detector = FaceDetector(scale_factor=1.1, min_neighbors=(5,), min_size=(30, 30))
+        self.face_tracker = FaceTracker(self.face_detector)
+        # Near-identical webcam frames reuse the last result instead of being re-scored
+        self.result_cache = PerceptualCache()
     
-    def _build_model(self):
-        """Build CNN model for stress detection"""
-        model = Sequential([
-            Conv2D(32, (3, 3), activation='relu', input_shape=(48, 48, 1)),
-            MaxPooling2D(pool_size=(2, 2)),
-            
-            Conv2D(64, (3, 3), activation='relu'),
-            MaxPooling2D(pool_size=(2, 2)),
-            
-            Conv2D(128, (3, 3), activation='relu'),
-            MaxPooling2D(pool_size=(2, 2)),
-            
-            Flatten(),
-            Dense(256, activation='relu'),
-            Dropout(0.5),
-            Dense(64, activation='relu'),
-            Dropout(0.3),
-            Dense(1, activation='sigmoid')  # Outputs stress level 0-1
-        ])
-        
-        model.compile(
-            optimizer=Adam(learning_rate=0.0001),
-            loss='mean_squared_error',
-            metrics=['mae']
-        )
-        
-        return model
+    @property
+    def model(self):
+        """The current generation of the shared stress detection model"""
+        return self.registry.model
     
-    def detect_faces(self, image):
+    def detect_faces(self, image, key=None, tracking_key=None):
         """Detect faces in image"""
         # Convert to grayscale for face detection
         gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
         
-        # Detect faces
-        faces = self.face_cascade.detectMultiScale(
-            gray,
-            scaleFactor=1.1,
-            minNeighbors=5,
-            minSize=(30, 30)
-        )
+        if tracking_key:
+            # Consecutive webcam frames: search around the last known faces
+            faces, _ = self.face_tracker.detect(gray, tracking_key)
+        else:
+            # Detect faces in a single pass over a downscaled frame
+            faces, _ = self.face_detector.detect(gray, key=key)
         
         return faces, gray
     
@@ -88,12 +58,76 @@ class StressDetector:
         
         return face_img
     
-    def process_image(self, image_data):
+    def preprocess_faces(self, gray, faces):
+        """Resize and normalize all face ROIs into one (N, 48, 48, 1) batch"""
+        batch = np.empty((len(faces), 48, 48, 1), dtype=np.float32)
+        
+        for i, (x, y, w, h) in enumerate(faces):
+            # Resize into the preallocated slot, then scale the whole batch in place
+            batch[i, :, :, 0] = cv2.resize(gray[y:y+h, x:x+w], (48, 48))
+        
+        batch *= 1.0 / 255.0
+        return batch
+    
+    def score_faces(self, gray, faces):
+        """Score all faces in one forward pass, returning 0-100 stress scores"""
+        batch = self.preprocess_faces(gray, faces)
+        if not hasattr(self.model, 'predict'):
+            logger.warning("No stress model available, using demo scores")
+            # Fallback to realistic values
+            return np.random.uniform(40, 95, size=len(faces))
+        # InferenceBusy and model errors reach the caller; an invented score
+        # must not be returned or cached as a real one.
+        # Predict stress levels (0-1) and scale to 0-100 range
+        return np.asarray(self.batcher.predict(batch), dtype=np.float32) * 100
+    
+    def stress_category(self, stress_score):
+        """Map a 0-100 stress score to its category"""
+        if stress_score < 40:
+            return "low"
+        elif stress_score < 70:
+            return "medium"
+        return "high"
+    
+    def analyze_frame(self, image, detection_key=None, tracking_key=None):
+        """Detect and score faces in a decoded BGR frame without drawing or encoding"""
+        cache_scope = tracking_key or detection_key
+        frame_hash = None
+        if cache_scope is not None and self.result_cache.enabled:
+            frame_hash = dhash(cv2.cvtColor(image, cv2.COLOR_BGR2GRAY))
+            cached = self.result_cache.lookup(cache_scope, frame_hash)
+            if cached is not MISS:
+                return [dict(face) for face in cached]
+        
+        faces = self._analyze(image, detection_key, tracking_key)
+        if frame_hash is not None:
+            self.result_cache.store(cache_scope, frame_hash, faces)
+        return [dict(face) for face in faces]
+    
+    def _analyze(self, image, detection_key, tracking_key):
+        faces, gray = self.detect_faces(image, key=detection_key, tracking_key=tracking_key)
+        if len(faces) == 0:
+            return []
+        
+        stress_scores = self.score_faces(gray, faces)
+        return [
+            {
+                "box": [int(x), int(y), int(w), int(h)],
+                "score": round(float(score), 1),
+                "level": self.stress_category(float(score))
+            }
+            for (x, y, w, h), score in zip(faces, stress_scores)
+        ]
+    
+    def process_image(self, image_data, detection_key=None, tracking_key=None, annotate=True):
         """Process image data and detect stress levels"""
         start_time = time.time()
         
+        # Raw encoded image bytes are decoded in memory
+        if isinstance(image_data, (bytes, bytearray)):
+            image = cv2.imdecode(np.frombuffer(image_data, dtype=np.uint8), cv2.IMREAD_COLOR)
         # Check if image_data is base64 string
-        if isinstance(image_data, str) and "base64" in image_data:
+        elif isinstance(image_data, str) and "base64" in image_data:
             # Extract the base64 part
             base64_data = image_data.split(',')[1] if ',' in image_data else image_data
             
@@ -128,7 +162,7 @@ class StressDetector:
             }
         
         # Detect faces
-        faces, gray = self.detect_faces(image)
+        faces, gray = self.detect_faces(image, key=detection_key, tracking_key=tracking_key)
         
         if len(faces) == 0:
             return {
@@ -136,48 +170,29 @@ class StressDetector:
                 "error": "No faces detected in the image"
             }
         
+        # Score every face in a single forward pass
+        stress_scores = self.score_faces(gray, faces)
+        
         results = []
         
-        # Process each face
-        for (x, y, w, h) in faces:
-            # Extract face region
-            face_roi = gray[y:y+h, x:x+w]
-            
-            # Preprocess face for model
-            processed_face = self.preprocess_face(face_roi)
+        for (x, y, w, h), stress_score in zip(faces, stress_scores):
+            x, y, w, h = int(x), int(y), int(w), int(h)
+            stress_score = float(stress_score)
+            stress_category = self.stress_category(stress_score)
             
-            # Use model to predict stress if properly trained
-            try:
-                # Predict stress level (0-1)
-                stress_prediction = self.model.predict(processed_face, verbose=0)[0][0]
+            if annotate:
+                # Draw rectangle on the image
+                color = (0, 255, 0)  # Green for low stress
+                if stress_category == "medium":
+                    color = (0, 165, 255)  # Orange for medium stress
+                elif stress_category == "high":
+                    color = (0, 0, 255)  # Red for high stress
                 
-                # Scale to 0-100 range
-                stress_score = float(stress_prediction * 100)
-            except Exception as e:
-                print(f"Model prediction failed: {str(e)}")
-                # Fallback to realistic values
-                stress_score = float(np.random.uniform(40, 95))
-            
-            # Determine stress level category
-            if stress_score < 40:
-                stress_category = "low"
-            elif stress_score < 70:
-                stress_category = "medium"
-            else:
-                stress_category = "high"
-            
-            # Draw rectangle on the image
-            color = (0, 255, 0)  # Green for low stress
-            if stress_category == "medium":
-                color = (0, 165, 255)  # Orange for medium stress
-            elif stress_category == "high":
-                color = (0, 0, 255)  # Red for high stress
-            
-            cv2.rectangle(image, (x, y), (x+w, y+h), color, 2)
-            
-            # Add text with stress level
-            text = f"{stress_category.upper()}: {stress_score:.1f}%"
-            cv2.putText(image, text, (x, y-10), cv2.FONT_HERSHEY_SIMPLEX, 0.7, color, 2)
+                cv2.rectangle(image, (x, y), (x+w, y+h), color, 2)
+                
+                # Add text with stress level
+                text = f"{stress_category.upper()}: {stress_score:.1f}%"
+                cv2.putText(image, text, (x, y-10), cv2.FONT_HERSHEY_SIMPLEX, 0.7, color, 2)
             
             # Add result to list
             results.append({
@@ -186,24 +201,26 @@ class StressDetector:
                 "stress_category": stress_category
             })
         
-        # Convert result image to base64 for sending back to frontend
-        _, buffer = cv2.imencode('.jpg', image)
-        result_image_base64 = base64.b64encode(buffer).decode('utf-8')
-        
-        processing_time = time.time() - start_time
-        
-        return {
+        response = {
             "success": True,
             "faces_detected": len(faces),
-            "results": results,
-            "result_image": f"data:image/jpeg;base64,{result_image_base64}",
-            "processing_time_ms": round(processing_time * 1000, 1)
+            "results": results
         }
+        
+        if annotate:
+            # Convert result image to base64 for sending back to frontend
+            _, buffer = cv2.imencode('.jpg', image)
+            result_image_base64 = base64.b64encode(buffer).decode('utf-8')
+            response["result_image"] = f"data:image/jpeg;base64,{result_image_base64}"
+        
+        response["processing_time_ms"] = round((time.time() - start_time) * 1000, 1)
+        return response
     
     def save_model(self):
         """Save the current model"""
         os.makedirs(os.path.dirname(MODEL_PATH), exist_ok=True)
         self.model.save(MODEL_PATH)
+        self.registry.reload()
         return {"success": True, "message": "Model saved successfully"}
     
     def train(self, training_data=None):
@@ -0,0 +1,185 @@
+import os
+import re
+import uuid
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Where images live, how many background writers persist them, and whether writes are fsynced
+IMAGE_STORE_ROOT = os.environ.get('IMAGE_STORE_ROOT', 'uploads')
+IMAGE_STORE_WORKERS = int(os.environ.get('IMAGE_STORE_WORKERS', 2))
+IMAGE_STORE_FSYNC = os.environ.get('IMAGE_STORE_FSYNC', 'true').lower() in ('1', 'true', 'yes')
+# Keep copies of analyzed images in the image store
+PERSIST_IMAGES = os.environ.get('PERSIST_IMAGES', 'true').lower() in ('1', 'true', 'yes')
+
+# Store keys are a BLAKE2 content hash plus the file extension
+KEY_PATTERN = re.compile(r'^[0-9a-f]{40}\.[a-z0-9]+$')
+# Retention replaces old originals with a thumbnail under the same hash and this extension
+THUMBNAIL_EXT = '.webp'
+
+
+class ImageStore:
+    """Content-addressed image storage with deduplication and background writes
+
+    Images are keyed by the BLAKE2 hash of their bytes and sharded into
+    root/ab/cd/<hash>.<ext> by hash prefix. put() only hashes the bytes and
+    queues the write, so request threads never wait on the disk, and storing
+    the same frame twice costs nothing.
+    """
+
+    def __init__(self, root=IMAGE_STORE_ROOT, workers=IMAGE_STORE_WORKERS, fsync=IMAGE_STORE_FSYNC):
+        self.root = root
+        self.fsync = fsync
+        os.makedirs(root, exist_ok=True)
+
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='image-store')
+        # key -> bytes not yet on disk; readers are served from here meanwhile
+        self._pending = {}
+        self._lock = threading.Lock()
+
+        self._puts = 0
+        self._dedup_hits = 0
+        self._writes = 0
+        self._bytes_written = 0
+        self._bytes_deduplicated = 0
+        self._failed_writes = 0
+
+    @staticmethod
+    def key_for(data, ext='.jpg'):
+        """Content key for a blob of image bytes"""
+        return hashlib.blake2b(data, digest_size=20).hexdigest() + ext
+
+    def path_for(self, key):
+        """Sharded file path for a store key"""
+        digest = key.split('.', 1)[0]
+        return os.path.join(self.root, digest[:2], digest[2:4], key)
+
+    def put(self, data, ext='.jpg'):
+        """Queue image bytes for storage and return their key immediately"""
+        data = bytes(data)
+        key = self.key_for(data, ext)
+        with self._lock:
+            self._puts += 1
+            if key in self._pending:
+                self._dedup_hits += 1
+                self._bytes_deduplicated += len(data)
+                return key
+            self._pending[key] = data
+
+        self._pool.submit(self._write, key, data)
+        return key
+
+    def _write(self, key, data):
+        path = self.path_for(key)
+        try:
+            if os.path.exists(path):
+                # Same content is already stored; refresh its age for retention
+                os.utime(path)
+                with self._lock:
+                    self._dedup_hits += 1
+                    self._bytes_deduplicated += len(data)
+                return
+
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+                if self.fsync:
+                    f.flush()
+                    os.fsync(f.fileno())
+            # Readers only ever see complete files
+            os.replace(tmp_path, path)
+
+            with self._lock:
+                self._writes += 1
+                self._bytes_written += len(data)
+        except OSError as e:
+            with self._lock:
+                self._failed_writes += 1
+            logger.error(f"Failed to store image {key}: {e}")
+        finally:
+            with self._lock:
+                self._pending.pop(key, None)
+
+    def get(self, key):
+        """Return the bytes stored under a key, or None"""
+        with self._lock:
+            data = self._pending.get(key)
+        if data is not None:
+            return data
+
+        path = self.resolve(key)
+        if path is None:
+            return None
+        try:
+            with open(path, 'rb') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def resolve(self, key):
+        """File path for a key, also accepting legacy paths under the store root"""
+        if not key:
+            return None
+        if KEY_PATTERN.match(key):
+            return self.path_for(key)
+
+        # Results saved before the store existed hold paths like uploads/<user>_<time>.jpg
+        root = os.path.abspath(self.root)
+        path = os.path.abspath(key)
+        if path.startswith(root + os.sep):
+            return path
+        return None
+
+    def current_key(self, key):
+        """The key an image is stored under now: the key itself, its thumbnail once retention
+        replaced the original, or None once it expired
+
+        Records that are never rewritten by retention (the api.py result log)
+        keep the key they were written with and are resolved through this.
+        """
+        if not key or not KEY_PATTERN.match(key):
+            return key
+        with self._lock:
+            if key in self._pending:
+                return key
+        if os.path.exists(self.path_for(key)):
+            return key
+        thumbnail = key.split('.', 1)[0] + THUMBNAIL_EXT
+        if thumbnail != key and os.path.exists(self.path_for(thumbnail)):
+            return thumbnail
+        return None
+
+    def close(self):
+        """Wait for queued writes to land"""
+        self._pool.shutdown(wait=True)
+
+    def get_metrics(self):
+        """Return write, deduplication and backlog counters"""
+        with self._lock:
+            return {
+                'puts': self._puts,
+                'writes': self._writes,
+                'dedup_hits': self._dedup_hits,
+                'bytes_written': self._bytes_written,
+                'bytes_deduplicated': self._bytes_deduplicated,
+                'failed_writes': self._failed_writes,
+                'pending_writes': len(self._pending),
+            }
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_image_store():
+    """Return the process-wide image store"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = ImageStore()
+    return _store
@@ -0,0 +1,240 @@
+import os
+import queue
+import threading
+import time
+import logging
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Scheduler limits (overridable from the environment)
+MAX_BATCH_SIZE = int(os.environ.get('INFERENCE_MAX_BATCH_SIZE', 32))
+MAX_WAIT_MS = float(os.environ.get('INFERENCE_MAX_WAIT_MS', 2))
+MAX_QUEUE_DEPTH = int(os.environ.get('INFERENCE_MAX_QUEUE_DEPTH', 256))
+# Seconds predict() waits for a queued request's scores (0 waits forever)
+RESULT_TIMEOUT = float(os.environ.get('INFERENCE_TIMEOUT', 10))
+
+
+class InferenceBusy(Exception):
+    """The inference scheduler is overloaded; callers should answer 503 and let the client retry"""
+
+
+class InferenceQueueFull(InferenceBusy):
+    """Raised when the inference queue cannot accept more work"""
+
+
+class InferenceTimeout(InferenceBusy):
+    """Raised when queued faces were not scored within the result timeout"""
+
+
+class _InferenceRequest:
+    __slots__ = ('faces', 'future', 'enqueued_at')
+
+    def __init__(self, faces, future, enqueued_at):
+        self.faces = faces
+        self.future = future
+        self.enqueued_at = enqueued_at
+
+
+class InferenceBatcher:
+    """Collects face crops from concurrent requests and scores them in shared forward passes"""
+
+    def __init__(self, predict_fn, max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MAX_WAIT_MS,
+                 max_queue_depth=MAX_QUEUE_DEPTH, result_timeout=RESULT_TIMEOUT):
+        # predict_fn takes a float32 (N, 48, 48, 1) array and returns N scores in 0-1
+        self.predict_fn = predict_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.max_queue_depth = int(max_queue_depth)
+        self.result_timeout = float(result_timeout) if result_timeout and result_timeout > 0 else None
+
+        self._queue = queue.Queue(maxsize=self.max_queue_depth)
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._stopped = False
+
+        self._metrics_lock = threading.Lock()
+        self._reset_metrics()
+
+    def _reset_metrics(self):
+        self._batches = 0
+        self._requests = 0
+        self._faces = 0
+        self._last_batch_size = 0
+        self._max_batch_size_seen = 0
+        self._max_queue_depth_seen = 0
+        self._total_wait = 0.0
+        self._max_wait_seen = 0.0
+        self._total_inference = 0.0
+        self._rejected = 0
+        self._timed_out = 0
+
+    def _ensure_started(self):
+        """Start the scheduler thread on first use"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stopped = False
+                self._thread = threading.Thread(target=self._run, name='inference-batcher', daemon=True)
+                self._thread.start()
+
+    def submit(self, faces, timeout=None):
+        """Queue one or more preprocessed faces and return a Future for their scores
+
+        A full queue is rejected with InferenceQueueFull right away, or after
+        waiting up to timeout seconds for space when one is given.
+        """
+        faces = np.asarray(faces, dtype=np.float32)
+        if faces.ndim == 3:
+            faces = faces[np.newaxis]
+
+        self._ensure_started()
+        future = Future()
+        try:
+            request = _InferenceRequest(faces, future, time.perf_counter())
+            if timeout is None:
+                self._queue.put_nowait(request)
+            else:
+                self._queue.put(request, timeout=timeout)
+        except queue.Full:
+            with self._metrics_lock:
+                self._rejected += 1
+            raise InferenceQueueFull("Inference queue is full")
+
+        depth = self._queue.qsize()
+        with self._metrics_lock:
+            if depth > self._max_queue_depth_seen:
+                self._max_queue_depth_seen = depth
+        return future
+
+    def predict(self, faces):
+        """Score faces, blocking until the batch containing them has run
+
+        Raises InferenceQueueFull when the queue is full and InferenceTimeout
+        when the scores take longer than result_timeout. Both mean the server
+        is overloaded; callers report them instead of inventing a score.
+        """
+        future = self.submit(faces)
+        try:
+            return future.result(timeout=self.result_timeout)
+        except FutureTimeout:
+            with self._metrics_lock:
+                self._timed_out += 1
+            raise InferenceTimeout(f"Inference did not finish within {self.result_timeout:g}s")
+
+    def stop(self):
+        """Stop the scheduler thread once queued work has been drained"""
+        if self._thread is None:
+            return
+        self._stopped = True
+        try:
+            self._queue.put_nowait(None)
+        except queue.Full:
+            pass
+        self._thread.join(timeout=5)
+        self._thread = None
+
+    def _run(self):
+        # A request that did not fit into the previous batch opens the next one
+        carry = None
+        while True:
+            if carry is None:
+                try:
+                    carry = self._queue.get(timeout=0.5)
+                except queue.Empty:
+                    if self._stopped:
+                        return
+                    continue
+                if carry is None:
+                    return
+
+            batch = [carry]
+            size = len(carry.faces)
+            carry = None
+            stop_after_batch = False
+            deadline = batch[0].enqueued_at + self.max_wait
+
+            while size < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                try:
+                    if remaining > 0:
+                        item = self._queue.get(timeout=remaining)
+                    else:
+                        item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop_after_batch = True
+                    break
+                if size + len(item.faces) > self.max_batch_size:
+                    carry = item
+                    break
+                batch.append(item)
+                size += len(item.faces)
+
+            self._run_batch(batch, size)
+            if stop_after_batch:
+                if carry is not None:
+                    self._run_batch([carry], len(carry.faces))
+                return
+
+    def _run_batch(self, batch, size):
+        """Run one forward pass and hand each caller its slice of the scores"""
+        started = time.perf_counter()
+        if len(batch) == 1:
+            inputs = batch[0].faces
+        else:
+            inputs = np.concatenate([request.faces for request in batch], axis=0)
+
+        try:
+            scores = np.asarray(self.predict_fn(inputs), dtype=np.float32).reshape(-1)
+        except Exception as e:
+            logger.error(f"Batched inference failed: {e}")
+            for request in batch:
+                request.future.set_exception(e)
+            return
+        finished = time.perf_counter()
+
+        offset = 0
+        for request in batch:
+            count = len(request.faces)
+            request.future.set_result(scores[offset:offset + count])
+            offset += count
+
+        waits = [started - request.enqueued_at for request in batch]
+        with self._metrics_lock:
+            self._batches += 1
+            self._requests += len(batch)
+            self._faces += size
+            self._last_batch_size = size
+            self._max_batch_size_seen = max(self._max_batch_size_seen, size)
+            self._total_wait += sum(waits)
+            self._max_wait_seen = max(self._max_wait_seen, max(waits))
+            self._total_inference += finished - started
+
+    def get_metrics(self):
+        """Return batch size, queue depth and wait time statistics"""
+        with self._metrics_lock:
+            batches = self._batches
+            requests = self._requests
+            return {
+                'batches': batches,
+                'requests': requests,
+                'faces': self._faces,
+                'rejected': self._rejected,
+                'timed_out': self._timed_out,
+                'avg_batch_size': round(self._faces / batches, 2) if batches else 0.0,
+                'last_batch_size': self._last_batch_size,
+                'max_batch_size_seen': self._max_batch_size_seen,
+                'queue_depth': self._queue.qsize(),
+                'max_queue_depth_seen': self._max_queue_depth_seen,
+                'avg_wait_ms': round(self._total_wait / requests * 1000, 3) if requests else 0.0,
+                'max_wait_ms_seen': round(self._max_wait_seen * 1000, 3),
+                'avg_inference_ms': round(self._total_inference / batches * 1000, 3) if batches else 0.0,
+                'max_batch_size': self.max_batch_size,
+                'max_wait_ms': self.max_wait * 1000,
+                'max_queue_depth': self.max_queue_depth,
+            }
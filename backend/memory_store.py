@@ -0,0 +1,260 @@
+import bisect
+import itertools
+import threading
+from datetime import datetime
+
+from stress_stats import UserStressStats, HIGH_STRESS_THRESHOLD, MEDIUM_STRESS_THRESHOLD
+from analytics import MemoryRollups, rollup_deltas, aggregate_arrays, summarize, ORG_WIDE
+
+
+class MemoryStore:
+    """Indexed in-memory storage engine behind Database when MySQL is not used
+
+    Users are indexed by id and by email. Each user's results are kept in
+    created_at order (bisect-inserted, so appends of new results are O(1)),
+    which makes "newest N results" a slice instead of a filter and sort over
+    every result. Every read returns copies, so callers can never change
+    stored rows by accident.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+
+        # id -> user row, email -> id, and ids of users waiting for approval
+        self._users = {}
+        self._emails = {}
+        self._pending = {}
+
+        # id -> result row
+        self._results = {}
+        # user id -> sort keys (created_at timestamp, sequence) and rows in the same order
+        self._result_keys = {}
+        self._result_rows = {}
+        # user id -> running stress summary
+        self._stats = {}
+        # Hourly and daily analytics buckets
+        self._rollups = MemoryRollups()
+        self._sequence = itertools.count()
+
+    # Users
+    def add_user(self, user_id, name, email, password, role='user'):
+        """Add a new user"""
+        with self._lock:
+            # Check if email already exists
+            if email in self._emails:
+                return False, "Email already exists"
+
+            self._users[user_id] = {
+                'id': user_id,
+                'name': name,
+                'email': email,
+                'password': password,
+                'role': role,
+                'is_approved': role == 'admin',  # Auto-approve admins
+                'created_at': datetime.now()
+            }
+            self._emails[email] = user_id
+            if role == 'user':
+                self._pending[user_id] = True
+
+        return True, "User registered successfully"
+
+    def get_user_by_id(self, user_id):
+        """Get user by ID, without the password"""
+        with self._lock:
+            user = self._users.get(user_id)
+            if user is None:
+                return None
+            user_copy = user.copy()
+        user_copy.pop('password', None)
+        return user_copy
+
+    def get_user_by_email(self, email):
+        """Get user by email (including password for authentication)"""
+        with self._lock:
+            user_id = self._emails.get(email)
+            return self._users[user_id].copy() if user_id is not None else None
+
+    def approve_user(self, user_id):
+        """Approve a user"""
+        with self._lock:
+            user = self._users.get(user_id)
+            if user is None:
+                return False, "User not found"
+            user['is_approved'] = True
+            self._pending.pop(user_id, None)
+        return True, "User approved successfully"
+
+    def get_pending_users(self):
+        """Get users pending approval"""
+        with self._lock:
+            users = [self._users[user_id] for user_id in self._pending]
+            return [
+                {
+                    'id': user['id'],
+                    'name': user['name'],
+                    'email': user['email'],
+                    'registeredAt': user['created_at'].isoformat()
+                }
+                for user in users
+            ]
+
+    def get_admins(self):
+        """Get the id, name and email of every admin"""
+        with self._lock:
+            return [
+                {'id': user['id'], 'name': user['name'], 'email': user['email']}
+                for user in self._users.values()
+                if user['role'] == 'admin'
+            ]
+
+    # Stress results
+    def add_stress_result(self, result_id, user_id, stress_level, stress_score, image_path=None, notes=None,
+                          faces=None, created_at=None):
+        """Add a new stress result"""
+        created_at = created_at or datetime.now()
+        result = {
+            'id': result_id,
+            'user_id': user_id,
+            'stress_level': stress_level,
+            'stress_score': stress_score,
+            'image_path': image_path,
+            'faces': faces,
+            'notes': notes,
+            'created_at': created_at
+        }
+        key = (created_at.timestamp(), next(self._sequence))
+
+        with self._lock:
+            self._results[result_id] = result
+            keys = self._result_keys.setdefault(user_id, [])
+            rows = self._result_rows.setdefault(user_id, [])
+            if not keys or key >= keys[-1]:
+                keys.append(key)
+                rows.append(result)
+            else:
+                index = bisect.bisect_right(keys, key)
+                keys.insert(index, key)
+                rows.insert(index, result)
+
+            stats = self._stats.get(user_id)
+            if stats is None:
+                stats = self._stats[user_id] = UserStressStats()
+            stats.add(stress_score, stress_level)
+            self._rollups.add(rollup_deltas([(user_id, stress_level, stress_score, created_at)]))
+
+        return result_id
+
+    def get_stress_result(self, result_id):
+        """Get a single stress result by ID"""
+        with self._lock:
+            result = self._results.get(result_id)
+            return result.copy() if result is not None else None
+
+    def update_image_paths(self, paths):
+        """Point results at new image paths ({old: new}, None clears it)"""
+        updated = 0
+        with self._lock:
+            for result in self._results.values():
+                if result['image_path'] in paths:
+                    result['image_path'] = paths[result['image_path']]
+                    updated += 1
+        return updated
+
+    def get_stress_results(self, user_id, limit=10, before=None):
+        """Get a user's stress results, newest first, with created_at as an ISO string
+
+        before is a (created_at, id) pair; only results older than it are returned.
+        """
+        with self._lock:
+            rows = self._result_rows.get(user_id, [])
+            end = len(rows) if before is None else self._position(user_id, before)
+            start = max(0, end - limit) if limit > 0 else 0
+            results = [row.copy() for row in reversed(rows[start:end])]
+
+        for result in results:
+            result['created_at'] = result['created_at'].isoformat()
+        return results
+
+    def _position(self, user_id, before):
+        """Index of the result a cursor points at, in the user's time-ordered rows"""
+        created_at, result_id = before
+        keys = self._result_keys.get(user_id, [])
+        rows = self._result_rows.get(user_id, [])
+        timestamp = created_at.timestamp()
+        low = bisect.bisect_left(keys, (timestamp,))
+        high = bisect.bisect_right(keys, (timestamp, float('inf')))
+        for index in range(low, high):
+            if rows[index]['id'] == result_id:
+                return index
+        return low
+
+    def get_high_stress_users(self, threshold=HIGH_STRESS_THRESHOLD):
+        """Get users whose average stress score is at or above the threshold"""
+        with self._lock:
+            high_stress_users = [
+                {
+                    'id': user_id,
+                    'name': self._users[user_id]['name'],
+                    'stressLevel': round(stats.average, 1)
+                }
+                for user_id, stats in self._stats.items()
+                if stats.average >= threshold and user_id in self._users
+            ]
+
+        high_stress_users.sort(key=lambda user: user['stressLevel'], reverse=True)
+        return high_stress_users
+
+    def get_user_stress_stats(self, user_id):
+        """Get a user's stress summary, or None if they have no results"""
+        with self._lock:
+            stats = self._stats.get(user_id)
+            return stats.to_dict() if stats is not None else None
+
+    def get_stress_overview(self):
+        """Get organization-wide counts for the admin dashboard"""
+        with self._lock:
+            count = sum(stats.count for stats in self._stats.values())
+            total = sum(stats.total for stats in self._stats.values())
+            medium = sum(
+                1 for stats in self._stats.values()
+                if MEDIUM_STRESS_THRESHOLD <= stats.average < HIGH_STRESS_THRESHOLD
+            )
+            return {
+                'totalUsers': len(self._users),
+                'mediumStressUsers': medium,
+                'averageStressLevel': round(total / count, 1) if count else 0
+            }
+
+    def get_analytics(self, granularity, start, end, high_threshold=HIGH_STRESS_THRESHOLD):
+        """Organization-wide series and per-user totals for [start, end) from the rollups"""
+        with self._lock:
+            series = self._rollups.series(granularity, ORG_WIDE, start, end)
+            # Same buckets as the series, so the high-stress table matches the chart
+            user_totals = self._rollups.user_totals(granularity, start, end)
+        return summarize(series, user_totals, high_threshold)
+
+    def rebuild_rollups(self):
+        """Recompute every rollup from the stored results"""
+        with self._lock:
+            rows = list(self._results.values())
+            if rows:
+                deltas = aggregate_arrays(
+                    [row['user_id'] for row in rows],
+                    [row['stress_level'] for row in rows],
+                    [row['stress_score'] for row in rows],
+                    [row['created_at'] for row in rows]
+                )
+            else:
+                deltas = {}
+            self._rollups.replace(deltas)
+        return len(deltas)
+
+    def get_metrics(self):
+        """Return row counts"""
+        with self._lock:
+            return {
+                'users': len(self._users),
+                'pending_users': len(self._pending),
+                'stress_results': len(self._results),
+            }
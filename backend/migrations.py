@@ -0,0 +1,82 @@
+import os
+import logging
+from contextlib import contextmanager
+
+from mysql.connector.errors import OperationalError
+
+from analytics import create_rollups_table, rebuild_rollups
+
+logger = logging.getLogger(__name__)
+
+# Seconds a process waits for another one to finish changing the schema
+SCHEMA_LOCK_TIMEOUT = int(os.environ.get('DB_SCHEMA_LOCK_TIMEOUT', 120))
+
+# Ordered schema changes applied once per database; append new ones, never edit applied ones.
+# A change is either an SQL statement or a function taking the cursor.
+MIGRATIONS = [
+    (
+        1,
+        "Index stress results by user and time for newest-first and keyset reads",
+        "CREATE INDEX idx_stress_results_user_created ON stress_results (user_id, created_at, id)",
+    ),
+    (
+        2,
+        "Hourly and daily stress rollups per user and organization-wide",
+        create_rollups_table,
+    ),
+    (
+        3,
+        "Backfill stress rollups from existing results",
+        rebuild_rollups,
+    ),
+    (
+        4,
+        "Index stress results by image path for retention rewrites",
+        "CREATE INDEX idx_stress_results_image_path ON stress_results (image_path)",
+    ),
+]
+
+
+def apply_migrations(cursor, migrations=MIGRATIONS):
+    """Apply every migration not yet recorded in schema_migrations, in order"""
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        version INT PRIMARY KEY,
+        description VARCHAR(255) NOT NULL,
+        applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+    cursor.execute("SELECT version FROM schema_migrations")
+    applied = {row[0] for row in cursor.fetchall()}
+
+    for version, description, change in migrations:
+        if version in applied:
+            continue
+        logger.info(f"Applying migration {version}: {description}")
+        if callable(change):
+            change(cursor)
+        else:
+            cursor.execute(change)
+        cursor.execute(
+            "INSERT INTO schema_migrations (version, description) VALUES (%s, %s)",
+            (version, description)
+        )
+
+
+@contextmanager
+def schema_lock(cursor, database, timeout=SCHEMA_LOCK_TIMEOUT):
+    """Hold a MySQL named lock so only one process creates or migrates the schema
+
+    Pre-forked workers all start at once; without the lock they race to add
+    the same indexes and schema_migrations rows.
+    """
+    name = f"{database}.schema_migrations"
+    cursor.execute("SELECT GET_LOCK(%s, %s)", (name, timeout))
+    row = cursor.fetchone()
+    if not row or row[0] != 1:
+        raise OperationalError(msg=f"Timed out after {timeout}s waiting for the schema lock {name}")
+    try:
+        yield
+    finally:
+        cursor.execute("SELECT RELEASE_LOCK(%s)", (name,))
+        cursor.fetchone()
@@ -0,0 +1,286 @@
+import os
+import time
+import hashlib
+import logging
+import threading
+
+from inference_queue import InferenceBatcher
+
+logger = logging.getLogger(__name__)
+
+# Path to the shared model weights and how often to look for new ones
+MODEL_PATH = os.environ.get('MODEL_PATH', 'models/stress_detection_model.h5')
+RELOAD_CHECK_INTERVAL = float(os.environ.get('MODEL_RELOAD_INTERVAL', 10))
+# A failed background load is retried after this many seconds, doubling up to the maximum
+LOAD_RETRY_DELAY = float(os.environ.get('MODEL_LOAD_RETRY_DELAY', 5))
+LOAD_MAX_RETRY_DELAY = float(os.environ.get('MODEL_LOAD_MAX_RETRY_DELAY', 300))
+
+
+def build_model():
+    """Build the CNN model for stress detection"""
+    # TensorFlow is imported on first use so the web server can start without it
+    from tensorflow.keras.models import Sequential
+    from tensorflow.keras.layers import Conv2D, MaxPooling2D, Dense, Dropout, Flatten
+    from tensorflow.keras.optimizers import Adam
+
+    model = Sequential([
+        Conv2D(32, (3, 3), activation='relu', input_shape=(48, 48, 1)),
+        MaxPooling2D(pool_size=(2, 2)),
+
+        Conv2D(64, (3, 3), activation='relu'),
+        MaxPooling2D(pool_size=(2, 2)),
+
+        Conv2D(128, (3, 3), activation='relu'),
+        MaxPooling2D(pool_size=(2, 2)),
+
+        Flatten(),
+        Dense(256, activation='relu'),
+        Dropout(0.5),
+        Dense(64, activation='relu'),
+        Dropout(0.3),
+        Dense(1, activation='sigmoid')  # Outputs stress level 0-1
+    ])
+
+    model.compile(
+        optimizer=Adam(learning_rate=0.0001),
+        loss='mean_squared_error',
+        metrics=['mae']
+    )
+
+    return model
+
+
+def _file_checksum(path):
+    """BLAKE2 checksum of a weights file"""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _file_stat(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+class LoadedModel:
+    """One model generation: the Keras model plus its warmed predictor"""
+
+    def __init__(self, model, predictor, source, stat=None, checksum=None):
+        self.model = model
+        self.predictor = predictor
+        self.source = source
+        self.stat = stat
+        self.checksum = checksum
+        self.loaded_at = time.time()
+
+
+class ModelRegistry:
+    """Owns the single stress model of this process and hot-swaps it when the weights change"""
+
+    def __init__(self, model_path=MODEL_PATH, check_interval=RELOAD_CHECK_INTERVAL,
+                 retry_delay=LOAD_RETRY_DELAY, max_retry_delay=LOAD_MAX_RETRY_DELAY):
+        self.model_path = model_path
+        self.check_interval = check_interval
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+
+        self._current = None
+        self._load_lock = threading.Lock()
+        # Guards the reload check so only one request thread schedules a reload
+        self._check_lock = threading.Lock()
+        self._reloading = False
+        self._last_check = 0.0
+        self._reloads = 0
+        self._failed_reloads = 0
+        self._failed_stat = None
+        self._loader = None
+        # Set once the first background load attempt has finished, successfully or not
+        self._attempted = threading.Event()
+        self.load_error = None
+
+        # One batcher per process so every caller shares the same forward passes
+        self.batcher = InferenceBatcher(self.predict)
+
+    def get(self):
+        """Return the current model generation, loading it on first use"""
+        current = self._current
+        if current is None:
+            with self._load_lock:
+                if self._current is None:
+                    self._current = self._load()
+                current = self._current
+        else:
+            self._maybe_schedule_reload()
+        return current
+
+    @property
+    def model(self):
+        return self.get().model
+
+    def is_ready(self):
+        """True once a model generation is loaded and warmed"""
+        return self._current is not None
+
+    def start_background_load(self):
+        """Import TensorFlow and load the model on a background thread"""
+        if self._current is not None or (self._loader is not None and self._loader.is_alive()):
+            return
+        self._loader = threading.Thread(target=self._background_load, name='model-loader', daemon=True)
+        self._loader.start()
+
+    def _background_load(self):
+        start = time.perf_counter()
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                self.get()
+            except Exception as e:
+                # Keep retrying so the process becomes ready without a manual reload
+                self.load_error = str(e)
+                delay = min(self.max_retry_delay, self.retry_delay * 2 ** (attempt - 1))
+                logger.error(f"Background model load failed (attempt {attempt}), retrying in {delay:.0f}s: {e}")
+                self._attempted.set()
+                time.sleep(delay)
+                continue
+            self.load_error = None
+            self._attempted.set()
+            logger.info(f"Stress detection model ready after {time.perf_counter() - start:.1f}s")
+            return
+
+    def wait_until_ready(self, timeout=None):
+        """Block until the first background load attempt has finished; True if the model is ready"""
+        if self._loader is not None:
+            self._attempted.wait(timeout)
+        return self.is_ready()
+
+    def predict(self, faces):
+        """Score a float32 (N, 48, 48, 1) batch with the current generation"""
+        # In-flight batches keep the generation they started with across a swap
+        return self.get().predictor(faces)
+
+    def _load(self):
+        """Load the weights file, falling back to an untrained network"""
+        from tensorflow.keras.models import load_model
+        from inference import FastPredictor
+
+        os.makedirs(os.path.dirname(self.model_path) or '.', exist_ok=True)
+        stat = _file_stat(self.model_path)
+
+        if stat is None:
+            print("Building new stress detection model...")
+            model = build_model()
+            print("Model built successfully")
+            return LoadedModel(model, FastPredictor(model), 'untrained')
+
+        checksum = _file_checksum(self.model_path)
+        try:
+            print("Loading existing stress detection model...")
+            model = load_model(self.model_path)
+            source = 'model'
+            print("Model loaded successfully")
+        except Exception as e:
+            # Files written with save_weights only hold the weights
+            print(f"Error loading model: {e}")
+            model = build_model()
+            try:
+                model.load_weights(self.model_path)
+                source = 'weights'
+                print("Loaded pre-trained model weights")
+            except Exception as e:
+                print(f"Error loading model weights: {e}")
+                print("Using untrained model")
+                source = 'untrained'
+
+        return LoadedModel(model, FastPredictor(model), source, stat, checksum)
+
+    def _maybe_schedule_reload(self):
+        """Cheap, rate-limited mtime check; the actual reload runs off the request thread"""
+        now = time.monotonic()
+        if self.check_interval <= 0 or now - self._last_check < self.check_interval:
+            return
+        with self._check_lock:
+            if now - self._last_check < self.check_interval:
+                return
+            self._last_check = now
+
+            stat = _file_stat(self.model_path)
+            if stat is None or stat == self._current.stat or stat == self._failed_stat or self._reloading:
+                return
+            self._reloading = True
+        threading.Thread(target=self._reload_in_background, name='model-reload', daemon=True).start()
+
+    def _reload_in_background(self):
+        try:
+            self.reload()
+        finally:
+            with self._check_lock:
+                self._reloading = False
+
+    def reload(self, force=False):
+        """Load new weights if the file's checksum changed, then swap atomically"""
+        with self._load_lock:
+            current = self._current
+            stat = _file_stat(self.model_path)
+            if stat is None:
+                return False
+
+            checksum = _file_checksum(self.model_path)
+            if current is not None and not force and checksum == current.checksum:
+                # Touched but unchanged: remember the new mtime and keep serving
+                current.stat = stat
+                return False
+
+            try:
+                loaded = self._load()
+            except Exception as e:
+                self._failed_reloads += 1
+                self._failed_stat = stat
+                logger.error(f"Model reload failed, keeping current weights: {e}")
+                return False
+
+            if loaded.source == 'untrained' and current is not None:
+                # A half-written file must not replace working weights
+                self._failed_reloads += 1
+                self._failed_stat = stat
+                logger.error("Model reload produced an untrained model, keeping current weights")
+                return False
+
+            # Reference assignment is atomic; new requests pick up the new generation
+            self._current = loaded
+            self._reloads += 1
+            logger.info(f"Stress detection model reloaded (checksum {loaded.checksum})")
+            return True
+
+    def get_status(self):
+        """Describe the loaded generation and reload history"""
+        current = self._current
+        return {
+            'model_path': self.model_path,
+            'loaded': current is not None,
+            'load_error': self.load_error,
+            'source': current.source if current else None,
+            'checksum': current.checksum if current else None,
+            'loaded_at': current.loaded_at if current else None,
+            'reloads': self._reloads,
+            'failed_reloads': self._failed_reloads,
+        }
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry():
+    """Return the process-wide model registry"""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = ModelRegistry()
+    return _registry
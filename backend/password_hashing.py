@@ -0,0 +1,328 @@
+import os
+import time
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+
+from werkzeug.security import generate_password_hash, check_password_hash
+
+from shared_state import SHARED_STATE_PATH, open_state_db
+
+logger = logging.getLogger(__name__)
+
+PASSWORD_HASH_METHOD = 'pbkdf2:sha256'
+
+# Worker processes for PBKDF2 (0 hashes on the calling thread), and how many
+# hash jobs may be queued or running before new ones are turned away
+PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', max(1, (os.cpu_count() or 2) // 2)))
+PASSWORD_HASH_MAX_PENDING = int(os.environ.get('PASSWORD_HASH_MAX_PENDING', max(1, PASSWORD_HASH_WORKERS) * 4))
+# Seconds a request waits for a hashing slot before it is rejected
+PASSWORD_HASH_ADMIT_TIMEOUT = float(os.environ.get('PASSWORD_HASH_ADMIT_TIMEOUT', 0.5))
+# Seconds to wait for an admitted job to finish
+PASSWORD_HASH_TIMEOUT = float(os.environ.get('PASSWORD_HASH_TIMEOUT', 10))
+
+# Failed logins allowed per email and per client IP within the window
+LOGIN_MAX_FAILURES_PER_EMAIL = int(os.environ.get('LOGIN_MAX_FAILURES_PER_EMAIL', 5))
+LOGIN_MAX_FAILURES_PER_IP = int(os.environ.get('LOGIN_MAX_FAILURES_PER_IP', 20))
+LOGIN_FAILURE_WINDOW = float(os.environ.get('LOGIN_FAILURE_WINDOW', 300))
+
+
+class HashingBusy(Exception):
+    """Raised when no hashing slot came free in time, or an admitted job did not finish in time"""
+
+
+def _timed(fn, *args):
+    # Runs in a worker process; CLOCK_MONOTONIC is shared by all processes on the host
+    started = time.monotonic()
+    result = fn(*args)
+    return result, started, time.monotonic()
+
+
+def _noop():
+    return None
+
+
+def _exit_with_parent(parent):
+    # Runs in each worker process: a worker whose parent was killed (e.g. a serve.py
+    # worker) never sees its queue close and would otherwise live on as an orphan
+    def watch():
+        while os.getppid() == parent:
+            time.sleep(1)
+        os._exit(0)
+    threading.Thread(target=watch, name='parent-watch', daemon=True).start()
+
+
+class PasswordHasher:
+    """Runs PBKDF2 hashing and verification in a bounded process pool
+
+    PBKDF2 is deliberately slow and holds the GIL, so running it on request
+    threads stalls every other request in the process. Here each call waits
+    for one of max_pending slots (or fails with HashingBusy after
+    admit_timeout), then blocks only its own thread while a worker process
+    does the work.
+
+    Workers are spawned as fresh interpreters rather than forked, because
+    the pool may be created or replaced while request, batcher and outbox
+    threads are running, and forking a threaded process can deadlock in the
+    child. start() only moves the worker startup cost off the first request.
+    """
+
+    def __init__(self, workers=PASSWORD_HASH_WORKERS, max_pending=PASSWORD_HASH_MAX_PENDING,
+                 admit_timeout=PASSWORD_HASH_ADMIT_TIMEOUT, timeout=PASSWORD_HASH_TIMEOUT):
+        self.workers = max(0, workers)
+        self.max_pending = max(1, max_pending)
+        self.admit_timeout = admit_timeout
+        self.timeout = timeout
+
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._lock = threading.Lock()
+        self._executor = None
+
+        self._hashed = 0
+        self._verified = 0
+        self._rejected = 0
+        self._failed = 0
+        self._timed_out = 0
+        self._in_flight = 0
+        self._total_queue = 0.0
+        self._max_queue = 0.0
+        self._total_hash = 0.0
+        self._max_hash = 0.0
+
+    def start(self):
+        """Start the worker processes now rather than on the first request"""
+        if self.workers:
+            self._get_executor().submit(_noop).result()
+
+    def hash(self, password):
+        """Hash a new password"""
+        result = self._run(generate_password_hash, password, PASSWORD_HASH_METHOD)
+        with self._lock:
+            self._hashed += 1
+        return result
+
+    def verify(self, password_hash, password):
+        """Check a password against a stored hash"""
+        result = self._run(check_password_hash, password_hash, password)
+        with self._lock:
+            self._verified += 1
+        return result
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_exit_with_parent,
+                    initargs=(os.getpid(),)
+                )
+            return self._executor
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(timeout=self.admit_timeout):
+            with self._lock:
+                self._rejected += 1
+            raise HashingBusy("Too many password operations in progress")
+        with self._lock:
+            self._in_flight += 1
+        try:
+            submitted = time.monotonic()
+            if self.workers:
+                result, started, finished = self._submit(fn, args)
+            else:
+                result, started, finished = _timed(fn, *args)
+            self._record(started - submitted, finished - started)
+            return result
+        except HashingBusy:
+            raise
+        except Exception:
+            with self._lock:
+                self._failed += 1
+            raise
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+            self._slots.release()
+
+    def _submit(self, fn, args):
+        executor = self._get_executor()
+        future = executor.submit(_timed, fn, *args)
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            future.cancel()
+            with self._lock:
+                self._timed_out += 1
+            raise HashingBusy("Password operation timed out")
+        except BrokenProcessPool:
+            # A worker died (e.g. OOM-killed); replace the pool for the next call
+            logger.error("Password hashing pool broke; starting a new one")
+            with self._lock:
+                if self._executor is executor:
+                    self._executor = None
+            executor.shutdown(wait=False)
+            raise
+
+    def _record(self, queue_time, hash_time):
+        queue_time = max(0.0, queue_time)
+        with self._lock:
+            self._total_queue += queue_time
+            self._max_queue = max(self._max_queue, queue_time)
+            self._total_hash += hash_time
+            self._max_hash = max(self._max_hash, hash_time)
+
+    def close(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def get_metrics(self):
+        """Return throughput, admission and timing counters"""
+        with self._lock:
+            completed = self._hashed + self._verified
+            return {
+                'workers': self.workers,
+                'max_pending': self.max_pending,
+                'in_flight': self._in_flight,
+                'hashed': self._hashed,
+                'verified': self._verified,
+                'rejected': self._rejected,
+                'failed': self._failed,
+                'timed_out': self._timed_out,
+                'avg_queue_ms': round(self._total_queue / completed * 1000, 3) if completed else 0.0,
+                'max_queue_ms': round(self._max_queue * 1000, 3),
+                'avg_hash_ms': round(self._total_hash / completed * 1000, 3) if completed else 0.0,
+                'max_hash_ms': round(self._max_hash * 1000, 3),
+            }
+
+
+class LoginRateLimiter:
+    """Sliding-window limit on failed logins per email and per client IP
+
+    Checked before the password is verified, so a blocked client costs no
+    hashing work. A successful login clears the email's failures but not the
+    IP's, so one valid account cannot be used to keep guessing others.
+
+    Failures are kept in the shared state file, so every worker process
+    counts against the same limits.
+    """
+
+    def __init__(self, max_per_email=LOGIN_MAX_FAILURES_PER_EMAIL, max_per_ip=LOGIN_MAX_FAILURES_PER_IP,
+                 window=LOGIN_FAILURE_WINDOW, path=SHARED_STATE_PATH):
+        self.limits = {'email': max_per_email, 'ip': max_per_ip}
+        self.window = window
+        self._lock = threading.Lock()
+        self._db = open_state_db(path)
+        with self._lock:
+            self._db.execute("""
+            CREATE TABLE IF NOT EXISTS login_failures (
+                kind TEXT NOT NULL,
+                client TEXT NOT NULL,
+                failed_at REAL NOT NULL
+            )
+            """)
+            self._db.execute(
+                "CREATE INDEX IF NOT EXISTS idx_login_failures_client ON login_failures (kind, client, failed_at)"
+            )
+        self._last_sweep = time.time()
+
+        self._recorded = 0
+        self._blocked = 0
+
+    def retry_after(self, ip, email):
+        """Seconds until this client may try again, or 0 if it may try now"""
+        now = time.time()
+        wait = 0.0
+        with self._lock:
+            for kind, client in self._keys(ip, email):
+                limit = self.limits[kind]
+                if limit <= 0:
+                    continue
+                # The limit-th most recent failure decides when the client drops back under the limit
+                row = self._db.execute(
+                    "SELECT failed_at FROM login_failures WHERE kind = ? AND client = ? AND failed_at > ? "
+                    "ORDER BY failed_at DESC LIMIT 1 OFFSET ?",
+                    (kind, client, now - self.window, limit - 1)
+                ).fetchone()
+                if row is not None:
+                    wait = max(wait, row[0] + self.window - now)
+            if wait > 0:
+                self._blocked += 1
+        return wait
+
+    def record_failure(self, ip, email):
+        now = time.time()
+        with self._lock:
+            self._db.executemany(
+                "INSERT INTO login_failures (kind, client, failed_at) VALUES (?, ?, ?)",
+                [(kind, client, now) for kind, client in self._keys(ip, email)]
+            )
+            self._recorded += 1
+            if now - self._last_sweep > self.window:
+                self._sweep(now)
+
+    def reset(self, email):
+        with self._lock:
+            self._db.execute("DELETE FROM login_failures WHERE kind = 'email' AND client = ?", (_normalize(email),))
+
+    def _keys(self, ip, email):
+        keys = []
+        if email:
+            keys.append(('email', _normalize(email)))
+        if ip:
+            keys.append(('ip', ip))
+        return keys
+
+    def _sweep(self, now):
+        # Drop failures that have aged out, so the file stays small
+        self._db.execute("DELETE FROM login_failures WHERE failed_at <= ?", (now - self.window,))
+        self._last_sweep = now
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def get_metrics(self):
+        with self._lock:
+            tracked = self._db.execute(
+                "SELECT COUNT(*) FROM (SELECT DISTINCT kind, client FROM login_failures WHERE failed_at > ?)",
+                (time.time() - self.window,)
+            ).fetchone()[0]
+            return {
+                'tracked_clients': tracked,
+                'failures_recorded': self._recorded,
+                'blocked': self._blocked,
+            }
+
+
+def _normalize(email):
+    return email.strip().lower()
+
+
+_hasher = None
+_limiter = None
+_singleton_lock = threading.Lock()
+
+
+def get_password_hasher():
+    """Return the process-wide password hasher"""
+    global _hasher
+    if _hasher is None:
+        with _singleton_lock:
+            if _hasher is None:
+                _hasher = PasswordHasher()
+    return _hasher
+
+
+def get_login_limiter():
+    """Return the process-wide failed-login limiter"""
+    global _limiter
+    if _limiter is None:
+        with _singleton_lock:
+            if _limiter is None:
+                _limiter = LoginRateLimiter()
+    return _limiter
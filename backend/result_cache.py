@@ -0,0 +1,141 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+# Bound on cached frames, how long a cached result stays valid, how many of the
+# 64 hash bits may differ for a frame to count as a near-duplicate, and how many
+# recent frames are remembered per user or session
+RESULT_CACHE_SIZE = int(os.environ.get('RESULT_CACHE_SIZE', 4096))
+RESULT_CACHE_TTL = float(os.environ.get('RESULT_CACHE_TTL', 2))
+RESULT_CACHE_MAX_DISTANCE = int(os.environ.get('RESULT_CACHE_MAX_DISTANCE', 4))
+RESULT_CACHE_PER_KEY = int(os.environ.get('RESULT_CACHE_PER_KEY', 4))
+
+# Sentinel for lookups that found nothing, since None is a valid cached result
+MISS = object()
+
+
+def dhash(gray, hash_size=8):
+    """Difference hash of a grayscale image as a hash_size * hash_size bit integer"""
+    small = cv2.resize(gray, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    bits = small[:, 1:] > small[:, :-1]
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+
+def hamming(a, b):
+    """Number of differing bits between two hashes"""
+    return bin(a ^ b).count('1')
+
+
+class PerceptualCache:
+    """LRU + TTL cache of analysis results keyed by a perceptual frame hash
+
+    A user sitting still in front of the webcam sends near-identical frames.
+    Their difference hashes are within a few bits of each other, so a frame
+    close enough to one analyzed a moment ago reuses that result instead of
+    running face detection and the CNN again. Entries are scoped per user or
+    webcam session and expire after ttl seconds so real changes in stress are
+    picked up.
+    """
+
+    def __init__(self, max_entries=RESULT_CACHE_SIZE, ttl=RESULT_CACHE_TTL,
+                 max_distance=RESULT_CACHE_MAX_DISTANCE, per_key=RESULT_CACHE_PER_KEY):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_distance = max_distance
+        self.per_key = max(1, per_key)
+
+        # scope -> list of [hash, result, expires_at], newest last
+        self._scopes = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expired = 0
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0 and self.ttl > 0
+
+    def lookup(self, scope, frame_hash):
+        """Return the result cached for a near-duplicate frame, or MISS"""
+        if not self.enabled:
+            return MISS
+        now = time.monotonic()
+        with self._lock:
+            entries = self._scopes.get(scope)
+            if entries:
+                live = [entry for entry in entries if entry[2] > now]
+                if len(live) != len(entries):
+                    self._expired += len(entries) - len(live)
+                    self._size -= len(entries) - len(live)
+                    entries[:] = live
+
+                best = None
+                for entry in entries:
+                    distance = hamming(entry[0], frame_hash)
+                    if distance <= self.max_distance and (best is None or distance < best[0]):
+                        best = (distance, entry)
+                if best is not None:
+                    self._hits += 1
+                    self._scopes.move_to_end(scope)
+                    return best[1][1]
+
+                if not entries:
+                    del self._scopes[scope]
+
+            self._misses += 1
+            return MISS
+
+    def store(self, scope, frame_hash, result):
+        """Remember the result computed for a frame"""
+        if not self.enabled:
+            return
+        with self._lock:
+            entries = self._scopes.setdefault(scope, [])
+            entries.append([frame_hash, result, time.monotonic() + self.ttl])
+            self._size += 1
+            self._scopes.move_to_end(scope)
+
+            if len(entries) > self.per_key:
+                del entries[0]
+                self._size -= 1
+                self._evictions += 1
+
+            # Drop the least recently used scopes' oldest frames first
+            while self._size > self.max_entries:
+                oldest_scope, oldest = next(iter(self._scopes.items()))
+                del oldest[0]
+                self._size -= 1
+                self._evictions += 1
+                if not oldest:
+                    del self._scopes[oldest_scope]
+
+    def reset(self, scope):
+        """Forget every frame cached for a scope"""
+        with self._lock:
+            entries = self._scopes.pop(scope, None)
+            if entries:
+                self._size -= len(entries)
+
+    def get_metrics(self):
+        """Return hit rate, eviction and size counters"""
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_rate': round(self._hits / lookups, 3) if lookups else 0.0,
+                'evictions': self._evictions,
+                'expired': self._expired,
+                'entries': self._size,
+                'scopes': len(self._scopes),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+                'max_distance': self.max_distance,
+            }
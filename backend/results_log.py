@@ -0,0 +1,413 @@
+import os
+import sys
+import json
+import struct
+import hashlib
+import logging
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: only in-process locking
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Where per-user result logs live
+RESULTS_LOG_ROOT = os.environ.get('RESULTS_LOG_ROOT', 'results_log')
+# Entries per segment file before a new one is started
+RESULTS_LOG_SEGMENT_ENTRIES = int(os.environ.get('RESULTS_LOG_SEGMENT_ENTRIES', 1000))
+# Sealed segments per user before they are merged into one
+RESULTS_LOG_MAX_SEGMENTS = int(os.environ.get('RESULTS_LOG_MAX_SEGMENTS', 8))
+# Newest entries kept per user when segments are merged (0 keeps everything)
+RESULTS_LOG_MAX_ENTRIES = int(os.environ.get('RESULTS_LOG_MAX_ENTRIES', 0))
+RESULTS_LOG_FSYNC = os.environ.get('RESULTS_LOG_FSYNC', 'false').lower() in ('1', 'true', 'yes')
+
+# Each index entry is the byte offset of one line in its segment
+OFFSET = struct.Struct('<Q')
+SEGMENT_SUFFIX = '.ndjson'
+INDEX_SUFFIX = '.idx'
+
+
+class ResultsLog:
+    """Append-only per-user result history in NDJSON segments with offset indexes
+
+    Each user has a directory of segments named after the position of their
+    first entry (positions count every result the user ever logged). Next to
+    each segment, an index holds one 8-byte offset per line. Appending writes
+    one line and one index entry. Reading the newest N entries reads N index
+    entries and one contiguous byte range per segment touched, however long
+    the history is.
+
+    Once a user has more than max_segments sealed segments, they are merged
+    into one, dropping all but the newest max_entries when that is set.
+    Appends and merges take an exclusive lock per user (flock on Unix, so
+    several processes may share a root); reads take a shared one.
+
+    Entries are never rewritten, so an image_key may point at an original
+    that retention has since thumbnailed or deleted; resolve it with
+    ImageStore.current_key before use.
+    """
+
+    def __init__(self, root=RESULTS_LOG_ROOT, segment_entries=RESULTS_LOG_SEGMENT_ENTRIES,
+                 max_segments=RESULTS_LOG_MAX_SEGMENTS, max_entries=RESULTS_LOG_MAX_ENTRIES,
+                 fsync=RESULTS_LOG_FSYNC):
+        self.root = root
+        self.segment_entries = max(1, segment_entries)
+        self.max_segments = max(1, max_segments)
+        self.max_entries = max(0, max_entries)
+        self.fsync = fsync
+        os.makedirs(root, exist_ok=True)
+
+        self._locks = {}
+        self._locks_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._appends = 0
+        self._reads = 0
+        self._entries_read = 0
+        self._compactions = 0
+        self._entries_dropped = 0
+        self._repairs = 0
+
+    def user_dir(self, user_id):
+        digest = hashlib.blake2b(str(user_id).encode('utf-8'), digest_size=16).hexdigest()
+        return os.path.join(self.root, digest[:2], digest)
+
+    @contextmanager
+    def _locked(self, user_id, exclusive):
+        directory = self.user_dir(user_id)
+        with self._locks_lock:
+            lock = self._locks.get(directory)
+            if lock is None:
+                lock = self._locks[directory] = threading.Lock()
+        with lock:
+            if fcntl is None:
+                yield directory
+                return
+            os.makedirs(directory, exist_ok=True)
+            with open(os.path.join(directory, 'lock'), 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+                try:
+                    yield directory
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    # Segments
+    @staticmethod
+    def _segments(directory, stale=None):
+        """(base position, entry count) of each live segment, oldest first
+
+        A merge interrupted by a crash can leave segments whose entries the
+        merged one also holds; of two overlapping segments the one reaching
+        further is live, and the other is added to stale if given.
+        """
+        try:
+            names = os.listdir(directory)
+        except FileNotFoundError:
+            return []
+        found = []
+        for name in names:
+            if name.endswith(INDEX_SUFFIX):
+                base = int(name[:-len(INDEX_SUFFIX)])
+                size = os.path.getsize(os.path.join(directory, name))
+                found.append((base, size // OFFSET.size))
+        found.sort()
+
+        segments = []
+        for base, count in found:
+            while segments and sum(segments[-1]) > base and base + count >= sum(segments[-1]):
+                dropped = segments.pop()
+                if stale is not None:
+                    stale.append(dropped)
+            if segments and sum(segments[-1]) > base:
+                if stale is not None:
+                    stale.append((base, count))
+                continue
+            segments.append((base, count))
+        return segments
+
+    @staticmethod
+    def _paths(directory, base):
+        name = f"{base:012d}"
+        return os.path.join(directory, name + SEGMENT_SUFFIX), os.path.join(directory, name + INDEX_SUFFIX)
+
+    def _repair(self, directory, base, count):
+        """Make a segment's index match its complete lines after a crash mid-append; returns the entry count"""
+        segment_path, index_path = self._paths(directory, base)
+        if not os.path.exists(segment_path):
+            # A crash between creating the index and the segment (or right after a rollover)
+            # leaves an index without its segment: nothing was written, so start the segment empty
+            if count:
+                with open(index_path, 'r+b') as index:
+                    index.truncate(0)
+                with self._stats_lock:
+                    self._repairs += 1
+                logger.warning(f"Reset index {index_path} of missing result log segment")
+            return 0
+        with open(index_path, 'rb') as index:
+            if count:
+                index.seek((count - 1) * OFFSET.size)
+                last = OFFSET.unpack(index.read(OFFSET.size))[0]
+            else:
+                last = 0
+        with open(segment_path, 'rb') as segment:
+            segment.seek(last)
+            tail = segment.read()
+
+        if count:
+            # The last indexed line must be the last (complete) line in the file
+            first_end = tail.find(b'\n')
+            if first_end == len(tail) - 1:
+                return count
+            tail_start = last + first_end + 1 if first_end >= 0 else last
+            tail = tail[first_end + 1:] if first_end >= 0 else b''
+        else:
+            if not tail:
+                return 0
+            tail_start = 0
+
+        offsets = []
+        position = 0
+        while True:
+            end = tail.find(b'\n', position)
+            if end < 0:
+                break
+            offsets.append(tail_start + position)
+            position = end + 1
+        complete = tail_start + position
+
+        with open(segment_path, 'r+b') as segment:
+            segment.truncate(complete)
+        with open(index_path, 'ab') as index:
+            index.truncate(count * OFFSET.size)
+            index.write(b''.join(OFFSET.pack(offset) for offset in offsets))
+        with self._stats_lock:
+            self._repairs += 1
+        logger.warning(f"Repaired result log segment {segment_path}: indexed {len(offsets)} lines")
+        return count + len(offsets)
+
+    # Writes
+    def append(self, user_id, record):
+        """Append one result to the user's log and return its position"""
+        line = (json.dumps(record, separators=(',', ':'), default=str) + '\n').encode('utf-8')
+        with self._locked(user_id, exclusive=True) as directory:
+            os.makedirs(directory, exist_ok=True)
+            segments = self._segments(directory)
+            if segments:
+                base, count = segments[-1]
+                count = self._repair(directory, base, count)
+                if count >= self.segment_entries:
+                    base, count = base + count, 0
+            else:
+                base, count = 0, 0
+
+            # The index is created first, so a line written just before a crash is found by _repair
+            segment_path, index_path = self._paths(directory, base)
+            with open(index_path, 'ab') as index, open(segment_path, 'ab') as segment:
+                offset = segment.tell()
+                segment.write(line)
+                segment.flush()
+                if self.fsync:
+                    os.fsync(segment.fileno())
+                index.write(OFFSET.pack(offset))
+                if self.fsync:
+                    index.flush()
+                    os.fsync(index.fileno())
+
+            sealed = len(segments) if count == 0 else len(segments) - 1
+            if sealed > self.max_segments:
+                self._compact(directory)
+
+        with self._stats_lock:
+            self._appends += 1
+        return base + count
+
+    def compact(self, user_id):
+        """Merge a user's sealed segments now"""
+        with self._locked(user_id, exclusive=True) as directory:
+            return self._compact(directory)
+
+    def _compact(self, directory):
+        stale = []
+        segments = self._segments(directory, stale)
+        sealed = segments[:-1]
+        total = sum(count for _, count in sealed)
+        # Entries of the active segment count towards the limit but it is never rewritten
+        keep = total if not self.max_entries or not segments else max(0, min(total, self.max_entries - segments[-1][1]))
+        if len(sealed) < 2 and keep == total:
+            self._remove_segments(directory, stale)
+            return 0
+        if keep == 0:
+            self._remove_segments(directory, sealed + stale)
+            with self._stats_lock:
+                self._compactions += 1
+                self._entries_dropped += total
+            return len(sealed)
+
+        skip = total - keep
+        merged_base = sealed[0][0] + skip
+        merged_segment, merged_index = self._paths(directory, merged_base)
+        tmp_segment, tmp_index = merged_segment + '.tmp', merged_index + '.tmp'
+        with open(tmp_segment, 'wb') as out, open(tmp_index, 'wb') as out_index:
+            for base, count in sealed:
+                start = min(count, skip)
+                skip -= start
+                if start == count:
+                    continue
+                segment_path, index_path = self._paths(directory, base)
+                offsets = self._read_offsets(index_path, start, count)
+                with open(segment_path, 'rb') as segment:
+                    segment.seek(offsets[0])
+                    data = segment.read()
+                shift = out.tell() - offsets[0]
+                out.write(data)
+                out_index.write(b''.join(OFFSET.pack(offset + shift) for offset in offsets))
+            out.flush()
+            out_index.flush()
+            os.fsync(out.fileno())
+            os.fsync(out_index.fileno())
+
+        # If the merged segment replaces one of the same base, that one's lines are its prefix,
+        # so the old index stays valid until the new one lands. Whatever a crash leaves
+        # behind after this point overlaps the merged segment and is ignored.
+        os.replace(tmp_segment, merged_segment)
+        os.replace(tmp_index, merged_index)
+        self._remove_segments(directory, [segment for segment in sealed if segment[0] != merged_base] + stale)
+
+        with self._stats_lock:
+            self._compactions += 1
+            self._entries_dropped += total - keep
+        return len(sealed)
+
+    def _remove_segments(self, directory, segments):
+        for base, _ in segments:
+            segment_path, index_path = self._paths(directory, base)
+            for path in (index_path, segment_path):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+    @staticmethod
+    def _read_offsets(index_path, start, end):
+        with open(index_path, 'rb') as index:
+            index.seek(start * OFFSET.size)
+            data = index.read((end - start) * OFFSET.size)
+        return [offset for (offset,) in OFFSET.iter_unpack(data)]
+
+    # Reads
+    def newest(self, user_id, limit=10, before=None):
+        """A user's newest results, newest first, and the cursor for the next older page
+
+        before is the cursor returned by a previous call; the cursor is None
+        once the oldest result has been returned.
+        """
+        before = int(before) if before is not None else None
+        records = []
+        with self._locked(user_id, exclusive=False) as directory:
+            segments = self._segments(directory)
+            position = None
+            for base, count in reversed(segments):
+                if len(records) >= limit:
+                    break
+                end = count if before is None else min(count, before - base)
+                if end <= 0:
+                    continue
+                start = max(0, end - (limit - len(records)))
+                segment_path, index_path = self._paths(directory, base)
+                offsets = self._read_offsets(index_path, start, end)
+                with open(segment_path, 'rb') as segment:
+                    segment.seek(offsets[0])
+                    if end < count:
+                        stop = self._read_offsets(index_path, end, end + 1)[0]
+                        data = segment.read(stop - offsets[0])
+                    else:
+                        data = segment.read()
+                lines = data.split(b'\n')[:len(offsets)]
+                records.extend(json.loads(line) for line in reversed(lines))
+                position = base + start
+
+        with self._stats_lock:
+            self._reads += 1
+            self._entries_read += len(records)
+        oldest_base = segments[0][0] if segments else 0
+        next_cursor = str(position) if records and len(records) >= limit and position > oldest_base else None
+        return records, next_cursor
+
+    def get_metrics(self):
+        """Return append, read and compaction counters"""
+        with self._stats_lock:
+            reads = self._reads
+            return {
+                'appends': self._appends,
+                'reads': reads,
+                'avg_entries_per_read': round(self._entries_read / reads, 2) if reads else 0.0,
+                'compactions': self._compactions,
+                'entries_dropped': self._entries_dropped,
+                'repairs': self._repairs,
+            }
+
+
+class DatabaseResults:
+    """The ResultsLog interface on top of Database, for deployments that keep results in MySQL"""
+
+    def __init__(self, db):
+        self.db = db
+
+    def append(self, user_id, record):
+        return self.db.add_stress_result(
+            user_id=user_id,
+            stress_level=record.get('stress_level'),
+            stress_score=record.get('stress_score'),
+            image_path=record.get('image_key'),
+            faces=record.get('faces')
+        )
+
+    def newest(self, user_id, limit=10, before=None):
+        from database import encode_cursor, parse_cursor
+        rows = self.db.get_stress_results(user_id, limit=limit, before=parse_cursor(before) if before else None)
+        records = [
+            {
+                'success': True,
+                'id': row['id'],
+                'user_id': row['user_id'],
+                'stress_level': row['stress_level'],
+                'stress_score': row['stress_score'],
+                'faces': row.get('faces'),
+                'image_key': row.get('image_path'),
+                'timestamp': row['created_at'] if isinstance(row['created_at'], str) else row['created_at'].isoformat(),
+            }
+            for row in rows
+        ]
+        next_cursor = encode_cursor(rows[-1]['created_at'], rows[-1]['id']) if len(rows) == limit else None
+        return records, next_cursor
+
+    def get_metrics(self):
+        return self.db.get_metrics()
+
+
+def import_legacy(results, upload_dir):
+    """Append old uploads/<user>_<time>_result.json files to the log, oldest first"""
+    by_user = {}
+    for entry in os.scandir(upload_dir):
+        if entry.is_file() and entry.name.endswith('_result.json'):
+            with open(entry.path) as f:
+                record = json.load(f)
+            user_id = record.get('user_id') or entry.name.split('_', 1)[0]
+            by_user.setdefault(user_id, []).append(record)
+
+    imported = 0
+    for user_id, records in by_user.items():
+        records.sort(key=lambda record: record.get('timestamp', ''))
+        for record in records:
+            results.append(user_id, record)
+            imported += 1
+    return imported
+
+
+if __name__ == '__main__':
+    # One-off migration: python results_log.py [uploads dir]
+    logging.basicConfig(level=logging.INFO)
+    count = import_legacy(ResultsLog(), sys.argv[1] if len(sys.argv) > 1 else 'uploads')
+    logger.info(f"Imported {count} legacy results")
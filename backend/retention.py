@@ -0,0 +1,351 @@
+import io
+import os
+import re
+import time
+import uuid
+import logging
+import threading
+
+from PIL import Image
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process exclusion
+    fcntl = None
+
+from image_store import KEY_PATTERN, THUMBNAIL_EXT
+
+logger = logging.getLogger(__name__)
+
+# Originals are kept this many days, then replaced by a small WebP thumbnail,
+# which is deleted once the image is RETENTION_DELETE_DAYS old (0 keeps thumbnails forever)
+RETENTION_ORIGINAL_DAYS = float(os.environ.get('RETENTION_ORIGINAL_DAYS', 30))
+RETENTION_DELETE_DAYS = float(os.environ.get('RETENTION_DELETE_DAYS', 365))
+RETENTION_THUMBNAIL_SIZE = int(os.environ.get('RETENTION_THUMBNAIL_SIZE', 160))
+RETENTION_THUMBNAIL_QUALITY = int(os.environ.get('RETENTION_THUMBNAIL_QUALITY', 60))
+# Seconds between passes, files handled per batch and the pause between batches
+RETENTION_INTERVAL = float(os.environ.get('RETENTION_INTERVAL', 3600))
+RETENTION_BATCH_SIZE = int(os.environ.get('RETENTION_BATCH_SIZE', 200))
+RETENTION_BATCH_PAUSE = float(os.environ.get('RETENTION_BATCH_PAUSE', 0.05))
+RETENTION_ENABLED = os.environ.get('RETENTION_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+
+DAY = 86400
+# EXIF ImageDescription of a thumbnail records the original size, so face boxes can be scaled
+ORIGINAL_SIZE_TAG = 0x010E
+ORIGINAL_SIZE_PATTERN = re.compile(r'^original=(\d+)x(\d+)$')
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+SHARD_PATTERN = re.compile(r'^[0-9a-f]{2}$')
+CURSOR_FILE = '.retention_cursor'
+LOCK_FILE = '.retention_lock'
+
+
+def make_thumbnail(data, size=RETENTION_THUMBNAIL_SIZE, quality=RETENTION_THUMBNAIL_QUALITY):
+    """Downscale image bytes to a WebP thumbnail that remembers the original size"""
+    with Image.open(io.BytesIO(data)) as image:
+        original = image.size
+        image = image.convert('RGB')
+        image.thumbnail((size, size))
+        exif = Image.Exif()
+        exif[ORIGINAL_SIZE_TAG] = f"original={original[0]}x{original[1]}"
+        out = io.BytesIO()
+        image.save(out, 'WEBP', quality=quality, exif=exif.tobytes())
+    return out.getvalue()
+
+
+def thumbnail_scale(data):
+    """Factor from original to thumbnail coordinates, or 1.0 for anything else"""
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            match = ORIGINAL_SIZE_PATTERN.match(str(image.getexif().get(ORIGINAL_SIZE_TAG, '')))
+            if not match:
+                return 1.0
+            return image.size[0] / int(match.group(1))
+    except Exception:
+        return 1.0
+
+
+class RetentionCompactor:
+    """Background pass over the image store that tiers and expires old images
+
+    Each pass walks the two-level shard directories in order, a batch of
+    files at a time with a pause in between, so it never holds the disk for
+    long. Originals older than original_days get a WebP thumbnail next to
+    them (same content hash, .webp key); images older than delete_days are
+    removed. stress_results.image_path is rewritten through
+    update_image_paths({old: new or None}) before any file is deleted, so a
+    crash leaves at worst an extra file. api.py's append-only result log is
+    not rewritten: its entries keep the original key, which
+    ImageStore.current_key maps to the thumbnail or to None. The last finished shard is saved,
+    so a restarted process resumes the pass. Files left in the flat root by
+    older versions (originals, _result.jpg copies, _result.json files) are
+    handled at the end of each pass.
+    """
+
+    def __init__(self, store, update_image_paths, original_days=RETENTION_ORIGINAL_DAYS,
+                 delete_days=RETENTION_DELETE_DAYS, thumbnail_size=RETENTION_THUMBNAIL_SIZE,
+                 thumbnail_quality=RETENTION_THUMBNAIL_QUALITY, interval=RETENTION_INTERVAL,
+                 batch_size=RETENTION_BATCH_SIZE, batch_pause=RETENTION_BATCH_PAUSE):
+        self.store = store
+        self.root = store.root
+        self.update_image_paths = update_image_paths
+        self.original_age = original_days * DAY
+        self.delete_age = delete_days * DAY if delete_days > 0 else None
+        self.thumbnail_size = thumbnail_size
+        self.thumbnail_quality = thumbnail_quality
+        self.interval = interval
+        self.batch_size = max(1, batch_size)
+        self.batch_pause = batch_pause
+
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+        self._passes = 0
+        self._scanned = 0
+        self._thumbnails = 0
+        self._deleted = 0
+        self._failed = 0
+        self._bytes_reclaimed = 0
+        self._last_pass_seconds = None
+        self._last_pass_at = None
+        self._total_seconds = 0.0
+
+    def start(self):
+        """Run passes on a background thread every interval seconds"""
+        self._thread = threading.Thread(target=self._run, name='retention', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.run_pass()
+            except Exception as e:
+                logger.error(f"Retention pass failed: {e}")
+            self._stop.wait(self.interval)
+
+    def close(self, timeout=10):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def run_pass(self, now=None):
+        """Run one full pass unless another process is running one; returns bytes reclaimed"""
+        lock_file = open(os.path.join(self.root, LOCK_FILE), 'a')
+        try:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    return 0
+            return self._pass(now)
+        finally:
+            lock_file.close()
+
+    def _pass(self, now):
+        started = time.monotonic()
+        with self._lock:
+            reclaimed_before = self._bytes_reclaimed
+
+        resume_after = self._read_cursor()
+        batch = []
+        for shard in self._shards():
+            if resume_after is not None and shard <= resume_after:
+                continue
+            for entry in self._entries(os.path.join(self.root, *shard.split('/'))):
+                batch.append(entry)
+                if len(batch) >= self.batch_size:
+                    self._process(batch, now)
+                    batch = []
+                    if self._stop.wait(self.batch_pause):
+                        return self._reclaimed_since(reclaimed_before)
+            self._process(batch, now)
+            batch = []
+            self._write_cursor(shard)
+
+        legacy = [entry for entry in self._entries(self.root) if not entry.name.startswith('.')]
+        for offset in range(0, len(legacy), self.batch_size):
+            self._process(legacy[offset:offset + self.batch_size], now, legacy=True)
+            if self._stop.wait(self.batch_pause):
+                return self._reclaimed_since(reclaimed_before)
+        self._write_cursor(None)
+
+        elapsed = time.monotonic() - started
+        with self._lock:
+            self._passes += 1
+            self._last_pass_seconds = elapsed
+            self._last_pass_at = time.time()
+            self._total_seconds += elapsed
+        reclaimed = self._reclaimed_since(reclaimed_before)
+        logger.info(f"Retention pass reclaimed {reclaimed} bytes in {elapsed:.1f}s")
+        return reclaimed
+
+    def _reclaimed_since(self, before):
+        with self._lock:
+            return self._bytes_reclaimed - before
+
+    def _shards(self):
+        """'ab/cd' shard directories in sorted order"""
+        for first in sorted(name for name in os.listdir(self.root) if SHARD_PATTERN.match(name)):
+            first_path = os.path.join(self.root, first)
+            if not os.path.isdir(first_path):
+                continue
+            for second in sorted(name for name in os.listdir(first_path) if SHARD_PATTERN.match(name)):
+                yield f"{first}/{second}"
+
+    @staticmethod
+    def _entries(directory):
+        try:
+            with os.scandir(directory) as entries:
+                return [entry for entry in entries if entry.is_file(follow_symlinks=False)]
+        except FileNotFoundError:
+            return []
+
+    def _read_cursor(self):
+        try:
+            with open(os.path.join(self.root, CURSOR_FILE)) as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def _write_cursor(self, shard):
+        path = os.path.join(self.root, CURSOR_FILE)
+        with open(path + '.tmp', 'w') as f:
+            f.write(shard or '')
+        os.replace(path + '.tmp', path)
+
+    def _process(self, entries, now, legacy=False):
+        """Decide what happens to each file, update the database, then delete"""
+        now = time.time() if now is None else now
+        renames = {}
+        deletions = []
+        for entry in entries:
+            try:
+                stat = entry.stat(follow_symlinks=False)
+                action = self._plan(entry, stat, now, legacy)
+                if action is None:
+                    continue
+                kind, old_ref, new_ref = action
+                if kind == 'thumbnail':
+                    saved = self._write_thumbnail(entry.path, new_ref, stat)
+                    if saved is None:
+                        continue
+                    renames[old_ref] = new_ref
+                    deletions.append((entry.path, stat, stat.st_size - saved))
+                else:
+                    if old_ref is not None:
+                        renames[old_ref] = None
+                    deletions.append((entry.path, stat, stat.st_size))
+            except OSError as e:
+                with self._lock:
+                    self._failed += 1
+                logger.error(f"Retention could not handle {entry.path}: {e}")
+        with self._lock:
+            self._scanned += len(entries)
+
+        if renames:
+            try:
+                self.update_image_paths(renames)
+            except Exception as e:
+                # Keep every file; the next pass tries again
+                logger.error(f"Retention could not update image paths, keeping files: {e}")
+                with self._lock:
+                    self._failed += len(renames)
+                return
+
+        for path, stat, reclaimed in deletions:
+            try:
+                # An identical upload since the stat refreshed the file; it is not old any more
+                if os.stat(path).st_mtime != stat.st_mtime:
+                    continue
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            except OSError as e:
+                logger.error(f"Retention could not delete {path}: {e}")
+                continue
+            with self._lock:
+                self._deleted += 1
+                self._bytes_reclaimed += reclaimed
+
+    def _plan(self, entry, stat, now, legacy):
+        """(action, old image_path, new image_path) for one file, or None to keep it"""
+        name = entry.name
+        age = now - stat.st_mtime
+        if name.endswith('.tmp'):
+            # Write interrupted by a crash
+            return ('delete', None, None) if age > DAY else None
+
+        if self.delete_age is not None and age >= self.delete_age:
+            reference = name if not legacy else os.path.join(self.store.root, name)
+            return 'delete', reference if name.lower().endswith(IMAGE_EXTENSIONS) else None, None
+
+        if legacy:
+            if name.endswith('_result.jpg') and age >= self.original_age:
+                # Annotated copies are rendered on demand now
+                return 'delete', None, None
+            if name.endswith('_result.json') or not name.lower().endswith(IMAGE_EXTENSIONS):
+                return None
+            if age >= self.original_age:
+                with open(entry.path, 'rb') as f:
+                    digest = self.store.key_for(f.read()).split('.', 1)[0]
+                return 'thumbnail', os.path.join(self.store.root, name), digest + THUMBNAIL_EXT
+            return None
+
+        if not KEY_PATTERN.match(name) or name.endswith(THUMBNAIL_EXT):
+            return None
+        if age >= self.original_age:
+            return 'thumbnail', name, name.split('.', 1)[0] + THUMBNAIL_EXT
+        return None
+
+    def _write_thumbnail(self, source, key, stat):
+        """Write the thumbnail for a file under key; returns its size, or None if the file is not an image"""
+        with open(source, 'rb') as f:
+            data = f.read()
+        try:
+            thumbnail = make_thumbnail(data, self.thumbnail_size, self.thumbnail_quality)
+        except Exception as e:
+            logger.warning(f"Retention skipped {source}, not a readable image: {e}")
+            return None
+
+        path = self.store.path_for(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(thumbnail)
+            f.flush()
+            os.fsync(f.fileno())
+        # The thumbnail keeps the original's age, so it expires on the original's schedule
+        os.utime(tmp_path, (stat.st_atime, stat.st_mtime))
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._thumbnails += 1
+        return len(thumbnail)
+
+    def get_metrics(self):
+        """Return pass timing, files handled and bytes reclaimed"""
+        with self._lock:
+            return {
+                'passes': self._passes,
+                'files_scanned': self._scanned,
+                'thumbnails_created': self._thumbnails,
+                'files_deleted': self._deleted,
+                'failures': self._failed,
+                'bytes_reclaimed': self._bytes_reclaimed,
+                'last_pass_seconds': round(self._last_pass_seconds, 3) if self._last_pass_seconds is not None else None,
+                'last_pass_at': self._last_pass_at,
+                'total_run_seconds': round(self._total_seconds, 3),
+            }
+
+
+if __name__ == '__main__':
+    # Batch job: python retention.py runs one pass and prints what it reclaimed
+    from database import Database
+    from image_store import get_image_store
+    logging.basicConfig(level=logging.INFO)
+    db = Database()
+    store = get_image_store()
+    compactor = RetentionCompactor(store, db.update_image_paths)
+    compactor.run_pass()
+    print(compactor.get_metrics())
+    store.close()
+    db.close()
@@ -0,0 +1,226 @@
+"""Pre-fork production server for app.py (or api.py)
+
+The master binds the listening socket and imports the app module, then forks
+worker processes that inherit both. Each worker calls the module's
+create_app(), so database pools, background threads, the email outbox, the
+password hashing pool and the TensorFlow model are created after the fork,
+and serves requests on a fixed pool of threads. Every worker loads its own
+copy of the model: TensorFlow cannot be initialized before a fork, and its
+variables are private to the process, so the weights are not shared.
+Workers that die are replaced; SIGTERM or Ctrl-C stops them gracefully.
+
+    python serve.py [--app app] [--workers 4] [--threads 8] [--bind 0.0.0.0:5000]
+"""
+import os
+import sys
+import time
+import errno
+import signal
+import socket
+import logging
+import argparse
+import importlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+
+logger = logging.getLogger('serve')
+
+SERVE_APP = os.environ.get('SERVE_APP', 'app')
+SERVE_BIND = os.environ.get('SERVE_BIND', f"0.0.0.0:{os.environ.get('PORT', 5000)}")
+# Each worker holds its own copy of the TensorFlow model, so a few go a long way
+SERVE_WORKERS = int(os.environ.get('SERVE_WORKERS', min(os.cpu_count() or 1, 4)))
+# Requests (and open websockets) each worker serves at once
+SERVE_THREADS = int(os.environ.get('SERVE_THREADS', 8))
+# Idle keep-alive connections and silent websockets are closed after this many seconds
+SERVE_KEEPALIVE = float(os.environ.get('SERVE_KEEPALIVE', 60))
+# How long workers get to finish in-flight requests on shutdown before they are killed
+SERVE_GRACEFUL_TIMEOUT = float(os.environ.get('SERVE_GRACEFUL_TIMEOUT', 30))
+SERVE_BACKLOG = int(os.environ.get('SERVE_BACKLOG', 1024))
+
+# A worker dying sooner than this after it started is respawned only after the same delay
+MIN_WORKER_LIFETIME = 1.0
+
+
+class RequestHandler(WSGIRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    timeout = SERVE_KEEPALIVE
+
+
+class PooledWSGIServer(BaseWSGIServer):
+    """Werkzeug's WSGI server handing connections to a fixed pool of threads
+
+    A connection is only accepted once a thread is free for it, so a busy
+    worker leaves new connections in the shared backlog for the others.
+    """
+
+    multithread = True
+
+    def __init__(self, host, port, app, threads, fd):
+        super().__init__(host, port, app, handler=RequestHandler, fd=fd)
+        self.threads = max(1, threads)
+        self._slots = threading.BoundedSemaphore(self.threads)
+        self.pool = ThreadPoolExecutor(self.threads, thread_name_prefix='request')
+
+    def get_request(self):
+        if not self._slots.acquire(timeout=0.5):
+            raise BlockingIOError(errno.EAGAIN, 'No free request thread')
+        try:
+            return super().get_request()
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def process_request(self, request, client_address):
+        try:
+            self.pool.submit(self._process, request, client_address)
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def _process(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self._slots.release()
+
+
+def parse_bind(bind):
+    host, _, port = bind.rpartition(':')
+    return host.strip('[]') or '0.0.0.0', int(port)
+
+
+def open_listener(host, port, backlog):
+    listener = socket.create_server(
+        (host, port),
+        family=socket.AF_INET6 if ':' in host else socket.AF_INET,
+        backlog=backlog
+    )
+    # Workers race to accept; the losers must not block in accept()
+    listener.setblocking(False)
+    return listener
+
+
+def preload(app_module):
+    """Import the app in the master, before any fork"""
+    importlib.import_module(app_module)
+
+    if threading.active_count() > 1 or 'tensorflow' in sys.modules:
+        # Threads and TensorFlow's runtime do not survive a fork
+        logger.warning("Importing the app started threads or TensorFlow; workers may misbehave after fork")
+
+
+def run_worker(index, listener, args):
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    os.environ['SERVE_WORKER_INDEX'] = str(index)
+
+    app = importlib.import_module(args.app).create_app()
+    host, port = parse_bind(args.bind)
+    server = PooledWSGIServer(host, port, app, args.threads, fd=listener.fileno())
+    listener.close()
+
+    def stop(signum, frame):
+        # shutdown() waits for serve_forever() to return, so it cannot run on this thread
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, stop)
+    logger.info(f"Worker {index} (pid {os.getpid()}) serving with {server.threads} threads")
+    server.serve_forever()
+    server.pool.shutdown(wait=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--app', default=SERVE_APP, help='module with a create_app() factory')
+    parser.add_argument('--bind', default=SERVE_BIND)
+    parser.add_argument('--workers', type=int, default=SERVE_WORKERS)
+    parser.add_argument('--threads', type=int, default=SERVE_THREADS)
+    parser.add_argument('--graceful-timeout', type=float, default=SERVE_GRACEFUL_TIMEOUT)
+    args = parser.parse_args()
+    args.workers = max(1, args.workers)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(process)d] %(name)s: %(message)s')
+    # The CPU cores meant for password hashing are split between the workers' pools
+    os.environ.setdefault('PASSWORD_HASH_WORKERS', str(max(1, (os.cpu_count() or 2) // 2 // args.workers)))
+
+    host, port = parse_bind(args.bind)
+    listener = open_listener(host, port, SERVE_BACKLOG)
+    preload(args.app)
+
+    master = os.getpid()
+    workers = {}  # pid -> (worker index, start time)
+    stop = []
+
+    def spawn(index):
+        pid = os.fork()
+        if pid == 0:
+            # Exits through the interpreter, so the app's atexit cleanup runs
+            try:
+                run_worker(index, listener, args)
+            except Exception:
+                logger.exception(f"Worker {index} failed")
+                sys.exit(1)
+            sys.exit(0)
+        workers[pid] = (index, time.monotonic())
+
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.append(signum))
+    signal.signal(signal.SIGINT, lambda signum, frame: stop.append(signum))
+    logger.info(f"Listening on {host}:{port} with {args.workers} workers x {args.threads} threads")
+
+    try:
+        for index in range(args.workers):
+            spawn(index)
+        while not stop:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+            if pid == 0 or pid not in workers:
+                time.sleep(0.2)
+                continue
+            index, started = workers.pop(pid)
+            logger.warning(f"Worker {index} (pid {pid}) exited with status {os.waitstatus_to_exitcode(status)}, respawning")
+            if time.monotonic() - started < MIN_WORKER_LIFETIME:
+                time.sleep(MIN_WORKER_LIFETIME)
+            if not stop:
+                spawn(index)
+    finally:
+        if os.getpid() == master:
+            shutdown_workers(workers, args.graceful_timeout)
+            listener.close()
+
+
+def shutdown_workers(workers, graceful_timeout):
+    """SIGTERM every worker, then SIGKILL those still running after the graceful timeout"""
+    for pid in workers:
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+
+    deadline = time.monotonic() + graceful_timeout
+    while workers and time.monotonic() < deadline:
+        try:
+            pid, _ = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            workers.clear()
+            break
+        if pid == 0:
+            time.sleep(0.1)
+        else:
+            workers.pop(pid, None)
+
+    for pid in workers:
+        logger.warning(f"Worker pid {pid} did not stop in {graceful_timeout:.0f}s, killing it")
+        try:
+            os.kill(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+        except (ProcessLookupError, ChildProcessError):
+            pass
+    logger.info("All workers stopped")
+
+
+if __name__ == '__main__':
+    main()
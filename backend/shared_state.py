@@ -0,0 +1,30 @@
+import os
+import sqlite3
+from contextlib import contextmanager
+
+# SQLite file holding state every worker process must agree on: failed-login
+# windows and high-stress alert cooldowns. Like the email outbox, all serve.py
+# workers open the same file.
+SHARED_STATE_PATH = os.environ.get('SHARED_STATE_PATH', 'shared_state.db')
+# Seconds a writer waits for another process's transaction before giving up
+SHARED_STATE_BUSY_TIMEOUT = float(os.environ.get('SHARED_STATE_BUSY_TIMEOUT', 5))
+
+
+def open_state_db(path=SHARED_STATE_PATH):
+    """Open the shared state file for use by several threads behind one lock"""
+    db = sqlite3.connect(path, timeout=SHARED_STATE_BUSY_TIMEOUT, check_same_thread=False, isolation_level=None)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA synchronous=NORMAL")
+    return db
+
+
+@contextmanager
+def transaction(db):
+    """Read-modify-write block that no other process can interleave with"""
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        yield db
+    except BaseException:
+        db.execute("ROLLBACK")
+        raise
+    db.execute("COMMIT")
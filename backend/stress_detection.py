@@ -1,225 +1,247 @@
 
 import os
 import base64
+import logging
 import cv2
 import numpy as np
-import tensorflow as tf
-from tensorflow.keras.models import Sequential, load_model
-from tensorflow.keras.layers import Conv2D, MaxPooling2D, Dense, Dropout, Flatten
-from tensorflow.keras.optimizers import Adam
-from datetime import datetime
 from database import Database
+from model_registry import get_registry
+from inference_queue import InferenceBusy
+from write_behind import WriteBufferFull
+from face_detection import FaceDetector, FaceTracker
+from image_store import get_image_store, PERSIST_IMAGES
+from result_cache import PerceptualCache, dhash, MISS
+from retention import thumbnail_scale, THUMBNAIL_EXT
 import io
 from PIL import Image
 
+logger = logging.getLogger(__name__)
+
+# Box colors per stress level (BGR)
+STRESS_COLORS = {
+    "low": (0, 255, 0),       # Green
+    "medium": (0, 165, 255),  # Orange
+    "high": (0, 0, 255)       # Red
+}
+
+def encode_jpeg(image):
+    """Encode a BGR image as JPEG bytes"""
+    _, buffer = cv2.imencode('.jpg', image)
+    return buffer.tobytes()
+
+def draw_annotations(image, faces):
+    """Draw each face box and its stress label onto the image in place"""
+    for face in faces:
+        x, y, w, h = face['box']
+        color = STRESS_COLORS.get(face['level'], STRESS_COLORS['high'])
+        cv2.rectangle(image, (x, y), (x+w, y+h), color, 2)
+        cv2.putText(image, f"{face['level'].upper()}: {face['score']:.1f}%",
+                    (x, y-10), cv2.FONT_HERSHEY_SIMPLEX, 0.7, color, 2)
+    return image
+
 class StressDetectionAPI:
     def __init__(self):
-        # Ensure model and uploads directories exist
-        os.makedirs('models', exist_ok=True)
-        os.makedirs('uploads', exist_ok=True)
-        
-        self.model_path = 'models/stress_detection_model.h5'
+        # The model and its batcher are shared by everything in this process
+        self.registry = get_registry()
+        self.model_path = self.registry.model_path
+        self.batcher = self.registry.batcher
+        self.registry.start_background_load()
         
-        # Try to load existing model, otherwise build and train a new one
-        if os.path.exists(self.model_path):
-            try:
-                print("Loading existing stress detection model...")
-                self.model = load_model(self.model_path)
-                print("Model loaded successfully")
-            except Exception as e:
-                print(f"Error loading model: {e}")
-                self.model = self._build_model()
-        else:
-            print("Building new stress detection model...")
-            self.model = self._build_model()
-            print("Model built successfully")
+        # Analyzed images are content-addressed and written off the request thread
+        self.images = get_image_store()
         
         self.db = Database()
-        self.face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+        self.face_detector = FaceDetector(scale_factor=1.05, min_neighbors=(5, 3), min_size=(30, 30))
+        self.face_tracker = FaceTracker(self.face_detector)
+        # Near-identical webcam frames reuse the last result instead of being re-scored
+        self.result_cache = PerceptualCache()
     
-    def _build_model(self):
-        """Build a CNN model for stress detection"""
-        model = Sequential([
-            Conv2D(32, (3, 3), activation='relu', input_shape=(48, 48, 1)),
-            MaxPooling2D(pool_size=(2, 2)),
-            
-            Conv2D(64, (3, 3), activation='relu'),
-            MaxPooling2D(pool_size=(2, 2)),
-            
-            Conv2D(128, (3, 3), activation='relu'),
-            MaxPooling2D(pool_size=(2, 2)),
-            
-            Flatten(),
-            Dense(256, activation='relu'),
-            Dropout(0.5),
-            Dense(64, activation='relu'),
-            Dropout(0.3),
-            Dense(1, activation='sigmoid')  # Outputs stress level 0-1
-        ])
-        
-        model.compile(
-            optimizer=Adam(learning_rate=0.0001),
-            loss='mean_squared_error',
-            metrics=['mae']
-        )
-        
-        return model
+    def render_result_image(self, result):
+        """Render the annotated JPEG for a stored result, or None if its image is gone"""
+        data = self.images.get(result.get('image_path'))
+        if data is None:
+            return None
+        image = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+        if image is None:
+            return None
+        faces = result.get('faces') or []
+        if (result.get('image_path') or '').endswith(THUMBNAIL_EXT):
+            # Older results only keep a thumbnail; face boxes are in original pixels
+            scale = thumbnail_scale(data)
+            faces = [dict(face, box=[int(round(v * scale)) for v in face['box']]) for face in faces]
+        return encode_jpeg(draw_annotations(image, faces))
+    
+    @property
+    def model(self):
+        """The current generation of the shared stress detection model"""
+        return self.registry.model
     
     def close(self):
-        """Close the database connection"""
+        """Stop the inference batcher, flush pending image writes and close the database connection"""
+        self.batcher.stop()
+        self.images.close()
         self.db.close()
     
-    def process_image(self, image_path, user_id):
-        """Process image and determine stress level"""
+    def analyze_frame(self, image, user_id, detection_key=None, tracking_key=None):
+        """Detect the face in a decoded BGR frame and score its stress level"""
+        # Convert to grayscale for face detection
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        
+        # Skip detection and scoring for a frame that looks like one analyzed moments ago
+        cache_scope = tracking_key or detection_key or user_id
+        frame_hash = dhash(gray) if self.result_cache.enabled else None
+        if frame_hash is not None:
+            cached = self.result_cache.lookup(cache_scope, frame_hash)
+            if cached is not MISS:
+                return dict(cached) if cached is not None else None
+        
+        analysis = self._analyze_gray(gray, user_id, detection_key, tracking_key)
+        if frame_hash is not None:
+            self.result_cache.store(cache_scope, frame_hash, analysis)
+        return dict(analysis) if analysis is not None else None
+    
+    def _analyze_gray(self, gray, user_id, detection_key, tracking_key):
+        """Run face detection and the stress model on a grayscale frame"""
+        if tracking_key:
+            # Consecutive webcam frames: search around the last known face
+            faces, _ = self.face_tracker.detect(gray, tracking_key)
+        else:
+            # Single cascade pass; detection hints are remembered per user or camera
+            faces, _ = self.face_detector.detect(gray, key=detection_key or user_id)
+        
+        if len(faces) == 0:
+            return None
+        
+        # For the first detected face
+        (x, y, w, h) = (int(v) for v in faces[0])
+        
+        # Extract face ROI and resize to 48x48 for model input
+        face_roi = cv2.resize(gray[y:y+h, x:x+w], (48, 48))
+        
+        # Preprocess the image for our model
+        normalized_face = face_roi.astype('float32') / 255.0
+        normalized_face = np.expand_dims(normalized_face, axis=-1)  # Add channel dimension
+        normalized_face = np.expand_dims(normalized_face, axis=0)   # Add batch dimension
+        
+        # Use the model for prediction (if properly trained)
+        if hasattr(self.model, 'predict'):
+            # Overload and model errors propagate: a demo score must never be stored,
+            # cached or alerted on as if the model had produced it
+            stress_prediction = float(self.batcher.predict(normalized_face)[0])
+            # Scale to 0-100 range
+            stress_score = stress_prediction * 100
+        else:
+            # Fallback to realistic random scores if model isn't available
+            base_stress = 65 + (hash(user_id) % 30)  # Consistent for same user
+            variation = np.random.uniform(-5, 5)
+            stress_score = min(max(base_stress + variation, 40), 95)
+        
+        # Determine stress category
+        if stress_score < 60:
+            stress_level = "low"
+        elif stress_score < 80:
+            stress_level = "medium"
+        else:
+            stress_level = "high"
+        
+        return {
+            "face": (x, y, w, h),
+            "stress_score": float(stress_score),
+            "stress_level": stress_level
+        }
+    
+    def process_image(self, image_path, user_id, detection_key=None, tracking_key=None, original_bytes=None,
+                      annotate=True):
+        """Process image and determine stress level
+
+        Raises InferenceBusy when the inference queue is full or too slow, and
+        WriteBufferFull when the result cannot be queued for the database.
+        """
         try:
-            print(f"Processing image for user {user_id}")
+            logger.debug(f"Processing image for user {user_id}")
             # Handle different image input types
-            if isinstance(image_path, str):
+            if isinstance(image_path, np.ndarray):
+                # Already decoded in memory by the caller
+                image = image_path
+            elif isinstance(image_path, str):
                 if os.path.isfile(image_path):
                     # Regular file path
-                    print(f"Loading image from file: {image_path}")
+                    logger.debug(f"Loading image from file: {image_path}")
                     image = cv2.imread(image_path)
                 elif image_path.startswith('data:image'):
                     # Base64 encoded image data
-                    print("Processing base64 image data")
                     base64_data = image_path.split(',')[1] if ',' in image_path else image_path
                     image_bytes = base64.b64decode(base64_data)
                     nparr = np.frombuffer(image_bytes, np.uint8)
                     image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-                    print("Base64 image decoded successfully")
                 else:
                     return {"success": False, "message": "Invalid image format"}
             else:
                 return {"success": False, "message": "Invalid image path"}
             
             if image is None:
-                print("Failed to load image")
+                logger.warning("Failed to load image")
                 return {"success": False, "message": "Failed to load image"}
             
-            # Convert to grayscale for face detection
-            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-            
-            # Detect faces using multiple scale factors for better accuracy
-            faces = []
-            scale_factors = [1.05, 1.1, 1.2]  # Try different scale factors
-            min_neighbors_options = [3, 5]     # Try different min_neighbors
-            
-            for scale in scale_factors:
-                for min_neighbors in min_neighbors_options:
-                    detected = self.face_cascade.detectMultiScale(
-                        gray,
-                        scaleFactor=scale,
-                        minNeighbors=min_neighbors,
-                        minSize=(30, 30)
-                    )
-                    if len(detected) > 0:
-                        faces = detected
-                        print(f"Face detected using scale={scale}, min_neighbors={min_neighbors}")
-                        break
-                if len(faces) > 0:
-                    break
-            
-            if len(faces) == 0:
-                print("No face detected in the image")
-                return {"success": False, "message": "No face detected in the image. Please try a clearer photo with a visible face."}
-            
-            print(f"Number of faces detected: {len(faces)}")
-            # For the first detected face
-            (x, y, w, h) = faces[0]
-            
-            # Extract face ROI
-            face_roi = gray[y:y+h, x:x+w]
-            
-            # Preprocess face (resize to 48x48 for model input)
-            face_roi = cv2.resize(face_roi, (48, 48))
-            
             # Get user info
             user = self.db.get_user_by_id(user_id)
             
             if not user:
                 return {"success": False, "message": "User not found"}
             
-            # Preprocess the image for our model
-            normalized_face = face_roi.astype('float32') / 255.0
-            normalized_face = np.expand_dims(normalized_face, axis=-1)  # Add channel dimension
-            normalized_face = np.expand_dims(normalized_face, axis=0)   # Add batch dimension
-            
-            # Use the model for prediction (if properly trained)
-            if hasattr(self.model, 'predict'):
-                try:
-                    # Attempt to use the trained model
-                    print("Running stress prediction with model")
-                    stress_prediction = float(self.model.predict(normalized_face, verbose=0)[0][0])
-                    # Scale to 0-100 range
-                    stress_score = stress_prediction * 100
-                    print(f"Predicted stress score: {stress_score:.1f}%")
-                except Exception as e:
-                    print(f"Model prediction failed: {e}, using fallback.")
-                    # Fallback to demo mode if model fails
-                    base_stress = 65 + (hash(user_id) % 30)  # Consistent for same user
-                    variation = np.random.uniform(-5, 5)
-                    stress_score = min(max(base_stress + variation, 40), 95)
-            else:
-                # Fallback to realistic random scores if model isn't available
-                base_stress = 65 + (hash(user_id) % 30)  # Consistent for same user
-                variation = np.random.uniform(-5, 5)
-                stress_score = min(max(base_stress + variation, 40), 95)
-            
-            # Determine stress category
-            if stress_score < 60:
-                stress_level = "low"
-            elif stress_score < 80:
-                stress_level = "medium"
-            else:
-                stress_level = "high"
-            
-            print(f"Stress level determined: {stress_level} ({stress_score:.1f}%)")
+            analysis = self.analyze_frame(image, user_id, detection_key=detection_key, tracking_key=tracking_key)
             
-            # Draw rectangle on image based on stress level
-            if stress_level == "low":
-                color = (0, 255, 0)  # Green
-            elif stress_level == "medium":
-                color = (0, 165, 255)  # Orange
-            else:
-                color = (0, 0, 255)  # Red
-            
-            # Draw rectangle and label
-            cv2.rectangle(image, (x, y), (x+w, y+h), color, 2)
-            cv2.putText(image, f"{stress_level.upper()}: {stress_score:.1f}%", 
-                       (x, y-10), cv2.FONT_HERSHEY_SIMPLEX, 0.7, color, 2)
+            if analysis is None:
+                logger.info("No face detected in the image")
+                return {"success": False, "message": "No face detected in the image. Please try a clearer photo with a visible face."}
             
-            # Save the processed image
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            result_image_path = f"uploads/{user_id}_{timestamp}_result.jpg"
-            cv2.imwrite(result_image_path, image)
+            stress_score = round(float(analysis['stress_score']), 1)
+            stress_level = analysis['stress_level']
+            faces = [{"box": list(analysis['face']), "score": stress_score, "level": stress_level}]
             
-            # Convert to base64 for return
-            with open(result_image_path, "rb") as img_file:
-                img_bytes = img_file.read()
-                img_base64 = base64.b64encode(img_bytes).decode('utf-8')
+            logger.info(f"Stress level determined: {stress_level} ({stress_score:.1f}%)")
             
-            # Round stress score to 1 decimal place
-            stress_score = round(float(stress_score), 1)
+            # Only the original is stored; the annotated image is rendered on demand.
+            # Persisting is optional and happens off the request thread.
+            image_path = None
+            if PERSIST_IMAGES:
+                if original_bytes is None:
+                    original_bytes = encode_jpeg(image)
+                # The store key (content hash) is what the result row keeps
+                image_path = self.images.put(original_bytes)
             
             # Save result to database
-            self.db.add_stress_result(
+            result_id = self.db.add_stress_result(
                 user_id=user_id,
                 stress_level=stress_level,
                 stress_score=stress_score,
-                image_path=result_image_path
+                image_path=image_path,
+                faces=faces
             )
+            if not result_id:
+                return {"success": False, "message": "Failed to save the stress result, please try again."}
             
-            return {
+            result = {
                 "success": True,
+                "result_id": result_id,
                 "stress_level": stress_level,
                 "stress_score": stress_score,
-                "result_image": f"data:image/jpeg;base64,{img_base64}"
+                "faces": faces
             }
+            
+            if annotate:
+                # Encode the annotated image once, straight into the response
+                draw_annotations(image, faces)
+                img_base64 = base64.b64encode(encode_jpeg(image)).decode('utf-8')
+                result["result_image"] = f"data:image/jpeg;base64,{img_base64}"
+            
+            return result
         
+        except (InferenceBusy, WriteBufferFull):
+            # Overload is the route's to report (503), not a processing error
+            raise
         except Exception as e:
-            import traceback
-            print(f"Error processing image: {str(e)}")
-            print(traceback.format_exc())
+            logger.exception(f"Error processing image: {str(e)}")
             return {"success": False, "message": f"Error processing image: {str(e)}"}
     
     # ... keep existing code (get_user_results, get_pending_users, etc. methods)
@@ -0,0 +1,67 @@
+import os
+import math
+
+# Weight of the newest score in the exponentially weighted moving average
+STRESS_EWMA_ALPHA = float(os.environ.get('STRESS_EWMA_ALPHA', 0.3))
+
+# Average scores at or above these count as high / medium stress on the dashboard
+HIGH_STRESS_THRESHOLD = 80
+MEDIUM_STRESS_THRESHOLD = 60
+
+
+class UserStressStats:
+    """Running summary of one user's stress scores, updated as results come in"""
+
+    __slots__ = ('count', 'total', 'total_sq', 'last_score', 'last_level', 'ewma')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.total_sq = 0.0
+        self.last_score = None
+        self.last_level = None
+        self.ewma = None
+
+    def add(self, score, level, alpha=STRESS_EWMA_ALPHA):
+        """Fold one new result into the summary"""
+        self.count += 1
+        self.total += score
+        self.total_sq += score * score
+        self.last_score = score
+        self.last_level = level
+        self.ewma = score if self.ewma is None else self.ewma + alpha * (score - self.ewma)
+
+    @property
+    def average(self):
+        return self.total / self.count if self.count else 0.0
+
+    def to_dict(self):
+        return stats_dict(self.count, self.total, self.total_sq, self.last_score, self.last_level, self.ewma)
+
+
+def stats_dict(count, total, total_sq, last_score, last_level, ewma):
+    """Describe a stress summary with its mean and standard deviation"""
+    average = total / count if count else 0.0
+    variance = max(0.0, total_sq / count - average * average) if count else 0.0
+    return {
+        'count': count,
+        'average': round(average, 1),
+        'stddev': round(math.sqrt(variance), 1),
+        'last_score': last_score,
+        'last_level': last_level,
+        'ewma': round(ewma, 1) if ewma is not None else None,
+    }
+
+
+def ewma_step(scores, alpha=STRESS_EWMA_ALPHA):
+    """Fold several new scores into an EWMA at once
+
+    Returns (decay, contribution, fresh): the updated average is
+    old * decay + contribution, or fresh when there was no average yet.
+    """
+    decay, contribution, fresh = 1.0, 0.0, None
+    for score in scores:
+        decay *= 1 - alpha
+        contribution = contribution * (1 - alpha) + alpha * score
+        fresh = score if fresh is None else fresh + alpha * (score - fresh)
+    return decay, contribution, fresh
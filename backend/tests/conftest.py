@@ -0,0 +1,62 @@
+import os
+import re
+import sys
+
+import pytest
+
+# The backend modules import each other by bare name, as when run from backend/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mysql.connector import ProgrammingError
+from mysql.connector.cursor import RE_SQL_INSERT_VALUES, RE_SQL_ON_DUPLICATE
+
+
+class FakeCursor:
+    """Records statements and checks placeholders the way mysql-connector does
+
+    executemany on an INSERT is rewritten into one multi-row statement built
+    from the VALUES list only, so every parameter has to have a placeholder
+    there; anything else is executed row by row like execute().
+    """
+
+    def __init__(self, rows=None):
+        self.statements = []
+        self.rows = list(rows or [])
+        self.rowcount = 0
+
+    def execute(self, operation, params=()):
+        placeholders = operation.count('%s')
+        if placeholders != len(params):
+            raise ProgrammingError(f"{placeholders} placeholders for {len(params)} parameters")
+        self.statements.append((' '.join(operation.split()), tuple(params)))
+        self.rowcount = 1
+
+    def executemany(self, operation, seq_params):
+        seq_params = list(seq_params)
+        if re.match(r'\s*INSERT', operation, re.IGNORECASE):
+            values = re.search(RE_SQL_INSERT_VALUES, re.sub(RE_SQL_ON_DUPLICATE, '', operation))
+            placeholders = values.group(1).count('%s')
+            for params in seq_params:
+                if placeholders != len(params):
+                    raise ProgrammingError("Not all parameters were used in the SQL statement")
+                self.statements.append((' '.join(operation.split()), tuple(params)))
+            self.rowcount = len(seq_params)
+            return
+        for params in seq_params:
+            self.execute(operation, params)
+        self.rowcount = len(seq_params)
+
+    def fetchone(self):
+        return self.rows.pop(0) if self.rows else None
+
+    def fetchall(self):
+        rows, self.rows = self.rows, []
+        return rows
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def fake_cursor():
+    return FakeCursor()
@@ -0,0 +1,127 @@
+import pytest
+
+from alerts import AlertManager
+
+
+class Mailer:
+    def __init__(self):
+        self.sent = []
+
+    def __call__(self, to_email, subject, body_html):
+        self.sent.append((to_email, subject))
+
+    def subjects(self, to_email):
+        return [subject for email, subject in self.sent if email == to_email]
+
+
+USERS = {'u1': {'email': 'u1@test', 'name': 'One'}, 'u2': {'email': 'u2@test', 'name': 'Two'}}
+
+
+def make_manager(path, mailer, **kwargs):
+    kwargs.setdefault('trigger', 80)
+    kwargs.setdefault('clear', 70)
+    kwargs.setdefault('alpha', 1.0)
+    kwargs.setdefault('cooldown', 100)
+    kwargs.setdefault('digest_interval', 50)
+    kwargs.setdefault('admin_digest_interval', 0)
+    return AlertManager(
+        mailer, USERS.get,
+        lambda: [{'name': 'One', 'stressLevel': 90.0}],
+        lambda: [{'email': 'admin@test', 'name': 'Admin'}],
+        path=str(path), **kwargs
+    )
+
+
+@pytest.fixture
+def mailer():
+    return Mailer()
+
+
+@pytest.fixture
+def manager(tmp_path, mailer):
+    manager = make_manager(tmp_path / 'state.db', mailer)
+    yield manager
+    manager.close()
+
+
+def test_crossing_the_trigger_alerts_once_then_holds(manager, mailer):
+    assert manager.observe('u1', 50, now=0) is None
+    assert manager.observe('u1', 90, now=1) == 'alerted'
+    assert manager.observe('u1', 95, now=2) == 'held'
+    assert manager.observe('u1', 92, now=3) == 'held'
+    assert len(mailer.subjects('u1@test')) == 1
+
+
+def test_hysteresis_rearms_only_below_clear_score(manager, mailer):
+    manager.observe('u1', 90, now=0)
+    # Between the clear and trigger scores: still alerting, nothing held
+    assert manager.observe('u1', 75, now=1) is None
+    assert manager.observe('u1', 60, now=2) is None
+    assert manager.get_metrics()['alerting_users'] == 0
+    # Re-armed, but still inside the cooldown
+    assert manager.observe('u1', 90, now=3) == 'held'
+    assert manager.observe('u1', 60, now=4) is None
+    assert manager.observe('u1', 90, now=200) == 'alerted'
+
+
+def test_held_readings_go_out_in_one_digest(manager, mailer):
+    manager.observe('u1', 90, now=0)
+    manager.observe('u1', 91, now=1)
+    manager.observe('u1', 99, now=2)
+
+    manager.send_digests(now=10)
+    assert mailer.subjects('u1@test') == ['Wellness Alert - High Stress Detected']
+    manager.send_digests(now=60)
+    assert mailer.subjects('u1@test')[-1] == 'Wellness Update - Stress Summary'
+    manager.send_digests(now=200)
+    assert len(mailer.subjects('u1@test')) == 2
+
+
+def test_notify_respects_the_cooldown(manager, mailer):
+    assert manager.notify('u2', score=85, now=0) == 'alerted'
+    assert manager.notify('u2', score=85, now=10) == 'held'
+    assert manager.notify('u2', score=85, now=150) == 'alerted'
+
+
+def test_workers_sharing_the_state_file_share_cooldowns(tmp_path, mailer):
+    path = tmp_path / 'state.db'
+    first, second = make_manager(path, mailer), make_manager(path, mailer)
+    try:
+        assert first.observe('u1', 90, now=0) == 'alerted'
+        assert second.observe('u1', 95, now=1) == 'held'
+        assert second.notify('u1', score=95, now=2) == 'held'
+        assert len(mailer.subjects('u1@test')) == 1
+
+        second.send_digests(now=60)
+        first.send_digests(now=61)
+        assert mailer.subjects('u1@test').count('Wellness Update - Stress Summary') == 1
+    finally:
+        first.close()
+        second.close()
+
+
+def test_admin_digest_is_sent_by_one_worker_per_interval(tmp_path, mailer):
+    path = tmp_path / 'state.db'
+    first = make_manager(path, mailer, admin_digest_interval=100)
+    second = make_manager(path, mailer, admin_digest_interval=100)
+    try:
+        first.observe('u1', 90)
+        first.send_digests(force=True)
+        second.send_digests(force=False)
+        assert mailer.subjects('admin@test') == ['Workplace Wellness - High Stress Summary']
+    finally:
+        first.close()
+        second.close()
+
+
+def test_state_survives_a_restart(tmp_path, mailer):
+    path = tmp_path / 'state.db'
+    manager = make_manager(path, mailer)
+    manager.observe('u1', 90, now=0)
+    manager.close()
+
+    restarted = make_manager(path, mailer)
+    try:
+        assert restarted.observe('u1', 90, now=5) == 'held'
+    finally:
+        restarted.close()
@@ -0,0 +1,87 @@
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+import analytics
+from analytics import Rollup, rollup_deltas, aggregate_arrays, query_user_totals, upsert_rollups
+from memory_store import MemoryStore
+
+
+RESULTS = [
+    ('u1', 'high', 92.0, datetime(2026, 3, 1, 9, 15)),
+    ('u1', 'high', 96.0, datetime(2026, 3, 1, 14, 5)),
+    ('u2', 'low', 20.0, datetime(2026, 3, 1, 14, 40)),
+    ('u2', 'medium', 65.0, datetime(2026, 3, 2, 8, 0)),
+]
+
+
+def test_every_result_lands_in_four_rollups():
+    deltas = rollup_deltas(RESULTS[:1])
+    assert set(deltas) == {
+        ('hour', datetime(2026, 3, 1, 9), 'u1'), ('hour', datetime(2026, 3, 1, 9), analytics.ORG_WIDE),
+        ('day', datetime(2026, 3, 1), 'u1'), ('day', datetime(2026, 3, 1), analytics.ORG_WIDE),
+    }
+
+
+def test_vectorized_backfill_matches_incremental_rollups():
+    incremental = rollup_deltas(RESULTS)
+    vectorized = aggregate_arrays(*zip(*RESULTS))
+    assert set(incremental) == set(vectorized)
+    for key, rollup in incremental.items():
+        other = vectorized[key]
+        assert (rollup.count, rollup.low, rollup.medium, rollup.high) == (other.count, other.low, other.medium, other.high)
+        assert rollup.total == pytest.approx(other.total)
+        assert np.array_equal(rollup.histogram, other.histogram)
+
+
+def test_percentiles_come_from_the_histogram():
+    rollup = Rollup()
+    for score in range(100):
+        rollup.add('low', float(score))
+    assert rollup.percentile(0.5) == pytest.approx(50, abs=1)
+    assert rollup.percentile(0.9) == pytest.approx(90, abs=1)
+    assert rollup.to_dict()['count'] == 100
+
+
+@pytest.fixture
+def store():
+    store = MemoryStore()
+    for i, (user_id, level, score, created_at) in enumerate(RESULTS):
+        store.add_stress_result(f'r{i}', user_id, level, score, created_at=created_at)
+    return store
+
+
+def test_daily_series_and_totals(store):
+    report = store.get_analytics('day', datetime(2026, 3, 1), datetime(2026, 3, 3))
+    assert [bucket['count'] for bucket in report['series']] == [3, 1]
+    assert report['active_users'] == 2
+    assert [user['user_id'] for user in report['high_stress_users']] == ['u1']
+
+
+def test_totals_use_the_same_buckets_as_the_series(store):
+    # Starts mid-day: the chart shows the 14:00 hour, so the table must count it too
+    report = store.get_analytics('hour', datetime(2026, 3, 1, 12), datetime(2026, 3, 2))
+    assert report['summary']['count'] == 2
+    assert report['active_users'] == 2
+    assert report['high_stress_users'] == [{'user_id': 'u1', 'avg_score': 96.0, 'count': 1, 'high': 1}]
+
+
+def test_rebuild_reproduces_incremental_rollups(store):
+    before = store.get_analytics('hour', datetime(2026, 3, 1), datetime(2026, 3, 3))
+    store.rebuild_rollups()
+    assert store.get_analytics('hour', datetime(2026, 3, 1), datetime(2026, 3, 3)) == before
+
+
+def test_upsert_rollups_binds_every_parameter(fake_cursor):
+    upsert_rollups(fake_cursor, rollup_deltas(RESULTS))
+    assert len(fake_cursor.statements) == len(rollup_deltas(RESULTS))
+    assert all("JSON_SET(histogram, '$[" in sql for sql, _ in fake_cursor.statements)
+
+
+def test_query_user_totals_filters_on_granularity(fake_cursor):
+    fake_cursor.rows = [{'user_id': 'u1', 'result_count': 2, 'low_count': 0, 'medium_count': 0,
+                         'high_count': 2, 'score_sum': 188.0, 'score_sum_sq': 17680.0}]
+    totals = query_user_totals(fake_cursor, 'hour', datetime(2026, 3, 1, 12), datetime(2026, 3, 2))
+    assert fake_cursor.statements[0][1][0] == 'hour'
+    assert totals['u1'].count == 2
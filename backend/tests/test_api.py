@@ -0,0 +1,96 @@
+import base64
+from types import SimpleNamespace
+
+import jwt
+import pytest
+
+import api
+from inference_queue import InferenceQueueFull
+from write_behind import WriteBufferFull
+
+
+class StubDetector:
+    registry = SimpleNamespace(is_ready=lambda: True, load_error=None)
+
+    def process_image(self, image, detection_key=None, tracking_key=None, annotate=True):
+        return {'success': True, 'stress_level': 'low', 'stress_score': 12.0, 'faces': []}
+
+
+class RecordingStore:
+    def __init__(self):
+        self.puts = []
+
+    def put(self, data, ext='.jpg'):
+        self.puts.append(data)
+        return 'ab' * 20 + ext
+
+    def current_key(self, key):
+        return key
+
+
+class RecordingResults:
+    def __init__(self):
+        self.appended = []
+
+    def append(self, user_id, record):
+        self.appended.append((user_id, record))
+
+
+@pytest.fixture
+def client(monkeypatch):
+    store, results = RecordingStore(), RecordingResults()
+    monkeypatch.setattr(api, 'stress_detector', StubDetector())
+    monkeypatch.setattr(api, 'image_store', store)
+    monkeypatch.setattr(api, 'results_store', results)
+    token = jwt.encode({'user_id': 'u1'}, api.SECRET_KEY, algorithm='HS256')
+    client = api.app.test_client()
+    client.environ_base['HTTP_AUTHORIZATION'] = f'Bearer {token}'
+    return client, store, results
+
+
+def upload(client):
+    return client.post('/api/detect/image', data={'image_data': base64.b64encode(b'jpeg bytes').decode()})
+
+
+def test_uploads_are_stored_by_default(client):
+    client, store, results = client
+    response = upload(client)
+    assert response.status_code == 200
+    assert store.puts == [b'jpeg bytes']
+    assert results.appended[0][1]['image_key'] == 'ab' * 20 + '.jpg'
+
+
+def test_uploads_are_not_stored_when_persisting_is_off(client, monkeypatch):
+    client, store, results = client
+    monkeypatch.setattr(api, 'PERSIST_IMAGES', False)
+    response = upload(client)
+    assert response.status_code == 200
+    assert store.puts == []
+    assert results.appended[0][1]['image_key'] is None
+
+
+class BusyDetector(StubDetector):
+    def process_image(self, image, detection_key=None, tracking_key=None, annotate=True):
+        raise InferenceQueueFull("Inference queue is full")
+
+
+def test_overloaded_inference_answers_503_and_stores_nothing(client, monkeypatch):
+    client, store, results = client
+    monkeypatch.setattr(api, 'stress_detector', BusyDetector())
+    response = upload(client)
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == api.INFERENCE_RETRY_AFTER
+    assert store.puts == []
+    assert results.appended == []
+
+
+def test_results_that_cannot_be_queued_answer_503(client, monkeypatch):
+    client, store, results = client
+
+    def queue_full(user_id, record):
+        raise WriteBufferFull("Write-behind queue is full")
+
+    monkeypatch.setattr(results, 'append', queue_full)
+    response = upload(client)
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == api.STORAGE_RETRY_AFTER
@@ -0,0 +1,72 @@
+import io
+from types import SimpleNamespace
+
+import cv2
+import jwt
+import numpy as np
+
+import app
+from write_behind import WriteBufferFull
+
+
+def test_result_image_etag_changes_when_retention_swaps_the_image():
+    original = {'id': 'r1', 'image_path': 'ab' * 20 + '.jpg'}
+    thumbnail = {'id': 'r1', 'image_path': 'ab' * 20 + '.webp'}
+    assert app.result_image_etag(original) == app.result_image_etag(dict(original))
+    assert app.result_image_etag(original) != app.result_image_etag(thumbnail)
+    assert app.result_image_etag(original).endswith(f"-v{app.RESULT_IMAGE_VERSION}")
+
+
+def test_annotation_mode_is_chosen_by_query_or_accept_header():
+    with app.app.test_request_context('/api/stress/analyze?mode=annotations'):
+        assert app.wants_annotations_only()
+    with app.app.test_request_context('/api/stress/analyze', headers={'Accept': app.ANNOTATIONS_MEDIA_TYPE}):
+        assert app.wants_annotations_only()
+    with app.app.test_request_context('/api/stress/analyze', headers={'Accept': 'application/json'}):
+        assert not app.wants_annotations_only()
+
+
+def loading_api(ready):
+    return SimpleNamespace(
+        registry=SimpleNamespace(is_ready=lambda: ready, load_error=None),
+        db=SimpleNamespace(is_healthy=lambda: True, in_memory=True),
+    )
+
+
+def test_readiness_waits_for_the_model(monkeypatch):
+    client = app.app.test_client()
+    monkeypatch.setattr(app, 'api', loading_api(ready=False))
+    assert client.get('/api/health/live').status_code == 200
+    assert client.get('/api/health/ready').status_code == 503
+
+    monkeypatch.setattr(app, 'api', loading_api(ready=True))
+    response = client.get('/api/health/ready')
+    assert response.status_code == 200
+    assert response.get_json()['database']['backend'] == 'memory'
+
+
+def test_analysis_answers_503_while_the_model_loads(monkeypatch):
+    monkeypatch.setattr(app, 'api', loading_api(ready=False))
+    token = jwt.encode({'user_id': 'u1'}, app.app.config['SECRET_KEY'], algorithm='HS256')
+    response = app.app.test_client().post('/api/stress/analyze', headers={'Authorization': f'Bearer {token}'})
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == app.MODEL_RETRY_AFTER
+
+
+def test_results_that_cannot_be_queued_answer_503(monkeypatch):
+    def queue_full(*args, **kwargs):
+        raise WriteBufferFull("Write-behind queue is full")
+
+    stub = loading_api(ready=True)
+    stub.db.get_user_by_id = lambda user_id: {'id': user_id, 'is_approved': True}
+    stub.process_image = queue_full
+    monkeypatch.setattr(app, 'api', stub)
+    token = jwt.encode({'user_id': 'u1'}, app.app.config['SECRET_KEY'], algorithm='HS256')
+    image = cv2.imencode('.jpg', np.zeros((32, 32, 3), dtype=np.uint8))[1].tobytes()
+    response = app.app.test_client().post(
+        '/api/stress/analyze',
+        headers={'Authorization': f'Bearer {token}'},
+        data={'image': (io.BytesIO(image), 'frame.jpg')}
+    )
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == app.STORAGE_RETRY_AFTER
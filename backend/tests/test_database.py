@@ -0,0 +1,108 @@
+from contextlib import contextmanager
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+from mysql.connector import Error, ProgrammingError
+
+from database import Database
+from stress_stats import ewma_step
+
+
+def mysql_database(cursor):
+    """A Database in MySQL mode whose cursors are all the given fake"""
+    db = Database.__new__(Database)
+    db.results_buffer = None
+
+    @contextmanager
+    def _cursor(dictionary=False, commit=False):
+        yield cursor
+
+    db._cursor = _cursor
+    return db
+
+
+def test_stats_upsert_binds_every_parameter(fake_cursor):
+    db = mysql_database(fake_cursor)
+    db._update_stress_stats(fake_cursor, [('u1', 'low', 20.0), ('u2', 'high', 90.0), ('u1', 'medium', 65.0)])
+
+    upserts = [params for sql, params in fake_cursor.statements if 'user_stress_stats' in sql]
+    assert [params[0] for params in upserts] == ['u1', 'u2']
+    decay, contribution, fresh = ewma_step([20.0, 65.0])
+    assert upserts[0] == ('u1', 2, 85.0, 20.0 ** 2 + 65.0 ** 2, 42.5, 65.0, 'medium', fresh, decay, contribution)
+
+
+def test_flush_stress_results_writes_results_stats_and_rollups(fake_cursor):
+    db = mysql_database(fake_cursor)
+    created_at = datetime(2026, 1, 5, 10, 30)
+    rows = [
+        ('r1', 'u1', 'high', 85.0, None, None, None, created_at),
+        ('r2', 'u1', 'low', 15.0, None, None, None, created_at),
+    ]
+    db._flush_stress_results(rows)
+
+    tables = [sql.split()[2] for sql, _ in fake_cursor.statements]
+    assert tables.count('stress_results') == 2
+    assert tables.count('user_stress_stats') == 1
+    # Hour and day buckets, for the user and organization-wide
+    assert tables.count('stress_rollups') == 4
+
+
+def test_add_stress_result_succeeds_in_mysql_mode(fake_cursor):
+    db = mysql_database(fake_cursor)
+    result_id = db.add_stress_result('u1', 'medium', 70.0, faces=[{'x': 1}])
+    assert result_id
+    assert fake_cursor.statements[0][1][0] == result_id
+
+
+def test_keyset_page_query_starts_after_the_cursor(fake_cursor):
+    db = mysql_database(fake_cursor)
+    created_at = datetime(2026, 1, 5, 10, 30)
+    db.get_stress_results('u1', limit=20, before=(created_at, 'r9'))
+    sql, params = fake_cursor.statements[0]
+    assert 'created_at < %s OR (created_at = %s AND id < %s)' in sql
+    assert sql.endswith('ORDER BY created_at DESC, id DESC LIMIT %s')
+    assert params == ('u1', created_at, created_at, 'r9', 20)
+
+
+def test_update_image_paths_sends_one_update_per_path(fake_cursor):
+    db = mysql_database(fake_cursor)
+    db.update_image_paths({'a.jpg': 'a.webp', 'b.jpg': None})
+    assert [params for _, params in fake_cursor.statements] == [('a.webp', 'a.jpg'), (None, 'b.jpg')]
+
+
+def test_schema_is_created_under_the_named_lock(fake_cursor):
+    db = mysql_database(fake_cursor)
+    db.database = 'stress_detection'
+    fake_cursor.rows = [(1,), (1,)]
+    db._create_tables = lambda cursor: cursor.execute("CREATE TABLE t (id INT)")
+    db.create_tables()
+    statements = [sql for sql, _ in fake_cursor.statements]
+    assert statements == ["SELECT GET_LOCK(%s, %s)", "CREATE TABLE t (id INT)", "SELECT RELEASE_LOCK(%s)"]
+    assert fake_cursor.statements[0][1][0] == 'stress_detection.schema_migrations'
+
+
+def test_schema_failure_fails_startup_instead_of_using_memory(fake_cursor):
+    db = mysql_database(fake_cursor)
+    db.database = 'stress_detection'
+    db.pool = SimpleNamespace(close=lambda: None)
+    fake_cursor.rows = [(1,), (1,)]
+
+    def duplicate_index(cursor):
+        raise ProgrammingError("Duplicate key name 'idx_stress_results_user_created'")
+
+    db._create_tables = duplicate_index
+    with pytest.raises(ProgrammingError):
+        db.create_tables()
+    assert not hasattr(db, 'in_memory')
+    assert fake_cursor.statements[-1][0] == "SELECT RELEASE_LOCK(%s)"
+
+
+def test_schema_lock_timeout_is_an_error(fake_cursor):
+    db = mysql_database(fake_cursor)
+    db.database = 'stress_detection'
+    db.pool = SimpleNamespace(close=lambda: None)
+    fake_cursor.rows = [(0,)]
+    db._create_tables = lambda cursor: pytest.fail("schema changed without the lock")
+    with pytest.raises(Error):
+        db.create_tables()
@@ -0,0 +1,134 @@
+import threading
+import time
+
+import pytest
+from mysql.connector import Error, OperationalError
+
+from db_pool import ConnectionPool, PoolTimeout
+
+
+class FakeConnection:
+    def __init__(self):
+        self.in_transaction = False
+        self.closed = False
+        self.alive = True
+
+    def ping(self, reconnect=False):
+        if not self.alive:
+            raise OperationalError("gone away")
+
+    def rollback(self):
+        self.in_transaction = False
+
+    def close(self):
+        self.closed = True
+
+
+class Opener:
+    def __init__(self):
+        self.opened = []
+
+    def __call__(self):
+        connection = FakeConnection()
+        self.opened.append(connection)
+        return connection
+
+
+def test_connections_are_reused_and_opened_lazily():
+    opener = Opener()
+    pool = ConnectionPool(opener, size=3, timeout=1)
+    for _ in range(5):
+        with pool.connection():
+            pass
+    assert len(opener.opened) == 1
+    metrics = pool.get_metrics()
+    assert metrics['open'] == 1
+    assert metrics['idle'] == 1
+    assert metrics['checkouts'] == 5
+
+
+def test_open_transaction_is_rolled_back_on_release():
+    pool = ConnectionPool(Opener(), size=1)
+    with pool.connection() as connection:
+        connection.in_transaction = True
+    assert connection.in_transaction is False
+
+
+def test_timeout_when_every_connection_is_in_use():
+    pool = ConnectionPool(Opener(), size=1, timeout=0.05)
+    with pool.connection():
+        with pytest.raises(PoolTimeout):
+            with pool.connection():
+                pass
+    assert pool.get_metrics()['timeouts'] == 1
+
+
+def test_waiter_is_woken_when_a_broken_connection_frees_capacity():
+    opener = Opener()
+    pool = ConnectionPool(opener, size=1, timeout=5)
+    holding = threading.Event()
+    outcome = []
+
+    def break_connection():
+        try:
+            with pool.connection():
+                holding.set()
+                time.sleep(0.1)
+                raise OperationalError("lost connection")
+        except OperationalError:
+            pass
+
+    def wait_for_connection():
+        holding.wait()
+        start = time.monotonic()
+        with pool.connection() as connection:
+            outcome.append((connection, time.monotonic() - start))
+
+    threads = [threading.Thread(target=break_connection), threading.Thread(target=wait_for_connection)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    connection, waited = outcome[0]
+    # The waiter opened a fresh connection right away instead of sitting out the timeout
+    assert connection is opener.opened[1]
+    assert waited < 1
+    assert opener.opened[0].closed
+    assert pool.get_metrics()['discarded'] == 1
+
+
+def test_stale_connection_is_replaced_on_checkout():
+    opener = Opener()
+    pool = ConnectionPool(opener, size=1, ping_after=0)
+    with pool.connection() as first:
+        pass
+    first.alive = False
+    with pool.connection() as second:
+        pass
+    assert second is not first
+    assert first.closed
+    assert pool.get_metrics()['reconnects'] == 1
+
+
+def test_failed_reconnect_frees_capacity():
+    opener = Opener()
+    pool = ConnectionPool(opener, size=1, ping_after=0)
+    with pool.connection() as first:
+        pass
+    first.alive = False
+    pool._connect = lambda: (_ for _ in ()).throw(Error("refused"))
+    with pytest.raises(Error):
+        with pool.connection():
+            pass
+    assert pool.get_metrics()['open'] == 0
+
+
+def test_close_closes_idle_connections():
+    opener = Opener()
+    pool = ConnectionPool(opener, size=2)
+    with pool.connection():
+        pass
+    pool.close()
+    assert opener.opened[0].closed
+    assert pool.get_metrics()['open'] == 0
@@ -0,0 +1,165 @@
+import smtplib
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from email_outbox import EmailOutbox, RateLimiter
+
+
+class StubSMTP:
+    """Stands in for smtplib.SMTP, recording delivered messages"""
+
+    instances = []
+    reject = None
+
+    def __init__(self, server, port, timeout=None):
+        self.sent = []
+        StubSMTP.instances.append(self)
+
+    def starttls(self):
+        pass
+
+    def login(self, user, password):
+        pass
+
+    def noop(self):
+        return (250, b'OK')
+
+    def send_message(self, msg):
+        if StubSMTP.reject is not None:
+            raise StubSMTP.reject
+        self.sent.append(msg)
+
+    def quit(self):
+        pass
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def stub_smtp(monkeypatch):
+    StubSMTP.instances = []
+    StubSMTP.reject = None
+    monkeypatch.setattr(smtplib, 'SMTP', StubSMTP)
+    return StubSMTP
+
+
+def delivered(stub):
+    return [msg['To'] for smtp in stub.instances for msg in smtp.sent]
+
+
+def make_outbox(path, **kwargs):
+    kwargs.setdefault('connections', 1)
+    kwargs.setdefault('send_rate', 0)
+    return EmailOutbox('smtp.test', 25, 'sender@test', '', path=str(path), use_tls=False, **kwargs)
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def test_messages_are_delivered_over_one_connection(tmp_path, stub_smtp):
+    outbox = make_outbox(tmp_path / 'outbox.db')
+    for i in range(3):
+        outbox.enqueue(f'user{i}@test', 'Hello', '<p>hi</p>')
+    assert wait_for(lambda: outbox.get_metrics()['sent'] == 3)
+    outbox.close()
+
+    assert sorted(delivered(stub_smtp)) == ['user0@test', 'user1@test', 'user2@test']
+    assert len(stub_smtp.instances) == 1
+
+
+def test_permanent_rejection_marks_the_message_failed(tmp_path, stub_smtp):
+    stub_smtp.reject = smtplib.SMTPRecipientsRefused({'bad@test': (550, b'no such user')})
+    outbox = make_outbox(tmp_path / 'outbox.db')
+    outbox.enqueue('bad@test', 'Hello', '<p>hi</p>')
+    assert wait_for(lambda: outbox.get_metrics()['failed'] == 1)
+    metrics = outbox.get_metrics()
+    outbox.close()
+    assert metrics['failed_total'] == 1
+    assert metrics['pending'] == 0
+
+
+def test_temporary_failure_is_retried_later(tmp_path, stub_smtp):
+    stub_smtp.reject = smtplib.SMTPServerDisconnected('closed')
+    outbox = make_outbox(tmp_path / 'outbox.db', retry_delay=0.05)
+    outbox.enqueue('user@test', 'Hello', '<p>hi</p>')
+    assert wait_for(lambda: outbox.get_metrics()['retried'] >= 1)
+    stub_smtp.reject = None
+    assert wait_for(lambda: outbox.get_metrics()['sent'] == 1)
+    outbox.close()
+
+
+def claim_directly(path, owner, claimed_at):
+    db = sqlite3.connect(path, isolation_level=None)
+    db.execute("UPDATE outbox SET status = 'sending', claimed_by = ?, claimed_at = ?", (owner, claimed_at))
+    db.close()
+
+
+def test_live_claims_of_another_process_are_left_alone(tmp_path, stub_smtp):
+    path = tmp_path / 'outbox.db'
+    # Create the file and queue a message without any sender picking it up
+    first = make_outbox(path)
+    first.close()
+    db = sqlite3.connect(path, isolation_level=None)
+    db.execute("INSERT INTO outbox (to_email, subject, body_html, next_attempt_at, created_at) "
+               "VALUES ('user@test', 'Hello', '<p>hi</p>', 0, 0)")
+    db.close()
+    claim_directly(path, 'other-worker', time.time())
+
+    outbox = make_outbox(path, claim_lease=60)
+    time.sleep(0.2)
+    assert delivered(stub_smtp) == []
+    outbox.close()
+
+
+def test_expired_claims_are_sent_again(tmp_path, stub_smtp):
+    path = tmp_path / 'outbox.db'
+    first = make_outbox(path)
+    first.close()
+    db = sqlite3.connect(path, isolation_level=None)
+    db.execute("INSERT INTO outbox (to_email, subject, body_html, next_attempt_at, created_at) "
+               "VALUES ('user@test', 'Hello', '<p>hi</p>', 0, 0)")
+    db.close()
+    claim_directly(path, 'dead-worker', time.time() - 120)
+
+    outbox = make_outbox(path, claim_lease=60)
+    assert wait_for(lambda: outbox.get_metrics()['sent'] == 1)
+    outbox.close()
+    assert delivered(stub_smtp) == ['user@test']
+
+
+def test_rate_limiter_spaces_out_tokens():
+    limiter = RateLimiter(rate=50, burst=1)
+    stop = threading.Event()
+    start = time.monotonic()
+    for _ in range(6):
+        assert limiter.acquire(stop)
+    assert time.monotonic() - start >= 0.09
+
+
+def test_sender_survives_a_locked_database(tmp_path, stub_smtp):
+    outbox = make_outbox(tmp_path / 'outbox.db')
+    claim = outbox._claim
+    calls = []
+
+    def locked_once():
+        calls.append(1)
+        if len(calls) == 1:
+            raise sqlite3.OperationalError('database is locked')
+        return claim()
+
+    outbox._claim = locked_once
+    outbox.enqueue('user@test', 'Hello', '<p>hi</p>')
+    assert wait_for(lambda: outbox.get_metrics()['sent'] == 1)
+    outbox.close()
+    assert len(calls) > 1
+    assert delivered(stub_smtp) == ['user@test']
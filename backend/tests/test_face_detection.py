@@ -0,0 +1,106 @@
+import cv2
+import numpy as np
+
+from face_detection import FaceDetector, FaceTracker, _Track
+
+
+class StrictDetector(FaceDetector):
+    """Fails like the cascade does on some OpenCV builds when handed an empty or tiny ROI"""
+
+    def search(self, gray, min_size, max_size=None):
+        if gray.shape[0] < min_size[1] or gray.shape[1] < min_size[0]:
+            raise cv2.error("ROI smaller than the search window")
+        return super().search(gray, min_size, max_size)
+
+
+def test_tracker_falls_back_when_box_is_outside_the_frame():
+    tracker = FaceTracker(StrictDetector())
+    gray = np.zeros((120, 160), dtype=np.uint8)
+    # Boxes from a larger frame, entirely or mostly outside this one
+    for box in ([400, 300, 80, 80], [150, 100, 80, 80]):
+        assert tracker._follow(gray, np.array([box], dtype=np.int32)) is None
+
+
+def test_tracker_runs_full_detection_after_resolution_change():
+    tracker = FaceTracker(StrictDetector())
+    tracker._tracks['cam'] = _Track(np.array([[600, 400, 100, 100]], dtype=np.int32), 3)
+    faces, _ = tracker.detect(np.zeros((120, 160), dtype=np.uint8), 'cam')
+    assert len(faces) == 0
+    assert tracker.get_metrics()['lost'] == 1
+
+
+
+class ResettingDetector(FaceDetector):
+    """Finds a face in every ROI, but lets another request reset the session mid-search"""
+
+    def __init__(self, on_search):
+        super().__init__()
+        self.on_search = on_search
+
+    def search(self, gray, min_size, max_size=None):
+        self.on_search()
+        return np.array([[10, 10, min_size[0], min_size[1]]], dtype=np.int32), 3
+
+
+def test_tracker_does_not_update_a_session_reset_mid_frame():
+    tracker = FaceTracker(ResettingDetector(lambda: tracker.reset('cam')))
+    track = _Track(np.array([[40, 40, 60, 60]], dtype=np.int32), 3)
+    tracker._tracks['cam'] = track
+    faces, _ = tracker.detect(np.zeros((240, 320), dtype=np.uint8), 'cam')
+    assert len(faces) == 1
+    assert track.frames_since_detect == 0
+    assert 'cam' not in tracker._tracks
+
+class FakeCascade:
+    """Stands in for the Haar cascade, returning fixed detections with their neighbor counts"""
+
+    def __init__(self, rects, neighbors):
+        self.rects = rects
+        self.neighbors = neighbors
+        self.calls = []
+
+    def detectMultiScale2(self, image, scaleFactor, minNeighbors, minSize, maxSize=None):
+        self.calls.append({'shape': image.shape, 'minNeighbors': minNeighbors, 'minSize': minSize, 'maxSize': maxSize})
+        return self.rects, self.neighbors
+
+
+def detector_with(cascade, **kwargs):
+    detector = FaceDetector(**kwargs)
+    detector.cascade = cascade
+    return detector
+
+
+def test_one_cascade_pass_applies_the_stricter_threshold_afterwards():
+    cascade = FakeCascade([[10, 10, 50, 50], [100, 20, 60, 60]], [4, 7])
+    detector = detector_with(cascade, min_neighbors=(3, 5))
+    faces, threshold = detector.detect(np.zeros((200, 300), dtype=np.uint8))
+    assert [call['minNeighbors'] for call in cascade.calls] == [3]
+    assert threshold == 5
+    assert faces.tolist() == [[100, 20, 60, 60]]
+
+
+def test_weak_detections_pass_the_looser_threshold():
+    cascade = FakeCascade([[10, 10, 50, 50]], [3])
+    detector = detector_with(cascade, min_neighbors=(5, 3))
+    faces, threshold = detector.detect(np.zeros((200, 300), dtype=np.uint8))
+    assert threshold == 3 and len(faces) == 1
+    assert len(cascade.calls) == 1
+
+
+def test_frames_are_downscaled_and_boxes_mapped_back():
+    cascade = FakeCascade([[32, 32, 64, 64]], [6])
+    detector = detector_with(cascade, max_side=640)
+    faces, _ = detector.detect(np.zeros((960, 1280), dtype=np.uint8))
+    assert cascade.calls[0]['shape'] == (480, 640)
+    assert faces.tolist() == [[64, 64, 128, 128]]
+
+
+def test_face_size_hint_narrows_the_next_search():
+    cascade = FakeCascade([[10, 10, 80, 80]], [6])
+    detector = detector_with(cascade)
+    gray = np.zeros((240, 320), dtype=np.uint8)
+    detector.detect(gray, key='cam')
+    detector.detect(gray, key='cam')
+    assert cascade.calls[1]['minSize'] == (56, 56)
+    assert cascade.calls[1]['maxSize'] == (112, 112)
+    assert detector.get_metrics()['hint_hits'] == 1
@@ -0,0 +1,78 @@
+import json
+import queue
+import threading
+import time
+
+from frame_stream import LatestFrameSlot, serve_frame_stream
+
+
+class FakeSocket:
+    """Hands out queued messages and records what the server sends back"""
+
+    def __init__(self):
+        self.incoming = queue.Queue()
+        self.sent = []
+
+    def receive(self):
+        return self.incoming.get(timeout=5)
+
+    def send(self, message):
+        self.sent.append(json.loads(message))
+
+
+def test_slot_keeps_only_the_newest_frame():
+    slot = LatestFrameSlot()
+    slot.put((1, b'a'))
+    slot.put((2, b'b'))
+    assert slot.take() == (2, b'b')
+    assert slot.dropped == 1
+    slot.close()
+    assert slot.take() is None
+
+
+def wait_for(condition):
+    deadline = time.monotonic() + 5
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.005)
+    assert condition()
+
+
+def test_frames_arriving_during_inference_are_dropped():
+    ws = FakeSocket()
+    first_started = threading.Event()
+    release = threading.Event()
+
+    def process_frame(data):
+        if data == b'frame-1':
+            first_started.set()
+            release.wait(5)
+        return {'frame': data.decode()}
+
+    server = threading.Thread(target=serve_frame_stream, args=(ws, process_frame))
+    server.start()
+    ws.incoming.put(b'frame-1')
+    first_started.wait(5)
+    for i in range(2, 6):
+        ws.incoming.put(f'frame-{i}'.encode())
+    # A text message after the frames: once it is read, every frame is in the slot
+    ws.incoming.put('ping')
+    wait_for(ws.incoming.empty)
+    release.set()
+    wait_for(lambda: len(ws.sent) == 2)
+    ws.incoming.put('close')
+    server.join(5)
+
+    assert [(message['seq'], message['frame']) for message in ws.sent] == [(1, 'frame-1'), (5, 'frame-5')]
+    assert ws.sent[-1]['dropped'] == 3
+
+
+def test_oversized_frames_are_rejected():
+    ws = FakeSocket()
+    server = threading.Thread(target=serve_frame_stream, args=(ws, lambda data: {'ok': True}),
+                              kwargs={'max_frame_bytes': 10})
+    server.start()
+    ws.incoming.put(b'x' * 11)
+    wait_for(lambda: ws.sent)
+    ws.incoming.put('close')
+    server.join(5)
+    assert ws.sent == [{'error': 'Frame too large', 'seq': 1, 'dropped': 0, 'ms': ws.sent[0]['ms']}]
@@ -0,0 +1,40 @@
+from types import SimpleNamespace
+
+import numpy as np
+
+from image_processor import StressDetector
+
+
+class RecordingBatcher:
+    def __init__(self):
+        self.batches = []
+
+    def predict(self, faces):
+        self.batches.append(faces)
+        return np.linspace(0.1, 0.9, len(faces), dtype=np.float32)
+
+
+def stress_detector(batcher):
+    detector = StressDetector.__new__(StressDetector)
+    detector.registry = SimpleNamespace(model=SimpleNamespace(predict=None))
+    detector.batcher = batcher
+    return detector
+
+
+def test_faces_are_preprocessed_into_one_float32_batch():
+    gray = np.full((100, 100), 255, dtype=np.uint8)
+    gray[:50, :50] = 0
+    batch = stress_detector(RecordingBatcher()).preprocess_faces(gray, [(0, 0, 50, 50), (50, 50, 50, 50)])
+    assert batch.shape == (2, 48, 48, 1) and batch.dtype == np.float32
+    assert batch[0].max() == 0.0
+    assert batch[1].min() == 1.0
+
+
+def test_all_faces_are_scored_in_a_single_forward_pass():
+    batcher = RecordingBatcher()
+    detector = stress_detector(batcher)
+    faces = [(x, 0, 20, 20) for x in range(0, 240, 20)]
+    scores = detector.score_faces(np.zeros((20, 240), dtype=np.uint8), faces)
+    assert len(batcher.batches) == 1 and batcher.batches[0].shape == (12, 48, 48, 1)
+    assert np.allclose(scores, np.linspace(10, 90, 12))
+    assert [detector.stress_category(score) for score in (scores[0], scores[5], scores[-1])] == ['low', 'medium', 'high']
@@ -0,0 +1,41 @@
+import os
+
+from image_store import ImageStore
+
+
+def test_images_are_content_addressed_and_sharded(tmp_path):
+    store = ImageStore(root=str(tmp_path), workers=1, fsync=False)
+    key = store.put(b'frame bytes')
+    # Readable straight away, before the background write lands
+    assert store.get(key) == b'frame bytes'
+    store.close()
+
+    digest = key.split('.', 1)[0]
+    assert key == ImageStore.key_for(b'frame bytes') and key.endswith('.jpg')
+    path = store.path_for(key)
+    assert path == os.path.join(str(tmp_path), digest[:2], digest[2:4], key)
+    with open(path, 'rb') as f:
+        assert f.read() == b'frame bytes'
+    assert not [name for name in os.listdir(os.path.dirname(path)) if name.endswith('.tmp')]
+
+
+def test_identical_images_are_stored_once(tmp_path):
+    store = ImageStore(root=str(tmp_path), workers=1, fsync=False)
+    first = store.put(b'same frame')
+    store.close()
+    store = ImageStore(root=str(tmp_path), workers=1, fsync=False)
+    assert store.put(b'same frame') == first
+    store.close()
+    metrics = store.get_metrics()
+    assert (metrics['writes'], metrics['dedup_hits']) == (0, 1)
+    assert metrics['bytes_deduplicated'] == len(b'same frame')
+
+
+def test_legacy_paths_resolve_only_inside_the_root(tmp_path):
+    store = ImageStore(root=str(tmp_path / 'uploads'), workers=1, fsync=False)
+    legacy = tmp_path / 'uploads' / 'u1_20240101120000.jpg'
+    legacy.write_bytes(b'old upload')
+    assert store.get(str(legacy)) == b'old upload'
+    assert store.resolve(str(tmp_path / 'secrets.txt')) is None
+    assert store.get(None) is None
+    store.close()
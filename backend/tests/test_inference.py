@@ -0,0 +1,27 @@
+import numpy as np
+import pytest
+
+tf = pytest.importorskip('tensorflow')
+
+from inference import FastPredictor
+from model_registry import build_model
+
+
+@pytest.fixture(scope='module')
+def model():
+    return build_model()
+
+
+def test_traced_call_matches_model_predict(model):
+    faces = np.random.default_rng(0).random((5, 48, 48, 1), dtype=np.float32)
+    predictor = FastPredictor(model, warmup_sizes=())
+    expected = model.predict(faces, verbose=0).reshape(-1)
+    assert np.allclose(predictor(faces), expected, atol=1e-5)
+
+
+def test_single_faces_and_batches_share_one_trace(model):
+    predictor = FastPredictor(model, warmup_sizes=(1, 4))
+    assert predictor(np.zeros((48, 48, 1), dtype=np.float32)).shape == (1,)
+    assert predictor(np.zeros((7, 48, 48, 1), dtype=np.float32)).shape == (7,)
+    # The fixed input signature keeps new batch sizes from retracing
+    assert predictor._infer.experimental_get_tracing_count() == 1
@@ -0,0 +1,76 @@
+import threading
+
+import numpy as np
+import pytest
+
+from inference_queue import InferenceBatcher, InferenceQueueFull, InferenceTimeout
+
+
+def faces(count):
+    return np.zeros((count, 48, 48, 1), dtype=np.float32)
+
+
+def test_concurrent_requests_share_a_batch():
+    calls = []
+
+    def predict(batch):
+        calls.append(len(batch))
+        return np.arange(len(batch), dtype=np.float32)
+
+    batcher = InferenceBatcher(predict, max_batch_size=8, max_wait_ms=200)
+    futures = [batcher.submit(faces(2)) for _ in range(3)]
+    results = [future.result(timeout=5) for future in futures]
+    batcher.stop()
+
+    assert calls == [6]
+    assert [list(result) for result in results] == [[0, 1], [2, 3], [4, 5]]
+
+
+def test_predict_errors_reach_every_caller():
+    def predict(batch):
+        raise RuntimeError("model failed")
+
+    batcher = InferenceBatcher(predict, max_wait_ms=0)
+    with pytest.raises(RuntimeError):
+        batcher.predict(faces(1))
+    batcher.stop()
+
+
+def test_full_queue_is_rejected_without_waiting():
+    release = threading.Event()
+    started = threading.Event()
+
+    def predict(batch):
+        started.set()
+        release.wait(5)
+        return np.zeros(len(batch), dtype=np.float32)
+
+    batcher = InferenceBatcher(predict, max_batch_size=1, max_wait_ms=0, max_queue_depth=1)
+    first = batcher.submit(faces(1))
+    started.wait(5)
+    batcher.submit(faces(1))
+    with pytest.raises(InferenceQueueFull):
+        batcher.submit(faces(1))
+    with pytest.raises(InferenceQueueFull):
+        batcher.submit(faces(1), timeout=0.01)
+    assert batcher.get_metrics()['rejected'] == 2
+
+    release.set()
+    first.result(timeout=5)
+    batcher.stop()
+
+
+def test_slow_batches_time_out_the_caller():
+    release = threading.Event()
+
+    def predict(batch):
+        release.wait(5)
+        return np.zeros(len(batch), dtype=np.float32)
+
+    batcher = InferenceBatcher(predict, max_wait_ms=0, result_timeout=0.05)
+    with pytest.raises(InferenceTimeout):
+        batcher.predict(faces(1))
+    assert batcher.get_metrics()['timed_out'] == 1
+
+    release.set()
+    batcher.stop()
@@ -0,0 +1,95 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from database import encode_cursor, parse_cursor
+from memory_store import MemoryStore
+
+
+@pytest.fixture
+def store():
+    store = MemoryStore()
+    store.add_user('u1', 'One', 'one@test', 'hash')
+    store.add_user('u2', 'Two', 'two@test', 'hash')
+    store.add_user('a1', 'Admin', 'admin@test', 'hash', role='admin')
+    return store
+
+
+def add_results(store, user_id, scores, start=datetime(2026, 5, 1, 9)):
+    for i, score in enumerate(scores):
+        store.add_stress_result(f'{user_id}-r{i}', user_id, 'high' if score >= 80 else 'low', score,
+                                created_at=start + timedelta(minutes=i))
+
+
+def test_users_by_id_email_and_approval(store):
+    assert store.add_user('u3', 'Dup', 'one@test', 'hash') == (False, "Email already exists")
+    assert 'password' not in store.get_user_by_id('u1')
+    assert store.get_user_by_email('one@test')['password'] == 'hash'
+    assert {user['id'] for user in store.get_pending_users()} == {'u1', 'u2'}
+    store.approve_user('u1')
+    assert [user['id'] for user in store.get_pending_users()] == ['u2']
+
+
+def test_reads_return_copies(store):
+    add_results(store, 'u1', [50])
+    result = store.get_stress_result('u1-r0')
+    result['stress_score'] = 0
+    assert store.get_stress_result('u1-r0')['stress_score'] == 50
+
+
+def test_newest_results_come_first_and_keep_their_datetimes(store):
+    add_results(store, 'u1', range(25))
+    page = store.get_stress_results('u1', limit=3)
+    assert [result['id'] for result in page] == ['u1-r24', 'u1-r23', 'u1-r22']
+    assert isinstance(page[0]['created_at'], str)
+    # Formatting the copies must not touch the stored rows
+    assert isinstance(store.get_stress_result('u1-r24')['created_at'], datetime)
+    assert store.get_stress_results('u2') == []
+
+
+def test_out_of_order_inserts_are_kept_sorted(store):
+    store.add_stress_result('late', 'u1', 'low', 10.0, created_at=datetime(2026, 5, 2))
+    store.add_stress_result('early', 'u1', 'low', 10.0, created_at=datetime(2026, 5, 1))
+    assert [result['id'] for result in store.get_stress_results('u1')] == ['late', 'early']
+
+
+def test_stats_and_high_stress_users(store):
+    add_results(store, 'u1', [90, 85])
+    add_results(store, 'u2', [70, 60])
+    assert store.get_user_stress_stats('u1')['average'] == 87.5
+    assert store.get_user_stress_stats('nobody') is None
+    assert [user['id'] for user in store.get_high_stress_users()] == ['u1']
+    overview = store.get_stress_overview()
+    assert overview == {'totalUsers': 3, 'mediumStressUsers': 1, 'averageStressLevel': 76.2}
+
+
+def test_keyset_pagination_walks_every_result_once(store):
+    add_results(store, 'u1', range(25))
+    seen = []
+    before = None
+    while True:
+        page = store.get_stress_results('u1', limit=10, before=before)
+        if not page:
+            break
+        seen.extend(result['id'] for result in page)
+        last = page[-1]
+        before = parse_cursor(encode_cursor(last['created_at'], last['id']))
+    assert seen == [f'u1-r{i}' for i in range(24, -1, -1)]
+
+
+def test_results_with_equal_timestamps_are_not_skipped(store):
+    created_at = datetime(2026, 5, 1, 9)
+    for i in range(5):
+        store.add_stress_result(f'r{i}', 'u1', 'low', 10.0, created_at=created_at)
+    first = store.get_stress_results('u1', limit=2)
+    rest = store.get_stress_results('u1', limit=10, before=(created_at, first[-1]['id']))
+    assert len(first) + len(rest) == 5
+    assert not {result['id'] for result in first} & {result['id'] for result in rest}
+
+
+def test_update_image_paths(store):
+    store.add_stress_result('r1', 'u1', 'low', 10.0, image_path='a.jpg')
+    store.add_stress_result('r2', 'u1', 'low', 10.0, image_path='b.jpg')
+    assert store.update_image_paths({'a.jpg': 'a.webp', 'b.jpg': None}) == 2
+    assert store.get_stress_result('r1')['image_path'] == 'a.webp'
+    assert store.get_stress_result('r2')['image_path'] is None
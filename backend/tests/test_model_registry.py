@@ -0,0 +1,114 @@
+import os
+import threading
+import time
+
+import model_registry
+from model_registry import ModelRegistry, LoadedModel
+
+
+def test_failed_background_load_is_retried(tmp_path, monkeypatch):
+    registry = ModelRegistry(model_path=str(tmp_path / 'model.h5'), check_interval=0,
+                             retry_delay=0.01, max_retry_delay=0.02)
+    attempts = []
+    allow_success = threading.Event()
+
+    def load():
+        attempts.append(time.monotonic())
+        if len(attempts) < 3:
+            raise ImportError("No module named 'tensorflow'")
+        allow_success.wait(5)
+        return LoadedModel(object(), lambda faces: faces, 'untrained')
+
+    monkeypatch.setattr(registry, '_load', load)
+    registry.start_background_load()
+
+    # The first attempt fails; readiness reports the error meanwhile
+    assert registry.wait_until_ready(timeout=5) is False
+    assert 'tensorflow' in registry.load_error
+
+    allow_success.set()
+    deadline = time.monotonic() + 5
+    while not registry.is_ready() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert registry.is_ready()
+    assert len(attempts) == 3
+    assert registry.load_error is None
+
+
+def file_registry(tmp_path, monkeypatch, content=b'weights v1'):
+    """A registry whose loads describe the weights file instead of building a network"""
+    path = tmp_path / 'model.h5'
+    path.write_bytes(content)
+    registry = ModelRegistry(model_path=str(path), check_interval=0)
+
+    def load():
+        data = path.read_bytes()
+        source = 'untrained' if data == b'corrupt' else 'weights'
+        return LoadedModel(data, lambda faces: faces, source, model_registry._file_stat(str(path)),
+                           model_registry._file_checksum(str(path)))
+
+    monkeypatch.setattr(registry, '_load', load)
+    return registry, path
+
+
+def test_changed_weights_are_swapped_in(tmp_path, monkeypatch):
+    registry, path = file_registry(tmp_path, monkeypatch)
+    first = registry.get()
+    assert first.model == b'weights v1'
+
+    path.write_bytes(b'weights v2')
+    assert registry.reload() is True
+    assert registry.model == b'weights v2'
+    # A caller holding the old generation can still finish with it
+    assert first.model == b'weights v1'
+    assert registry.get_status()['reloads'] == 1
+
+
+def test_touched_but_unchanged_weights_are_not_reloaded(tmp_path, monkeypatch):
+    registry, path = file_registry(tmp_path, monkeypatch)
+    first = registry.get()
+    os.utime(path, ns=(1, 1))
+    assert registry.reload() is False
+    assert registry.get() is first
+
+
+def test_unreadable_weights_do_not_replace_working_ones(tmp_path, monkeypatch):
+    registry, path = file_registry(tmp_path, monkeypatch)
+    registry.get()
+    path.write_bytes(b'corrupt')
+    assert registry.reload() is False
+    assert registry.model == b'weights v1'
+    assert registry.get_status()['failed_reloads'] == 1
+
+
+def test_concurrent_checks_schedule_one_reload(tmp_path, monkeypatch):
+    registry, path = file_registry(tmp_path, monkeypatch)
+    registry.get()
+    registry.check_interval = 1e-9
+    path.write_bytes(b'weights v2')
+
+    reloads = []
+    release = threading.Event()
+
+    def reload(force=False):
+        reloads.append(1)
+        release.wait(5)
+
+    monkeypatch.setattr(registry, 'reload', reload)
+    barrier = threading.Barrier(16)
+
+    def check():
+        barrier.wait()
+        for _ in range(50):
+            registry._maybe_schedule_reload()
+
+    threads = [threading.Thread(target=check) for _ in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    release.set()
+    assert len(reloads) == 1
+
+def test_one_model_per_process():
+    assert model_registry.get_registry() is model_registry.get_registry()
@@ -0,0 +1,83 @@
+import pytest
+
+from password_hashing import HashingBusy, LoginRateLimiter, PasswordHasher
+
+
+@pytest.fixture
+def state_path(tmp_path):
+    return str(tmp_path / 'state.db')
+
+
+def test_email_is_blocked_after_too_many_failures(state_path):
+    limiter = LoginRateLimiter(max_per_email=3, max_per_ip=100, window=60, path=state_path)
+    for _ in range(2):
+        limiter.record_failure('10.0.0.1', 'User@Test')
+    assert limiter.retry_after('10.0.0.2', 'user@test') == 0
+    limiter.record_failure('10.0.0.1', 'user@test')
+    wait = limiter.retry_after('10.0.0.2', 'user@test')
+    assert 0 < wait <= 60
+    limiter.close()
+
+
+def test_successful_login_clears_email_but_not_ip(state_path):
+    limiter = LoginRateLimiter(max_per_email=2, max_per_ip=2, window=60, path=state_path)
+    limiter.record_failure('10.0.0.1', 'a@test')
+    limiter.record_failure('10.0.0.1', 'a@test')
+    limiter.reset('a@test')
+    assert limiter.retry_after(None, 'a@test') == 0
+    assert limiter.retry_after('10.0.0.1', 'b@test') > 0
+    limiter.close()
+
+
+def test_failures_age_out_of_the_window(state_path, monkeypatch):
+    import password_hashing
+    clock = [1000.0]
+    monkeypatch.setattr(password_hashing.time, 'time', lambda: clock[0])
+    limiter = LoginRateLimiter(max_per_email=1, max_per_ip=100, window=60, path=state_path)
+    limiter.record_failure('10.0.0.1', 'a@test')
+    assert limiter.retry_after('10.0.0.1', 'a@test') == pytest.approx(60)
+    clock[0] += 61
+    assert limiter.retry_after('10.0.0.1', 'a@test') == 0
+    limiter.close()
+
+
+def test_workers_share_one_limit(state_path):
+    # Two limiters on one file stand for two serve.py workers
+    first = LoginRateLimiter(max_per_email=4, max_per_ip=100, window=60, path=state_path)
+    second = LoginRateLimiter(max_per_email=4, max_per_ip=100, window=60, path=state_path)
+    for limiter in (first, second, first, second):
+        limiter.record_failure('10.0.0.1', 'a@test')
+    assert first.retry_after('10.0.0.1', 'a@test') > 0
+    assert second.retry_after('10.0.0.1', 'a@test') > 0
+    first.close()
+    second.close()
+
+
+def test_inline_hasher_round_trip():
+    hasher = PasswordHasher(workers=0)
+    hashed = hasher.hash('secret')
+    assert hasher.verify(hashed, 'secret')
+    assert not hasher.verify(hashed, 'wrong')
+
+
+def test_pool_workers_are_spawned_not_forked():
+    hasher = PasswordHasher(workers=1)
+    try:
+        assert hasher._get_executor()._mp_context.get_start_method() == 'spawn'
+    finally:
+        hasher.close()
+
+
+def test_slow_job_raises_busy_instead_of_timeout():
+    import time
+    hasher = PasswordHasher(workers=1, timeout=0.2)
+    hasher.start()
+    try:
+        with pytest.raises(HashingBusy):
+            hasher._run(time.sleep, 1)
+        metrics = hasher.get_metrics()
+        assert metrics['timed_out'] == 1
+        assert metrics['failed'] == 0
+        assert metrics['in_flight'] == 0
+    finally:
+        hasher.close()
@@ -0,0 +1,63 @@
+import numpy as np
+
+import result_cache
+from result_cache import MISS, PerceptualCache, dhash, hamming
+
+
+def frame(seed=0):
+    return np.random.default_rng(seed).integers(0, 255, (120, 160), dtype=np.uint8)
+
+
+def test_near_duplicate_frames_hash_close_together():
+    image = frame()
+    noisy = np.clip(image.astype(np.int16) + 2, 0, 255).astype(np.uint8)
+    assert hamming(dhash(image), dhash(noisy)) <= 4
+    assert hamming(dhash(image), dhash(frame(seed=1))) > 4
+
+
+def test_lookup_returns_the_closest_result_within_range():
+    cache = PerceptualCache(max_entries=10, ttl=60, max_distance=2)
+    cache.store('u1', 0b0000, 'zero')
+    cache.store('u1', 0b0111, 'seven')
+    assert cache.lookup('u1', 0b0001) == 'zero'
+    assert cache.lookup('u1', 0b1111) == 'seven'
+    assert cache.lookup('u1', 0b11110000) is MISS
+    assert cache.lookup('u2', 0b0000) is MISS
+    metrics = cache.get_metrics()
+    assert (metrics['hits'], metrics['misses']) == (2, 2)
+
+
+def test_no_face_results_are_cached_too():
+    cache = PerceptualCache(max_entries=10, ttl=60)
+    cache.store('u1', 1, None)
+    assert cache.lookup('u1', 1) is None
+
+
+def test_entries_expire(monkeypatch):
+    clock = [100.0]
+    monkeypatch.setattr(result_cache.time, 'monotonic', lambda: clock[0])
+    cache = PerceptualCache(max_entries=10, ttl=2)
+    cache.store('u1', 1, 'result')
+    clock[0] += 3
+    assert cache.lookup('u1', 1) is MISS
+    assert cache.get_metrics()['expired'] == 1
+
+
+def test_size_bounds_evict_oldest_frames():
+    cache = PerceptualCache(max_entries=3, ttl=60, max_distance=0, per_key=2)
+    for frame_hash in (1, 2, 3):
+        cache.store('u1', frame_hash, frame_hash)
+    assert cache.lookup('u1', 1) is MISS
+    cache.store('u2', 10, 'a')
+    cache.store('u3', 20, 'b')
+    # u1 was used least recently, so its older frame made room
+    assert cache.lookup('u1', 2) is MISS
+    assert cache.lookup('u1', 3) == 3
+    assert cache.get_metrics()['entries'] == 3
+    assert cache.get_metrics()['evictions'] == 2
+
+
+def test_disabled_cache_never_hits():
+    cache = PerceptualCache(max_entries=10, ttl=0)
+    cache.store('u1', 1, 'result')
+    assert cache.lookup('u1', 1) is MISS
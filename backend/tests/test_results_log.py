@@ -0,0 +1,75 @@
+import os
+
+import pytest
+
+from results_log import ResultsLog, OFFSET
+
+
+@pytest.fixture
+def log(tmp_path):
+    return ResultsLog(root=str(tmp_path), segment_entries=4, max_segments=2)
+
+
+def append_many(log, user_id, count):
+    for i in range(count):
+        log.append(user_id, {'n': i})
+
+
+def test_newest_pages_back_through_segments(log):
+    append_many(log, 'u1', 10)
+    records, cursor = log.newest('u1', limit=3)
+    assert [record['n'] for record in records] == [9, 8, 7]
+
+    seen = [record['n'] for record in records]
+    while cursor is not None:
+        records, cursor = log.newest('u1', limit=3, before=cursor)
+        seen.extend(record['n'] for record in records)
+    assert seen == list(range(9, -1, -1))
+
+
+def test_users_are_kept_apart(log):
+    log.append('u1', {'n': 1})
+    log.append('u2', {'n': 2})
+    assert log.newest('u1')[0] == [{'n': 1}]
+    assert log.newest('unknown') == ([], None)
+
+
+def test_sealed_segments_are_merged(log):
+    append_many(log, 'u1', 20)
+    assert log.get_metrics()['compactions'] >= 1
+    records, _ = log.newest('u1', limit=20)
+    assert [record['n'] for record in records] == list(range(19, -1, -1))
+    segments = [name for name in os.listdir(log.user_dir('u1')) if name.endswith('.ndjson')]
+    assert len(segments) <= 3
+
+
+def test_max_entries_drops_the_oldest(tmp_path):
+    log = ResultsLog(root=str(tmp_path), segment_entries=2, max_segments=1, max_entries=5)
+    append_many(log, 'u1', 12)
+    records, _ = log.newest('u1', limit=50)
+    assert [record['n'] for record in records][:5] == [11, 10, 9, 8, 7]
+    assert len(records) < 12
+
+
+def test_torn_append_is_repaired(log):
+    append_many(log, 'u1', 2)
+    directory = log.user_dir('u1')
+    segment_path, _ = log._paths(directory, 0)
+    with open(segment_path, 'ab') as segment:
+        segment.write(b'{"n":2}\n{"n":')
+    log.append('u1', {'n': 3})
+    records, _ = log.newest('u1', limit=10)
+    assert [record['n'] for record in records] == [3, 2, 1, 0]
+    assert log.get_metrics()['repairs'] == 1
+
+
+@pytest.mark.parametrize('entries', [0, 2])
+def test_index_without_segment_does_not_break_appends(log, entries):
+    directory = log.user_dir('x')
+    os.makedirs(directory)
+    _, index_path = log._paths(directory, 0)
+    with open(index_path, 'wb') as index:
+        index.write(b''.join(OFFSET.pack(i * 8) for i in range(entries)))
+
+    assert log.append('x', {'n': 0}) == 0
+    assert log.newest('x')[0] == [{'n': 0}]
@@ -0,0 +1,93 @@
+import io
+import os
+import time
+
+import pytest
+from PIL import Image
+
+from image_store import ImageStore
+from retention import RetentionCompactor, thumbnail_scale, DAY
+
+
+def jpeg_bytes(color=(200, 100, 50), size=(640, 480)):
+    out = io.BytesIO()
+    Image.new('RGB', size, color).save(out, 'JPEG')
+    return out.getvalue()
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = ImageStore(root=str(tmp_path / 'uploads'), workers=1, fsync=False)
+    yield store
+    store.close()
+
+
+def age(store, key, days):
+    path = store.path_for(key)
+    then = time.time() - days * DAY
+    os.utime(path, (then, then))
+
+
+def stored(store, data):
+    """Put an image and wait until it is on disk"""
+    key = store.put(data)
+    store.close()
+    return key
+
+
+def make_compactor(store, renames):
+    return RetentionCompactor(store, renames.append, original_days=30, delete_days=365, batch_pause=0)
+
+
+def test_old_originals_become_thumbnails(store):
+    key = stored(store, jpeg_bytes())
+    age(store, key, 40)
+    renames = []
+    make_compactor(store, renames).run_pass()
+
+    thumbnail = key.split('.')[0] + '.webp'
+    assert renames == [{key: thumbnail}]
+    assert not os.path.exists(store.path_for(key))
+    data = store.get(thumbnail)
+    assert thumbnail_scale(data) == pytest.approx(160 / 640)
+
+
+def test_expired_images_are_deleted(store):
+    key = stored(store, jpeg_bytes())
+    age(store, key, 400)
+    renames = []
+    make_compactor(store, renames).run_pass()
+    assert renames == [{key: None}]
+    assert store.get(key) is None
+
+
+def test_recent_images_are_kept(store):
+    key = stored(store, jpeg_bytes())
+    renames = []
+    make_compactor(store, renames).run_pass()
+    assert renames == []
+    assert os.path.exists(store.path_for(key))
+
+
+def test_files_are_kept_when_paths_cannot_be_updated(store):
+    key = stored(store, jpeg_bytes())
+    age(store, key, 40)
+
+    def fail(renames):
+        raise RuntimeError("database down")
+
+    RetentionCompactor(store, fail, original_days=30, batch_pause=0).run_pass()
+    assert os.path.exists(store.path_for(key))
+
+
+def test_logged_keys_resolve_to_the_current_tier(store):
+    key = stored(store, jpeg_bytes())
+    assert store.current_key(key) == key
+
+    age(store, key, 40)
+    make_compactor(store, []).run_pass()
+    assert store.current_key(key) == key.split('.')[0] + '.webp'
+
+    age(store, key.split('.')[0] + '.webp', 400)
+    make_compactor(store, []).run_pass()
+    assert store.current_key(key) is None
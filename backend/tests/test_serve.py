@@ -0,0 +1,62 @@
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+
+import serve
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+TINY_APP = '''
+import os
+from flask import Flask
+
+def create_app():
+    app = Flask(__name__)
+
+    @app.route('/pid')
+    def pid():
+        return str(os.getpid())
+
+    return app
+'''
+
+
+def test_parse_bind():
+    assert serve.parse_bind('0.0.0.0:5000') == ('0.0.0.0', 5000)
+    assert serve.parse_bind(':8080') == ('0.0.0.0', 8080)
+    assert serve.parse_bind('[::1]:5000') == ('::1', 5000)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def test_workers_serve_requests_and_stop_on_sigterm(tmp_path):
+    (tmp_path / 'tiny_app.py').write_text(TINY_APP)
+    port = free_port()
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([str(tmp_path), BACKEND]))
+    server = subprocess.Popen(
+        [sys.executable, os.path.join(BACKEND, 'serve.py'), '--app', 'tiny_app', '--workers', '2',
+         '--threads', '2', '--bind', f'127.0.0.1:{port}'],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        pids = []
+        deadline = time.monotonic() + 20
+        while len(set(pids)) < 2 and len(pids) < 50 and time.monotonic() < deadline:
+            try:
+                with urllib.request.urlopen(f'http://127.0.0.1:{port}/pid', timeout=2) as response:
+                    pids.append(int(response.read()))
+            except OSError:
+                time.sleep(0.05)
+        # Requests are answered by forked workers, not the master
+        assert pids and server.pid not in pids
+    finally:
+        server.send_signal(signal.SIGTERM)
+        assert server.wait(timeout=20) == 0
@@ -0,0 +1,120 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from inference_queue import InferenceQueueFull
+from result_cache import PerceptualCache
+from stress_detection import StressDetectionAPI
+from write_behind import WriteBufferFull
+
+
+class OneFaceDetector:
+    def detect(self, gray, key=None):
+        return [(10, 10, 40, 40)], None
+
+
+class FullBatcher:
+    def predict(self, faces):
+        raise InferenceQueueFull("Inference queue is full")
+
+
+def detection_api(batcher):
+    api = StressDetectionAPI.__new__(StressDetectionAPI)
+    api.registry = SimpleNamespace(model=SimpleNamespace(predict=None))
+    api.batcher = batcher
+    api.face_detector = OneFaceDetector()
+    api.result_cache = PerceptualCache(ttl=60)
+    api.db = SimpleNamespace(get_user_by_id=lambda user_id: {'id': user_id})
+    return api
+
+
+def frame():
+    return np.random.default_rng(0).integers(0, 255, (120, 160, 3), dtype=np.uint8)
+
+
+def test_overload_is_raised_instead_of_a_made_up_score():
+    api = detection_api(FullBatcher())
+    with pytest.raises(InferenceQueueFull):
+        api.process_image(frame(), 'u1')
+    # Nothing was cached, so the next frame is scored for real
+    assert api.result_cache.get_metrics()['entries'] == 0
+
+
+class FixedBatcher:
+    def predict(self, faces):
+        return np.full(len(faces), 0.5, dtype=np.float32)
+
+
+class RecordingImages:
+    def __init__(self):
+        self.puts = []
+
+    def put(self, data, ext='.jpg'):
+        self.puts.append(data)
+        return 'ab' * 20 + ext
+
+    def get(self, key):
+        return self.puts[-1] if key else None
+
+
+def scoring_api(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    api = detection_api(FixedBatcher())
+    api.images = RecordingImages()
+    api.stored = []
+    api.db.add_stress_result = lambda **result: api.stored.append(result) or 'r1'
+    return api
+
+
+def test_decoded_frames_are_scored_without_touching_the_disk(tmp_path, monkeypatch):
+    api = scoring_api(tmp_path, monkeypatch)
+    image = frame()
+    result = api.process_image(image, 'u1', original_bytes=b'original jpeg')
+    assert result['success'] and result['stress_score'] == 50.0
+    # The request's own bytes are stored as they came, through the background store
+    assert api.images.puts == [b'original jpeg']
+    assert api.stored[0]['image_path'] == 'ab' * 20 + '.jpg'
+    assert list(tmp_path.iterdir()) == []
+    assert result['result_image'].startswith('data:image/jpeg;base64,')
+
+
+def test_annotation_only_responses_skip_drawing_and_encoding(tmp_path, monkeypatch):
+    api = scoring_api(tmp_path, monkeypatch)
+    image = frame()
+    untouched = image.copy()
+    result = api.process_image(image, 'u1', original_bytes=b'original jpeg', annotate=False)
+    assert 'result_image' not in result
+    assert result['faces'] == [{'box': [10, 10, 40, 40], 'score': 50.0, 'level': 'low'}]
+    assert np.array_equal(image, untouched)
+
+
+def test_result_images_are_rendered_on_demand(tmp_path, monkeypatch):
+    import cv2
+
+    api = scoring_api(tmp_path, monkeypatch)
+    _, original = cv2.imencode('.jpg', np.zeros((120, 160, 3), dtype=np.uint8))
+    api.images.puts.append(original.tobytes())
+    rendered = api.render_result_image({
+        'image_path': 'ab' * 20 + '.jpg',
+        'faces': [{'box': [10, 10, 40, 40], 'score': 90.0, 'level': 'high'}],
+    })
+    image = cv2.imdecode(np.frombuffer(rendered, np.uint8), cv2.IMREAD_COLOR)
+    # The high-stress box is drawn in red on the stored original
+    assert image[10, 30, 2] > 200 and image[10, 30, 0] < 60
+    assert api.render_result_image({'image_path': None, 'faces': []}) is None
+
+
+def test_results_that_cannot_be_saved_are_not_reported_as_success(tmp_path, monkeypatch):
+    api = scoring_api(tmp_path, monkeypatch)
+
+    def queue_full(**result):
+        raise WriteBufferFull("Write-behind queue is full")
+
+    api.db.add_stress_result = queue_full
+    with pytest.raises(WriteBufferFull):
+        api.process_image(frame(), 'u1')
+
+    api.db.add_stress_result = lambda **result: False
+    result = api.process_image(frame(), 'u1')
+    assert result['success'] is False
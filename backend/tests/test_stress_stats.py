@@ -0,0 +1,30 @@
+import pytest
+
+from stress_stats import UserStressStats, ewma_step
+
+
+def test_ewma_step_matches_one_score_at_a_time():
+    stats = UserStressStats()
+    stats.add(50, 'low')
+    old = stats.ewma
+    scores = [80, 90, 40]
+    for score in scores:
+        stats.add(score, 'high')
+    decay, contribution, fresh = ewma_step(scores)
+    assert old * decay + contribution == pytest.approx(stats.ewma)
+
+    fresh_stats = UserStressStats()
+    for score in scores:
+        fresh_stats.add(score, 'high')
+    assert fresh == pytest.approx(fresh_stats.ewma)
+
+
+def test_summary_reports_mean_and_stddev():
+    stats = UserStressStats()
+    for score in (60, 80):
+        stats.add(score, 'medium')
+    summary = stats.to_dict()
+    assert summary['average'] == 70
+    assert summary['stddev'] == 10
+    assert summary['count'] == 2
+    assert summary['last_level'] == 'medium'
@@ -0,0 +1,57 @@
+import user_cache
+from user_cache import UserCache
+
+
+def test_hits_return_copies():
+    cache = UserCache(max_entries=10, ttl=60)
+    cache.put('id', 'u1', {'id': 'u1', 'name': 'One'})
+    user = cache.get('id', 'u1')
+    user['name'] = 'Changed'
+    assert cache.get('id', 'u1')['name'] == 'One'
+    assert cache.get('id', 'u2') is None
+    metrics = cache.get_metrics()
+    assert (metrics['hits'], metrics['misses']) == (2, 1)
+
+
+def test_entries_expire(monkeypatch):
+    clock = [100.0]
+    monkeypatch.setattr(user_cache.time, 'monotonic', lambda: clock[0])
+    cache = UserCache(max_entries=10, ttl=30)
+    cache.put('id', 'u1', {'id': 'u1'})
+    clock[0] += 31
+    assert cache.get('id', 'u1') is None
+    assert cache.get_metrics()['expired'] == 1
+
+
+def test_least_recently_used_is_evicted():
+    cache = UserCache(max_entries=2, ttl=60)
+    cache.put('id', 'u1', {'id': 'u1'})
+    cache.put('id', 'u2', {'id': 'u2'})
+    cache.get('id', 'u1')
+    cache.put('id', 'u3', {'id': 'u3'})
+    assert cache.get('id', 'u2') is None
+    assert cache.get('id', 'u1') is not None
+    assert cache.get_metrics()['evictions'] == 1
+
+
+def test_invalidating_by_id_drops_the_email_entry_too():
+    cache = UserCache(max_entries=10, ttl=60)
+    cache.put('id', 'u1', {'id': 'u1'})
+    cache.put('email', 'one@test', {'id': 'u1', 'password': 'hash'})
+    cache.invalidate(user_id='u1')
+    assert cache.get('id', 'u1') is None
+    assert cache.get('email', 'one@test') is None
+
+
+def test_rows_read_before_an_invalidation_are_not_cached():
+    cache = UserCache(max_entries=10, ttl=60)
+    generation = cache.generation
+    cache.invalidate(user_id='u1')
+    cache.put('id', 'u1', {'id': 'u1', 'is_approved': False}, generation)
+    assert cache.get('id', 'u1') is None
+
+
+def test_disabled_cache_stores_nothing():
+    cache = UserCache(max_entries=10, ttl=0)
+    cache.put('id', 'u1', {'id': 'u1'})
+    assert cache.get('id', 'u1') is None
@@ -0,0 +1,110 @@
+import threading
+
+import pytest
+
+import write_behind
+from write_behind import WriteBehindBuffer, WriteBufferFull
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(write_behind.time, 'sleep', lambda seconds: None)
+
+
+class Sink:
+    """flush_fn that records batches and rejects rows listed in bad"""
+
+    def __init__(self, bad=()):
+        self.bad = set(bad)
+        self.batches = []
+        self.written = []
+
+    def __call__(self, rows):
+        self.batches.append(list(rows))
+        if self.bad.intersection(rows):
+            raise ValueError("bad row")
+        self.written.extend(rows)
+
+
+def test_rows_are_flushed_in_batches_and_on_close():
+    sink = Sink()
+    buffer = WriteBehindBuffer(sink, batch_size=10, interval_ms=50)
+    for i in range(25):
+        buffer.put(i, i)
+    buffer.close()
+
+    assert sorted(sink.written) == list(range(25))
+    assert all(len(batch) <= 10 for batch in sink.batches)
+    metrics = buffer.get_metrics()
+    assert metrics['flushed'] == 25
+    assert metrics['dropped'] == 0
+
+
+def test_unflushed_rows_are_readable():
+    release = threading.Event()
+    buffer = WriteBehindBuffer(lambda rows: release.wait(5), batch_size=1, interval_ms=0)
+    buffer.put('a', ('row-a',))
+    assert buffer.get('a') == ('row-a',)
+    release.set()
+    buffer.close()
+    assert buffer.get('a') is None
+
+
+def test_bad_row_drops_only_itself():
+    sink = Sink(bad={7})
+    buffer = WriteBehindBuffer(sink, batch_size=20, interval_ms=1000, data_errors=(ValueError,))
+    batch = [(i, i) for i in range(20)]
+    buffer._flush(batch)
+
+    assert sorted(sink.written) == [i for i in range(20) if i != 7]
+    metrics = buffer.get_metrics()
+    assert metrics['dropped'] == 1
+    assert metrics['flushed'] == 19
+    assert metrics['retries'] == 0
+    buffer.close()
+
+
+class FlakyConnection(Sink):
+    """flush_fn that cannot reach the database for the first few attempts"""
+
+    def __init__(self, outages):
+        super().__init__()
+        self.outages = outages
+
+    def __call__(self, rows):
+        if self.outages:
+            self.outages -= 1
+            self.batches.append(list(rows))
+            raise ConnectionError("MySQL server has gone away")
+        super().__call__(rows)
+
+
+def test_outage_keeps_the_batch_until_it_is_written(monkeypatch):
+    delays = []
+    monkeypatch.setattr(write_behind.time, 'sleep', delays.append)
+    sink = FlakyConnection(outages=5)
+    buffer = WriteBehindBuffer(sink, batch_size=20, interval_ms=1000, data_errors=(ValueError,),
+                               max_retry_delay=2)
+    buffer._flush([(i, i) for i in range(20)])
+
+    # The whole batch is retried as one, never split or dropped
+    assert all(len(batch) == 20 for batch in sink.batches)
+    assert sorted(sink.written) == list(range(20))
+    assert delays == [0.5, 1.0, 2, 2, 2]
+    metrics = buffer.get_metrics()
+    assert (metrics['dropped'], metrics['retries'], metrics['flushed']) == (0, 5, 20)
+    buffer.close()
+
+
+def test_put_rejects_when_full():
+    release = threading.Event()
+    buffer = WriteBehindBuffer(lambda rows: release.wait(5), batch_size=1, interval_ms=0,
+                               queue_size=1, put_timeout=0.05)
+    buffer.put(0, 0)
+    # The flusher may have taken the first row already; fill the queue behind it
+    with pytest.raises(WriteBufferFull):
+        for i in range(1, 4):
+            buffer.put(i, i)
+    assert buffer.get_metrics()['rejected'] == 1
+    release.set()
+    buffer.close()
@@ -0,0 +1,134 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+
+# User records are cached per process; a change made through another process
+# (or directly in MySQL) is seen here once the cached copy expires.
+USER_CACHE_SIZE = int(os.environ.get('USER_CACHE_SIZE', 10000))
+USER_CACHE_TTL = float(os.environ.get('USER_CACHE_TTL', 30))
+
+
+class UserCache:
+    """Bounded LRU cache of user rows with a time-to-live
+
+    Rows are cached under ('id', user_id) and ('email', email); the two
+    lookups return different columns, so they are separate entries. Only
+    found users are cached. Every read returns a copy, so callers may
+    change what they get (login drops the password) without touching the
+    cached row.
+    """
+
+    def __init__(self, max_entries=USER_CACHE_SIZE, ttl=USER_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        # key -> (expires at, row), least recently used first
+        self._entries = OrderedDict()
+        # user id <-> email the user is cached under, for invalidation by id
+        self._emails = {}
+        self._email_owners = {}
+        # Bumped by every invalidation; a row read before one is not cached after it
+        self._generation = 0
+
+        self._hits = 0
+        self._misses = 0
+        self._expired = 0
+        self._evictions = 0
+        self._invalidations = 0
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0 and self.ttl > 0
+
+    def get(self, kind, value):
+        """Return a copy of the cached row for ('id' | 'email', value), or None"""
+        if not self.enabled:
+            return None
+        key = (kind, value)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._misses += 1
+                return None
+            expires, row = entry
+            if expires <= now:
+                self._drop(key)
+                self._expired += 1
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+        return row.copy()
+
+    @property
+    def generation(self):
+        return self._generation
+
+    def put(self, kind, value, row, generation=None):
+        """Cache a copy of a user row read when the cache was at the given generation"""
+        if not self.enabled or row is None:
+            return
+        key = (kind, value)
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            self._entries[key] = (time.monotonic() + self.ttl, row.copy())
+            self._entries.move_to_end(key)
+            if kind == 'email' and row.get('id') is not None:
+                self._emails[row['id']] = value
+                self._email_owners[value] = row['id']
+            while len(self._entries) > self.max_entries:
+                oldest, _ = self._entries.popitem(last=False)
+                self._forget_email(oldest)
+                self._evictions += 1
+
+    def invalidate(self, user_id=None, email=None):
+        """Forget a user, looked up by id, email or both"""
+        with self._lock:
+            if user_id is not None:
+                self._drop(('id', user_id))
+                cached_email = self._emails.get(user_id)
+                if cached_email is not None:
+                    self._drop(('email', cached_email))
+            if email is not None:
+                self._drop(('email', email))
+            self._generation += 1
+            self._invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._emails.clear()
+            self._email_owners.clear()
+
+    def _drop(self, key):
+        """Remove one entry; callers hold the lock"""
+        if self._entries.pop(key, None) is not None:
+            self._forget_email(key)
+
+    def _forget_email(self, key):
+        kind, value = key
+        if kind != 'email':
+            return
+        user_id = self._email_owners.pop(value, None)
+        if user_id is not None and self._emails.get(user_id) == value:
+            del self._emails[user_id]
+
+    def get_metrics(self):
+        """Return hit rate, size and eviction counters"""
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'enabled': self.enabled,
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl,
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_rate': round(self._hits / lookups, 4) if lookups else 0.0,
+                'expired': self._expired,
+                'evictions': self._evictions,
+                'invalidations': self._invalidations,
+            }
@@ -0,0 +1,199 @@
+import os
+import time
+import queue
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Group commit limits: flush every N rows or M milliseconds, whichever comes first.
+# A full queue blocks writers for up to the put timeout before the write fails.
+WRITE_BEHIND_BATCH_SIZE = int(os.environ.get('DB_WRITE_BEHIND_BATCH', 100))
+WRITE_BEHIND_INTERVAL_MS = float(os.environ.get('DB_WRITE_BEHIND_INTERVAL_MS', 200))
+WRITE_BEHIND_QUEUE_SIZE = int(os.environ.get('DB_WRITE_BEHIND_QUEUE', 10000))
+WRITE_BEHIND_PUT_TIMEOUT = float(os.environ.get('DB_WRITE_BEHIND_PUT_TIMEOUT', 1))
+
+# A batch that failed for any reason other than bad data is retried after this many
+# seconds, doubling up to the maximum, until the database takes it
+WRITE_BEHIND_RETRY_DELAY = 0.5
+WRITE_BEHIND_MAX_RETRY_DELAY = float(os.environ.get('DB_WRITE_BEHIND_MAX_RETRY_DELAY', 30))
+
+
+class WriteBufferFull(Exception):
+    """Raised when the write-behind queue stayed full for the whole put timeout"""
+
+
+class WriteBehindBuffer:
+    """Bounded queue of rows written in batches by a background flusher
+
+    put() returns as soon as the row is queued. The flusher hands batches of
+    up to batch_size rows, or whatever arrived within interval_ms of the
+    first one, to flush_fn, which writes them in a single transaction.
+
+    A batch rejected with one of data_errors is bisected so one bad row
+    cannot take the rest of it down; only rows rejected on their own are
+    dropped. Any other failure (the database being unreachable) is retried
+    with backoff and nothing is dropped: the queue fills up meanwhile and
+    put() starts failing, which callers report. Rows still queued when the
+    process dies without close() are lost.
+    """
+
+    def __init__(self, flush_fn, batch_size=WRITE_BEHIND_BATCH_SIZE, interval_ms=WRITE_BEHIND_INTERVAL_MS,
+                 queue_size=WRITE_BEHIND_QUEUE_SIZE, put_timeout=WRITE_BEHIND_PUT_TIMEOUT, data_errors=(),
+                 max_retry_delay=WRITE_BEHIND_MAX_RETRY_DELAY):
+        # flush_fn takes a list of rows and raises if they could not be written
+        self.flush_fn = flush_fn
+        self.batch_size = max(1, batch_size)
+        self.interval = max(0.0, interval_ms) / 1000.0
+        self.put_timeout = put_timeout
+        # Exceptions meaning the rows themselves were refused, as opposed to the write failing
+        self.data_errors = tuple(data_errors)
+        self.max_retry_delay = max(WRITE_BEHIND_RETRY_DELAY, max_retry_delay)
+
+        self._queue = queue.Queue(maxsize=queue_size)
+        # key -> row for rows queued or being flushed, so readers can see their own writes
+        self._unflushed = {}
+        self._lock = threading.Lock()
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+        self._thread.start()
+
+        self._queued = 0
+        self._flushed = 0
+        self._batches = 0
+        self._blocked = 0
+        self._rejected = 0
+        self._failed_batches = 0
+        self._retries = 0
+        self._dropped = 0
+        self._total_flush = 0.0
+
+    def put(self, key, row):
+        """Queue a row, waiting while the queue is full"""
+        if self._stopping:
+            raise WriteBufferFull("Write-behind buffer is closed")
+        with self._lock:
+            self._unflushed[key] = row
+        try:
+            try:
+                self._queue.put_nowait((key, row))
+            except queue.Full:
+                with self._lock:
+                    self._blocked += 1
+                self._queue.put((key, row), timeout=self.put_timeout)
+        except queue.Full:
+            with self._lock:
+                self._unflushed.pop(key, None)
+                self._rejected += 1
+            raise WriteBufferFull("Write-behind queue is full")
+        with self._lock:
+            self._queued += 1
+
+    def get(self, key):
+        """Return a row that has not been flushed yet, or None"""
+        with self._lock:
+            return self._unflushed.get(key)
+
+    def _run(self):
+        while True:
+            try:
+                first = self._queue.get(timeout=0.5)
+            except queue.Empty:
+                if self._stopping:
+                    return
+                continue
+
+            batch = [first]
+            deadline = time.monotonic() + self.interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    if remaining > 0 and not self._stopping:
+                        batch.append(self._queue.get(timeout=remaining))
+                    else:
+                        batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            self._flush(batch)
+
+    def _flush(self, batch):
+        """Write a batch, splitting it only when the database refuses its rows"""
+        error = self._write(batch)
+        if error is None:
+            return
+
+        if len(batch) == 1:
+            key, _ = batch[0]
+            with self._lock:
+                self._dropped += 1
+                self._unflushed.pop(key, None)
+            logger.error(f"Dropped buffered row {key}: {error}")
+            return
+
+        # Bisect so that only the rows which are refused on their own are dropped
+        middle = len(batch) // 2
+        self._flush(batch[:middle])
+        self._flush(batch[middle:])
+
+    def _write(self, batch):
+        """Write a batch until it is stored or refused; returns the data error, or None once written"""
+        rows = [row for _, row in batch]
+        delay = WRITE_BEHIND_RETRY_DELAY
+        attempt = 0
+        while True:
+            attempt += 1
+            start = time.perf_counter()
+            try:
+                self.flush_fn(rows)
+            except self.data_errors as e:
+                with self._lock:
+                    self._failed_batches += 1
+                if len(rows) > 1:
+                    logger.warning(f"Write-behind flush of {len(rows)} rows refused, splitting it: {e}")
+                return e
+            except Exception as e:
+                # Most likely an outage; keep the rows and try again later
+                with self._lock:
+                    self._failed_batches += 1
+                    self._retries += 1
+                logger.error(f"Write-behind flush of {len(rows)} rows failed (attempt {attempt}), "
+                             f"retrying in {delay:.1f}s: {e}")
+                time.sleep(delay)
+                delay = min(self.max_retry_delay, delay * 2)
+                continue
+            self._done(batch, time.perf_counter() - start)
+            return None
+
+    def _done(self, batch, elapsed):
+        with self._lock:
+            self._batches += 1
+            self._flushed += len(batch)
+            self._total_flush += elapsed
+            for key, _ in batch:
+                self._unflushed.pop(key, None)
+
+    def close(self, timeout=30):
+        """Flush everything queued so far and stop the flusher"""
+        self._stopping = True
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            logger.error(f"Write-behind flusher did not finish; {self._queue.qsize()} rows may be lost")
+
+    def get_metrics(self):
+        """Return queue depth, batch and failure counters"""
+        with self._lock:
+            batches = self._batches
+            return {
+                'queued': self._queued,
+                'flushed': self._flushed,
+                'queue_depth': self._queue.qsize(),
+                'batches': batches,
+                'avg_batch_size': round(self._flushed / batches, 2) if batches else 0.0,
+                'avg_flush_ms': round(self._total_flush / batches * 1000, 3) if batches else 0.0,
+                'blocked_puts': self._blocked,
+                'rejected': self._rejected,
+                'failed_batches': self._failed_batches,
+                'retries': self._retries,
+                'dropped': self._dropped,
+            }
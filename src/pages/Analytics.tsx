@@ -2,7 +2,7 @@
 import { useState, useEffect } from "react";
 import { useAuth } from "@/contexts/AuthContext";
 import { useNavigate } from "react-router-dom";
-import { AlertCircle, BarChart3, Users } from "lucide-react";
+import { AlertCircle, BarChart3 } from "lucide-react";
 import DashboardLayout from "@/components/layout/DashboardLayout";
 import { Card, CardContent, CardDescription, CardHeader, CardTitle } from "@/components/ui/card";
 import { BarChart, Bar, XAxis, YAxis, CartesianGrid, Tooltip, ResponsiveContainer } from "recharts";
@@ -187,11 +187,7 @@ const Analytics = () => {
                           {employee.avgStress}% Stress
                         </div>
                       </div>
-                      <div className="flex items-center gap-2 mt-2">
-                        <Users className="h-4 w-4 text-muted-foreground" />
-                        <span className="text-sm text-muted-foreground">{employee.department}</span>
-                      </div>
-                      <p className="text-sm mt-1">
+                      <p className="text-sm mt-2">
                         <span className="font-medium">{employee.highStressRecords}</span> high stress records in the last 30 days
                       </p>
                     </div>
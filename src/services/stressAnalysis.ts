@@ -219,3 +219,47 @@ export const fetchStressHistory = async (token: string, limit: number = 10): Pro
     return [];
   }
 };
+
+export interface StreamFrameResult {
+  seq: number;
+  face: [number, number, number, number] | null;
+  score?: number;
+  level?: "low" | "medium" | "high";
+  dropped: number;
+  ms: number;
+  error?: string;
+}
+
+// Open a live stress stream: send raw JPEG frames as binary messages and
+// receive one compact JSON result per processed frame. The server drops
+// stale frames when they arrive faster than it can score them.
+export const openStressStream = (
+  token: string,
+  onResult: (result: StreamFrameResult) => void,
+  sessionId: string = "webcam"
+) => {
+  const wsUrl = API_BASE_URL.replace(/^http/, "ws");
+  const socket = new WebSocket(
+    `${wsUrl}/api/stress/stream?token=${encodeURIComponent(token)}&session_id=${encodeURIComponent(sessionId)}`
+  );
+  socket.binaryType = "arraybuffer";
+  socket.onmessage = (event) => onResult(JSON.parse(event.data));
+
+  const sendFrame = (canvas: HTMLCanvasElement, quality: number = 0.8) => {
+    if (socket.readyState !== WebSocket.OPEN) return;
+    canvas.toBlob((blob) => {
+      if (blob && socket.readyState === WebSocket.OPEN) {
+        socket.send(blob);
+      }
+    }, "image/jpeg", quality);
+  };
+
+  const close = () => {
+    if (socket.readyState === WebSocket.OPEN) {
+      socket.send("close");
+    }
+    socket.close();
+  };
+
+  return { socket, sendFrame, close };
+};